@@ -1,33 +1,105 @@
-from openai import OpenAI, OpenAIError
+import asyncio
+import os
 
 from rich.rule import Rule
+from rich.text import Text
 
 import readchar
 
 from datetime import datetime
 
-from NewChat import load_recent
+from NewChat import load_recent, recover
+import NewChat
 from SaveScreen import SaveScreen
 import UserSettings
+import StatsScreen
+import TreeScreen
 
 from conversationTree import *
-from Screen import Screen, _clear_terminal, _get_input
-import sys
+from renderCache import CachedMarkdown
+from Screen import Screen, _get_input
+from generationEngine import Generation
+import contextWindow
+import completionCache
+import autoSave
+import chatArchive
+import contentStore
 
 RENDERED_MSGS = 5
+CTRL_FILE = "ctrl.md"
+
+_ctrl_text = None
+
+def _ctrl():
+    """Returns the controls footer as a renderable. The file is only read once."""
+    global _ctrl_text
+    if _ctrl_text is None:
+        with open(CTRL_FILE, "r", encoding="utf-8") as file:
+            _ctrl_text = file.read()
+    return CachedMarkdown(CTRL_FILE, _ctrl_text)
 
 class MainScreen(Screen):
     """The main screen, where conversations with LLMs take place."""
 
     def __init__(self, scr: "Screen" = None):
+        """Constructs the main screen from another one. Without one, or if the other screen holds no chat yet, the most recent chat is loaded in the background while a placeholder is shown."""
+        self.generation = None
+        self.error = None
+        self.unsaved = []
         if not scr:
-            self.cur, self.messages, self.file = load_recent()
+            self.cur, self.messages, self.file, self.tree = None, [], None, None
             self.settings = UserSettings.load_settings()
             self._connect()
         super().__init__(scr)
+        if self.cur is None:
+            self._loading = asyncio.get_running_loop().create_task(self._load())
+        else:
+            autoSave.get_autosaver().schedule(self.tree, self.cur, self.file)
+
+    async def _load(self):
+        """Loads the most recent chat in a worker thread, then draws it. If earlier sessions left unsaved chats behind, recovering them is offered first. If the chat can't be read, a new one is started instead and the error is shown. Afterwards, chats that were inactive for longer than the ArchiveAfterDays setting are moved into the chat archive, except for those that are open or offered for recovery."""
+        try:
+            self.cur, self.messages, self.file, self.tree, self.unsaved = await asyncio.to_thread(load_recent)
+        except (OSError, ValueError, KeyError) as e:
+            self.error = f"Could not load the most recent chat: {e}"
+            self.cur, self.messages, self.file, self.tree = await asyncio.to_thread(NewChat.new_chat)
+            self.unsaved = await asyncio.to_thread(autoSave.unsaved)
+        self.tree.touch(self.cur)
+        self._refresh()
+        days = self.settings.get("ArchiveAfterDays", 0)
+        if days:
+            try:
+                keep = {self.file, *(header['file'] for _, header in self.unsaved)}
+                await asyncio.to_thread(chatArchive.archive_inactive, NewChat.CHATS_PATH, days, keep)
+            except (OSError, ValueError) as e:
+                self.error = f"Could not archive old chats: {e}"
+                self._refresh()
+
+    async def _recover(self):
+        """Loads the first unsaved chat offered for recovery in a worker thread, and makes it the open chat."""
+        path = self.unsaved.pop(0)[0]
+        try:
+            self.cur, self.messages, self.file, self.tree = await asyncio.to_thread(recover, path)
+            self.tree.touch(self.cur)
+            self.unsaved = []
+        except (OSError, ValueError) as e:
+            self.error = f"Could not recover the chat: {e}"
+        self._refresh()
+        return self
+
+    async def _discard(self):
+        """Deletes the first unsaved chat offered for recovery in a worker thread."""
+        path = self.unsaved.pop(0)[0]
+        await asyncio.to_thread(autoSave.discard, path)
+        self._refresh()
+        return self
     
     def _update_renderables(self, ctrl: bool = True):
-        num_msgs = RENDERED_MSGS
+        if self.cur is None:
+            self.renderables = [Text("Loading chat...", style="bold blue"), Rule(style="bold white")]
+            return
+        pending = self.generation and self.generation.parent is self.cur
+        num_msgs = RENDERED_MSGS - 1 if pending else RENDERED_MSGS
         cur_it = self.cur
         renderables = []
         while num_msgs and cur_it:
@@ -36,103 +108,188 @@ class MainScreen(Screen):
             cur_it = cur_it.prev
             num_msgs -= 1
         renderables.reverse()
-        renderables.append(Rule(style="bold white"))
+        if pending:
+            n = len(self.generation.renderers)
+            label = f"generating {n} alternatives..." if n > 1 else "generating..."
+            header = Text(f"{label} | ESC to cancel", style="bold red", justify="center")
+            renderables.append(Group(Rule(header, style="bold red"), self.generation.renderable()))
+        if self.error:
+            renderables.append(Text(self.error, style="bold red"))
+        autosave_error = autoSave.get_autosaver().error
+        if autosave_error:
+            renderables.append(Text(autosave_error, style="bold red"))
+        if self.unsaved:
+            header = self.unsaved[0][1]
+            name = os.path.basename(header['file']).split('.')[0] if header['file'] else "a new chat"
+            renderables.append(Text(f"Found {header['messages']} unsaved messages of {name}, autosaved {header['time']}. Press 'r' to recover them, or 'x' to discard them.", style="bold yellow"))
+        renderables.append(self._context_rule())
         if ctrl:
-            with open("ctrl.md", "r", encoding="utf-8") as file:
-                renderables.append(Markdown(file.read()))
+            renderables.append(_ctrl())
             renderables.append(Rule(style="bold white"))
         self.renderables = renderables
 
-    def _generate(self):
-        """Stream in a response via the chosen API. This does multiple things:
-        - Send a request to the API.
-        - Print tokens as the stream in.
-        - If there is an error: Print that instead.
-        - Convert the streamed content to a message node placed in the conversation tree, and properly render markdown once finished."""
-        try:
-            stream = self.client.chat.completions.create(
-                model=self.settings['Model'],
-                messages = self.messages,
-                stream = True,
-                temperature = self.settings['Temperature'],
-                frequency_penalty = self.settings['FrequencyPenalty'],
-                presence_penalty = self.settings['PresencePenalty']
-            )
-
-            buffer = ""
-
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    content = chunk.choices[0].delta.content
-                    sys.stdout.write(content)
-                    sys.stdout.flush()
-                    buffer += content
-        
-        except OpenAIError as e:
-            buffer = str(e)
+    def _context_rule(self):
+        """Returns a rule showing how many tokens the current branch takes up, out of the budget a request may use."""
+        used = contextWindow.path_tokens(self.cur)
+        limit = contextWindow.budget(self.settings)
+        label = f"Context: {used}/{limit} tokens"
+        style = "bold white"
+        if used > limit:
+            label += " | oldest turns are dropped" if self.settings.get("Truncation") != "none" else " | too long"
+            style = "bold yellow"
+        return Rule(Text(label, style=style), style="bold white")
+
+    def _generate(self, n: int = 1):
+        """Start streaming in n responses via the chosen API, as background tasks running concurrently. This does multiple things:
+        - Send a request to the API, with as much of the current branch as fits into the context window (see contextWindow.build_context). If the completion cache is on and holds a reply to the same request, that is replayed instead.
+        - Show the response as markdown while it streams in, updated at a fixed frame rate. Navigating the tree keeps working meanwhile, and ESC cancels the request.
+        - If there is an error: Show it below the conversation; It is not stored in the tree.
+        - Convert the streamed content to message nodes placed in the conversation tree as siblings (see _generated)."""
+        limit = contextWindow.budget(self.settings)
+        messages, dropped = contextWindow.build_context(self.cur, self.messages, limit, self.settings.get("Truncation", "oldest"))
+        cache = completionCache.get_cache(self.settings)
+        key = completionCache.request_key(self.settings, self.cur, messages, dropped) if cache else None
+        self.error = None
+        self.generation = Generation(self.client, self.settings, self.cur, list(messages), self.console, self._refresh, self._generated, n, cache, key)
+
+    def _generated(self, generation: Generation):
+        """Called once all responses are complete or cancelled. If the user still looks at the message they answer, move on to the response that finished first."""
+        self.generation = None
+        if generation.errors:
+            self.error = generation.errors[0]
+        for node in generation.nodes:
+            self.tree.add(node)
+        if generation.node and self.cur is generation.parent:
+            self._move(generation.node)
+        self._refresh()
+
+    def _move(self, node: Msg_Node):
+        """Makes node, a child or sibling of the current message, the current one."""
+        node.ensure_loaded()
+        if node.prev is not self.cur:
+            self.messages.pop()
+        self.messages.append(node.to_msg())
+        self.cur = node
+        self.tree.touch(node)
 
-        gen_msg = Msg_Node(self.cur, "assistant", buffer, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), len(self.messages))
-        self.cur = gen_msg
-        self.messages.append(gen_msg.to_msg())
+    def _goto(self, node: Msg_Node):
+        """Jumps to any node of the tree. The messages of the current branch are rebuilt from the tree index."""
+        if node is None or node is self.cur:
+            return
+        self.cur = node
+        self.messages = [it.to_msg() for it in self.tree.path(node)]
+        self.tree.touch(node)
 
+    def _find(self):
+        """Asks for a message ID, or the start of one, and jumps to that message."""
+        input = _get_input(prompt_text="Go to message ID: ")
+        node = self.tree.find(input.strip()) if input else None
+        if input and node is None:
+            self.error = f"No single message ID starts with '{input.strip()}'"
+        self._goto(node)
+        self._refresh()
+
+    def _refresh(self):
+        autoSave.get_autosaver().schedule(self.tree, self.cur, self.file)
+        self._update_renderables()
+        self._render()
 
     def handle_input(self, key):
 
-        if key == 'q':
+        if self.cur is None:
+            return None if key == 'q' else self
+
+        elif self.unsaved:
+            if key == 'r':
+                return self._recover()
+            elif key == 'x':
+                return self._discard()
+            return None if key == 'q' else self
+
+        elif key == readchar.key.ESC:
+            if self.generation:
+                self.generation.cancel()
+
+        elif key == 'q':
+            if self.generation:
+                self.generation.cancel()
             return SaveScreen(self, cont=False)
 
         elif key == 'c':
+            if self.generation:
+                self.generation.cancel()
             return SaveScreen(self)
 
+        elif self.generation and key in ('e', 's', 'a', 'i', 'g', 't', readchar.key.ENTER):
+            return self
+
         elif key == 'e':
             self._edit()
         
         elif key == 's':
             return UserSettings.SettingsScreen(self)
+
+        elif key == 'i':
+            return StatsScreen.StatsScreen(self)
+
+        elif key == 't':
+            return TreeScreen.TreeScreen(self)
+
+        elif key == 'g':
+            self._find()
+
+        elif key == 'l':
+            self._goto(self.tree.recent_leaf(exclude=self.cur))
+            self._refresh()
+
+        elif key == 'b':
+            self._goto(self.tree.split_point(self.cur))
+            self._refresh()
+
+        elif key == 'p':
+            self.cur.pinned = not self.cur.pinned
+            autoSave.get_autosaver().schedule(self.tree, self.cur, self.file, force=True)
+            self._refresh()
+
+        elif key == 'a':
+            if self.cur.role == "assistant":
+                self.cur = self.cur.prev
+                self.messages.pop()
+            self._generate(self.settings.get("Alternatives", UserSettings.SettingsScreen.default["Alternatives"]))
+            self._refresh()
             
 
         elif key == readchar.key.UP:
             if self.cur.prev:
                 self.cur = self.cur.prev
                 self.messages.pop()
-                self._update_renderables()
-                self._render()
+                self._refresh()
 
         elif key == readchar.key.DOWN:
             if self.cur.next:
-                self.cur=self.cur.next[0]
-                self.messages.append(self.cur.to_msg())
-                self._update_renderables()
-                self._render()
+                self._move(self.cur.visited or self.cur.next[0])
+                self._refresh()
 
         elif key == readchar.key.RIGHT:
             if self.cur.prev:
                 sib = self.cur.prev.next
                 id = self.cur.index-1
                 if id+1 < len(sib):
-                    self.cur = sib[id+1]
-                    self.messages.pop()
-                    self.messages.append(self.cur.to_msg())
-                    self._update_renderables()
-                    self._render()
-                else:
+                    self._move(sib[id+1])
+                    self._refresh()
+                elif not self.generation:
                     self.cur = self.cur.prev
                     self.messages.pop()
-                    _clear_terminal()
                     self._generate()
-                    self._update_renderables()
-                    self._render()
+                    self._refresh()
 
 
         elif key == readchar.key.LEFT:
             if self.cur.prev:
                 sib = self.cur.prev.next
                 id = self.cur.index-1
-                self.cur = sib[max(0, id-1)]
-                self.messages.pop()
-                self.messages.append(self.cur.to_msg())
-                self._update_renderables()
-                self._render()
+                self._move(sib[max(0, id-1)])
+                self._refresh()
 
         elif key == readchar.key.ENTER:
             self._type_msg()
@@ -140,23 +297,19 @@ class MainScreen(Screen):
         return self
 
     def _edit(self):
-        """Lets users edit the current message. If they press escape, restore the previous state. If the edited message was one of theirs, also generate a response."""
+        """Lets users edit the current message. If they press escape, restore the previous state. If the edited message was one of theirs, also generate a response. The edit becomes a new sibling, which keeps just its changes if that is much smaller than a copy of the text."""
         if self.cur.prev:
             prev_text = self.cur.content
             input = _get_input(default=prev_text)
             if input == None:
                 self._render()
                 return
-            edited=Msg_Node(self.cur.prev, self.cur.role, input, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), self.cur.depth)
-            self.cur=edited
-            self.messages.pop()
-            self.messages.append(self.cur.to_msg())
+            edited=Msg_Node(self.cur.prev, self.cur.role, contentStore.delta(self.cur, input), datetime.now().strftime("%Y-%m-%d %H:%M:%S"), self.cur.depth)
+            self.tree.add(edited)
+            self._move(edited)
             if self.cur.role=="user":
                 self._generate()
-                self._update_renderables()
-                self._render()
-            else:
-                self.render_cur()
+            self._refresh()
     
     def _type_msg(self):
         """Lets users type a new message, stores it in the conversation tree, and generates a response."""
@@ -165,10 +318,9 @@ class MainScreen(Screen):
             self._render()
             return
         usr_msg = Msg_Node(self.cur, "user", input, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), len(self.messages))
-        self.cur = usr_msg
-        self.messages.append(usr_msg.to_msg())
+        self.tree.add(usr_msg)
+        self._move(usr_msg)
         self._generate()
-        self._update_renderables()
-        self._render()
+        self._refresh()
 
 
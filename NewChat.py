@@ -1,12 +1,17 @@
+import asyncio
 from datetime import datetime
 import os
 import glob
+import heapq
 import json
 import readchar
 from Screen import Screen
 import MainScreen
-
-from rich.table import Table
+import SearchScreen
+import chatJournal
+import chatCatalog
+import chatArchive
+import autoSave
 
 from conversationTree import *
 
@@ -19,49 +24,107 @@ def _file_name(file: str):
     return name.split('.')[0]
 
 def load_recent():
-    """Load the most recent saved chat, or start a new one if no chat files exist.
+    """Load the most recent saved chat, or start a new one if no chat files exist. Also looks for chats that earlier sessions autosaved but never saved, so they can be offered for recovery.
     
     Returns:
     - The current message node from last session, needed to exactly reconstruct its state.
     - A list containing all messages in the current branch, starting at the root.
-    - The file that was loaded (None if there wasn't any)."""
-    files = _load_chat_files()
-    if not files:
+    - The file that was loaded (None if there wasn't any).
+    - The TreeIndex of the chat.
+    - The unsaved chats that can be recovered, see autoSave.unsaved."""
+    unsaved = autoSave.unsaved()
+    file = chatCatalog.get_catalog(CHATS_PATH).most_recent()
+    if not file:
+        return (*new_chat(), unsaved)
+    cur, messages, tree = load_file(file)
+    return cur, messages, file, tree, unsaved
+
+def new_chat():
+    """Starts a new chat with the standard assistant prompt, or with an empty system prompt if that can't be read.
+
+    Returns:
+    - The root, which is the current message.
+    - A list holding the root's message.
+    - None, as the chat has no file yet.
+    - The TreeIndex of the chat."""
+    try:
         with open(PROMPTS_PATH + "/standardAssistant.txt", "r", encoding="utf-8") as file:
-                prompt = file.read()
-        root = Msg_Node(None, "system", prompt, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 0)
-        msgs = [root.to_msg()]
-        return root, msgs, None
-    file = max(files, key = os.path.getmtime)
-    cur, messages = load_file(file)
-    return cur, messages, file
+            prompt = file.read()
+    except OSError:
+        prompt = ""
+    root = Msg_Node(None, "system", prompt, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 0)
+    return root, [root.to_msg()], None, _new_tree(root)
+
+def _new_tree(root: Msg_Node):
+    """Returns a TreeIndex for a new chat, which only has its root."""
+    tree = TreeIndex()
+    tree.add(root)
+    return tree
 
-def load_file(file: str):
-    """Loads a given chat file.
+def load_file(file: str, cur_id: str = None):
+    """Loads a given chat file, either an append-only journal or a legacy .json chat. Archived chats are read from their pack, see chatArchive.
 
     Args:
     file: Path to the file that will be read.
+    cur_id: Optional ID of the message to make current, instead of the one stored in the file.
     
     Returns:
     - The current message from when the chat was last saved.
     - A list holding all messages in the current conversation branch, starting at the root.
+    - The TreeIndex of the chat.
     """
-    with open(file, 'r') as f:
-        data = json.load(f)
-    messages = []
-    root, cur = deserialize(data['messages'], data['cur_id'])
+    tree = TreeIndex()
+    if chatArchive.is_archived(file):
+        root, cur = chatArchive.read_tree(file, cur_id, tree)
+    else:
+        root, cur = chatJournal.read_tree(file, cur_id, lazy=True, index=tree)
     if not cur:
-        return root, [root.to_msg()]
-    cur_it = cur
-    while cur_it:
-        messages.append(cur_it.to_msg())
-        cur_it=cur_it.prev
-    messages.reverse()
-    return cur, messages
+        return root, [root.to_msg()], tree
+    return cur, [node.to_msg() for node in tree.path(cur)], tree
+
+def recover(path: str):
+    """Loads a chat an earlier session autosaved but never saved (see autoSave), and makes its scratch file this session's own. If the chat has a journal, the unsaved messages are added to the journal's tree, and changed pins applied to it; Otherwise the scratch file holds the whole chat.
+
+    Args:
+    path: The scratch file.
+
+    Returns:
+    - The current message, as it was when the chat was autosaved.
+    - A list holding all messages in the current conversation branch, starting at the root.
+    - The chat's file, or None if it was never saved.
+    - The TreeIndex of the chat.
+    Raises OSError if the chat's journal is gone."""
+    header, records = autoSave.read(path)
+    file = header['file'] and (chatArchive.locate(header['file']) or header['file'])
+    cur_id = next((record['id'] for record in reversed(records) if record['op'] == 'cur'), None)
+    if file and chatJournal.is_journal(file):
+        cur, messages, tree = load_file(file)
+        for record in records:
+            if record['op'] == 'pin':
+                node = tree.get(record['id'])
+                if node:
+                    node.pinned = record['pinned']
+            if record['op'] != 'node' or tree.get(record['id']):
+                continue
+            prev = tree.get(record['prev'])
+            if prev:
+                tree.add(chatJournal._from_record(record, prev))
+        cur = tree.get(cur_id) or cur
+    else:
+        tree = TreeIndex()
+        cur = chatJournal.replay(records, cur_id, tree)[1]
+        if file and not os.path.exists(file) and not chatArchive.exists(file):
+            file = None
+    autoSave.get_autosaver().adopt(path)
+    return cur, [node.to_msg() for node in tree.path(cur)], file, tree
 
 def _load_chat_files():
-    """Returns a list of paths for all saved chat files."""
-    return glob.glob(os.path.join(CHATS_PATH, '*.json'))
+    """Returns a list of paths for all saved chat files, loose and archived, the most recent first. The list comes from the chat catalog and the archive's index, so no file is opened unless it changed."""
+    catalog = chatCatalog.get_catalog(CHATS_PATH)
+    archive = chatArchive.get_archive(CHATS_PATH)
+    loose = ((catalog.chats[name]['mtime'], os.path.join(CHATS_PATH, name)) for name in catalog.ordered())
+    archived = ((archive.entries[name]['meta']['mtime'], os.path.join(archive.path, name)) for name in archive.ordered())
+    return [path for _, path in heapq.merge(loose, archived, key=lambda item: item[0], reverse=True)]
 
 def _load_prompt_files():
     """Returns a list of paths for all saved system prompt files."""
@@ -69,24 +132,28 @@ def _load_prompt_files():
 
 
 class ChatLoader(Screen):
-    """This screen implements loading and starting new chats."""
+    """This screen implements loading and starting new chats. Only the page of the table that fits the terminal is built, so long chat lists stay responsive."""
 
     def __init__(self, scr:"Screen"):
         self.files = _load_chat_files()
         self.mode = 'Load' if self.files else 'New'
         self.files = self.files if self.files else _load_prompt_files()
         self.index = 0
+        self.error = None
         super().__init__(scr)
 
     
     def _update_renderables(self):
+        from rich.markdown import Markdown
         if self.mode == 'Load':
-            table = self._gen_table(_load_chat_files())
+            table = self._gen_table(self.files, chatCatalog.get_catalog(CHATS_PATH).chats)
             self.renderables = [table, Rule(style='bold white')]
-            self.renderables.append(Markdown("Select chat to load, or press 'n' to start new chat."))
+            if self.error:
+                self.renderables.append(Text(self.error, style="bold red"))
+            self.renderables.append(Markdown("Select chat to load, press 'n' to start new chat, 'f' to search all chats, or 'a' to archive (or unarchive) the selected chat."))
         
         elif self.mode == 'New':
-            table = self._gen_table(_load_prompt_files())
+            table = self._gen_table(self.files)
             self.renderables = [table, Rule(style='bold white')]
             self.renderables.append(Markdown('Select system prompt for new chat.'))
     
@@ -95,28 +162,40 @@ class ChatLoader(Screen):
             self.index=max(0, self.index-1)
 
         elif key == readchar.key.DOWN:
-            self.index = min(len(self.files), self.index+1)
+            self.index = min(len(self.files)-1, self.index+1)
+        elif key == readchar.key.PAGE_UP:
+            self.index = max(0, self.index-self._page_size())
+        elif key == readchar.key.PAGE_DOWN:
+            self.index = min(len(self.files)-1, self.index+self._page_size())
         elif key == readchar.key.ENTER:
             return self._sel_file()
+        elif key == 'f' and self.mode == 'Load':
+            return SearchScreen.SearchScreen(self)
+        elif key == 'a' and self.mode == 'Load':
+            return self._toggle_archive()
         elif key == 'n' and self.mode == 'Load':
             self.mode = 'New'
+            self.files = _load_prompt_files()
             self.index = 0
         elif key == readchar.key.ESC and self.mode=='New':
-            self.mode = 'Load'
-            self.index = 0
+            files = _load_chat_files()
+            if files:
+                self.mode = 'Load'
+                self.files = files
+                self.index = 0
         
         self._update_renderables()
         self._render()
         return self
 
-    def _sel_file(self):
-        """Lets users select a file; Either a chat or a prompt.
+    async def _sel_file(self):
+        """Lets users select a file; Either a chat or a prompt. Chats are read in a worker thread, so the event loop is never blocked by disk I/O.
 
         Returns:
         A Main Screen, ready to go for chatting."""
         if self.mode == 'Load':
             self.file = self.files[self.index]
-            self.cur, self.messages = load_file(self.file)
+            self.cur, self.messages, self.tree = await asyncio.to_thread(load_file, self.file)
             return MainScreen.MainScreen(self)
         elif self.mode == 'New':
             with open(self.files[self.index], "r", encoding="utf-8") as file:
@@ -124,11 +203,31 @@ class ChatLoader(Screen):
             root = Msg_Node(None, "system", prompt, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 0)
             self.messages = [root.to_msg()]
             self.cur = root
+            self.tree = _new_tree(root)
             self.file = None
             return MainScreen.MainScreen(self)
 
 
 
+    async def _toggle_archive(self):
+        """Moves the selected chat into the chat archive, or an archived one back out, in a worker thread. The selection stays on the chat."""
+        file = self.files[self.index]
+        self.error = None
+        try:
+            if chatArchive.is_archived(file):
+                moved = await asyncio.to_thread(chatArchive.unarchive, file)
+            else:
+                await asyncio.to_thread(chatArchive.archive, file)
+                moved = os.path.join(chatArchive.get_archive(CHATS_PATH).path, os.path.basename(file))
+        except (OSError, ValueError) as e:
+            self.error = f"Could not move the chat: {e}"
+            moved = file
+        self.files = _load_chat_files()
+        self.index = self.files.index(moved) if moved in self.files else min(self.index, len(self.files) - 1)
+        self._update_renderables()
+        self._render()
+        return self
+
     def create_empty_json(self):
         """Creates an empty .json file in the chats directory, with the current time as its name."""
         time = datetime.now()
@@ -139,15 +238,40 @@ class ChatLoader(Screen):
             json.dump({}, f, indent = 4)
 
 
-    def _gen_table(self, files):
-        """Returns a table showing a list of files and marking the one currently selected by the user."""
-        table = Table(show_header=False, show_lines=True)
+    def _page_size(self):
+        """Returns how many table rows fit on the terminal at once, every row takes two lines including its separator."""
+        return max(1, (self.console.size.height - 8) // 2)
+
+    def _gen_table(self, files, meta: dict = None):
+        """Returns a table showing the page of files around the one currently selected by the user, and marks the selected one.
+
+        Args:
+        files: Paths of all files that can be selected.
+        meta: Optional catalog entries by file name, used to show details about chats. Archived chats bring their own."""
+        from rich.table import Table
+        page_size = self._page_size()
+        page = self.index // page_size
+        pages = max(1, -(-len(files) // page_size))
+        table = Table(show_header=meta is not None, show_lines=True, caption=f"Page {page+1}/{pages}" if pages > 1 else None)
         table.add_column('File', style="bold cyan")
+        if meta is not None:
+            table.add_column('Modified', no_wrap=True)
+            table.add_column('Nodes', justify="right")
+            table.add_column('Model')
+            table.add_column('Last Message', overflow="ellipsis", no_wrap=True)
 
-        for i in range(0, len(files)):
+        for i in range(page * page_size, min(len(files), (page + 1) * page_size)):
+            row = [_file_name(files[i])]
+            if meta is not None:
+                if chatArchive.is_archived(files[i]):
+                    entry = chatArchive.get_archive(CHATS_PATH).entries.get(os.path.basename(files[i]), {}).get('meta', {})
+                    row[0] += " (archived)"
+                else:
+                    entry = meta.get(os.path.basename(files[i]), {})
+                modified = datetime.fromtimestamp(entry['mtime']).strftime("%Y-%m-%d %H:%M") if 'mtime' in entry else ""
+                row += [modified, str(entry.get('nodes', "")), entry.get('model', ""), entry.get('preview', "")]
             if i==self.index:
-                table.add_row(_file_name(files[i]), style="on blue")
-            else: table.add_row(_file_name(files[i]))
+                table.add_row(*row, style="on blue")
+            else: table.add_row(*row)
 
         return table
-
@@ -1,7 +1,12 @@
-import json
+import asyncio
 import os
 
 import readchar
+import autoSave
+import chatArchive
+import chatJournal
+import chatCatalog
+import searchIndex
 from NewChat import CHATS_PATH, ChatLoader
 from Screen import Screen, _clear_terminal, _get_input
 from datetime import datetime
@@ -19,20 +24,17 @@ class SaveScreen(Screen):
         if key == 'y' or key == readchar.key.ENTER:
             return self.save()
         elif key == 'n':
+            autoSave.get_autosaver().clear()
             return ChatLoader(self) if self.continue_after else None
+        return self
         
-    def save(self):
-        """Converts the current chat into a dictionary and stores it to disk. If the chat was loaded from a file, it is updated; Otherwise, ask user for a name for a new file."""
-        root = self.cur
-        root2 = root
-        while root:
-            root2 = root
-            root = root.prev
-        chat = root2.serialize(self.cur)
-        
+    async def save(self):
+        """Stores the current chat to disk. Chats are kept as append-only journals, so only messages that are not yet on disk (and a changed current message) get written. If the chat was loaded from a legacy .json file, it is converted to a journal; If it was never saved, ask user for a name for a new file. The writing itself happens in a worker thread, so the event loop is never blocked by disk I/O. Once saved, the chat's autosaved scratch file is no longer needed."""
+        root2 = self.tree.root
+
         if self.file:
-            with open(self.file, 'w') as f:
-                json.dump(chat, f, indent=4)
+            await asyncio.to_thread(self._write, root2)
+            autoSave.get_autosaver().clear()
             return ChatLoader(self) if self.continue_after else None
         else:
             _clear_terminal()
@@ -40,11 +42,35 @@ class SaveScreen(Screen):
             name = time.strftime("%Y-%m-%d_%H-%M-%S")
             input = _get_input(prompt_text="Name for chat file: ", default= name)
             if input:
-                path = os.path.join(CHATS_PATH, (input + '.json'))
-                with open(path, 'w') as f:
-                    json.dump(chat, f, indent=4)
+                self.file = os.path.join(CHATS_PATH, (input + chatJournal.JOURNAL_EXT))
+                await asyncio.to_thread(self._write, root2, True)
+                autoSave.get_autosaver().clear()
                 return ChatLoader(self) if self.continue_after else None
             else:
                 self._update_renderables()
                 self._render()
                 return self
+
+    def _write(self, root: "Msg_Node", new: bool = False):
+        """Writes the chat to self.file and updates its chat catalog entry and the search index. An archived chat is moved out of the archive first.
+
+        Args:
+        root: The root of the conversation tree.
+        new: Whether to start a new file, replacing whatever is there."""
+        legacy = None
+        if not new and chatArchive.is_archived(self.file):
+            self.file = chatArchive.unarchive(self.file)
+        if new:
+            journal = chatJournal.create(self.file)
+        elif chatJournal.is_journal(self.file):
+            journal = chatJournal.get_journal(self.file)
+        else:
+            legacy = self.file
+            self.file = chatJournal.journal_path(legacy)
+            journal = chatJournal.create(self.file)
+        added = journal.append(root, self.cur)
+        if legacy:
+            os.remove(legacy)
+        catalog = chatCatalog.get_catalog(CHATS_PATH)
+        catalog.update(self.file, len(journal.written), self.cur, self.settings['Model'], legacy, added, new or legacy is not None)
+        searchIndex.get_index(CHATS_PATH).update(self.file, added, root, legacy, new or legacy is not None)
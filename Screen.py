@@ -1,26 +1,35 @@
-import os
-from openai import OpenAI
-from prompt_toolkit import prompt
+import apiClient
 from rich.console import Console
-from prompt_toolkit.key_binding import KeyBindings
+
+import keyInput
+from terminalRenderer import RENDERER
 
 def _clear_terminal():
-    """Reset and clear the current terminal."""
-    os.system('cls' if os.name == 'nt' else 'printf "\033[2J\033[3J\033[H"')
+    """Reset and clear the current terminal. The next frame will be drawn in full."""
+    RENDERER.clear()
+
+bindings = None
+
+def _bindings():
+    """Returns the prompt's custom key bindings. prompt_toolkit is only imported once a prompt is opened, as it noticeably slows down startup."""
+    global bindings
+    if bindings is None:
+        from prompt_toolkit.key_binding import KeyBindings
+        bindings = KeyBindings()
 
-bindings = KeyBindings()
-@bindings.add('enter')
-def _(event):
-    event.current_buffer.validate_and_handle()
+        @bindings.add('enter')
+        def _(event):
+            event.current_buffer.validate_and_handle()
 
-@bindings.add('escape')
-def _(event):
-    event.current_buffer.reset()
-    event.app.exit(result = None)
+        @bindings.add('escape')
+        def _(event):
+            event.current_buffer.reset()
+            event.app.exit(result = None)
+    return bindings
 
 
 def _get_input(prompt_text: str = "> ", default: str = ""):
-    """Get user input, a custom prompt and prefill can be provided. Note: this uses custom key binds.
+    """Get user input, a custom prompt and prefill can be provided. Note: this uses custom key binds. A frame held back (see FrameRenderer.hold) is drawn first, the key reader is paused while the prompt is open, and the prompt runs in its own thread so it works inside the running event loop.
     
     Args:
     prompt_text: Text to display in front of user input, for example a question
@@ -33,7 +42,12 @@ def _get_input(prompt_text: str = "> ", default: str = ""):
     >>> response = _get_input(prompt_text = "Enter name: ", default = "Name")
     Enter name: Name_
     """
-    user_input = prompt(prompt_text, key_bindings=bindings, default=default)
+    from prompt_toolkit import prompt
+    keys = _bindings()
+    RENDERER.flush()
+    with keyInput.paused():
+        user_input = prompt(prompt_text, key_bindings=keys, default=default, in_thread=True)
+    RENDERER.invalidate()
     return user_input
 
 class Screen():
@@ -48,6 +62,7 @@ class Screen():
             self.settings = scr.settings
             self.console = scr.console
             self.file = scr.file
+            self.tree = scr.tree
             self.client = scr.client
         else:
             self.console = Console()
@@ -66,23 +81,20 @@ class Screen():
         key: The key press, as a string; uses readchar constants for special keys like UP.
         
         Returns: 
-        A screen that results from the key press. Either self, if we stay on the same screen, or another screen object, for example after opening a menu.
+        A screen that results from the key press. Either self, if we stay on the same screen, or another screen object, for example after opening a menu. Handlers that need to wait for disk I/O may instead return a coroutine resolving to the screen.
         """
         return self
     
     def _render(self):
-        """Clear the current terminal, then print this screen's renderables from top to bottom."""
-        _clear_terminal()
-        for renderable in self.renderables:
-            self.console.print(renderable)
+        """Draw this screen's renderables from top to bottom. Only the lines that differ from the previous frame are rewritten."""
+        RENDERER.draw(self.console, self.renderables)
     
     def _connect(self):
-        """(Re-) Connect to an OpenAI-compatible API. If there already is an open connection, close it if needed.
+        """(Re-) Connect to an OpenAI-compatible API, if the key or URL changed. All clients share one pooled HTTP client (see apiClient), and the connection is warmed up in the background. Must be called while the event loop is running.
         """
-        if hasattr(self, "client"):
-            new_key = str(self.client.api_key) != self.settings['ApiKey']
-            new_url = str(self.client.base_url) != self.settings['URL']
+        if getattr(self, "client", None):
+            new_key = self.client.api_key != self.settings['ApiKey']
+            new_url = self.client.base_url != self.settings['URL']
             if new_key or new_url:
-                self.client.close()
-                self.client = OpenAI(api_key=self.settings['ApiKey'], base_url=self.settings['URL'])
-        else: self.client = OpenAI(api_key=self.settings['ApiKey'], base_url=self.settings['URL'])
+                self.client = apiClient.ApiClient(self.settings['ApiKey'], self.settings['URL'])
+        else: self.client = apiClient.ApiClient(self.settings['ApiKey'], self.settings['URL'])
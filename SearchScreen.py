@@ -0,0 +1,114 @@
+import asyncio
+import os
+import time
+
+import readchar
+
+from rich.rule import Rule
+from rich.text import Text
+
+import MainScreen
+import NewChat
+import searchIndex
+from Screen import Screen
+
+
+class SearchScreen(Screen):
+    """Searches the messages of all saved chats, using the search index. Results update with every key typed; Opening one loads its chat right at the matching message. The index is loaded and brought up to date in a worker thread while the screen is shown."""
+
+    def __init__(self, scr: "Screen"):
+        self.query = ""
+        self.results = []
+        self.total = 0
+        self.elapsed = 0
+        self.selected = 0
+        self.search_index = None
+        super().__init__(scr)
+        self._loading = asyncio.get_running_loop().create_task(self._load())
+
+    async def _load(self):
+        """Brings the search index up to date in a worker thread, then runs the query typed so far. The task is cancelled if the screen is left before that, so it never draws over the next screen."""
+        index = searchIndex.get_index(NewChat.CHATS_PATH)
+        await asyncio.to_thread(index.refresh)
+        self.search_index = index
+        self._search()
+        self._update_renderables()
+        self._render()
+
+    def _search(self):
+        """Runs the current query, and remembers how long it took."""
+        start = time.perf_counter()
+        self.results, self.total = self.search_index.search(self.query)
+        self.elapsed = time.perf_counter() - start
+        self.selected = 0
+
+    def _page_size(self):
+        """Returns how many result rows fit on the terminal at once, every row takes two lines including its separator."""
+        return max(1, (self.console.size.height - 10) // 2)
+
+    def _table(self):
+        """Returns a table showing the page of results around the selected one."""
+        from rich.table import Table
+        page_size = self._page_size()
+        page = self.selected // page_size
+        pages = max(1, -(-len(self.results) // page_size))
+        table = Table(show_lines=True, caption=f"Page {page+1}/{pages}" if pages > 1 else None)
+        table.add_column('Chat', style="bold cyan")
+        table.add_column('Time', no_wrap=True)
+        table.add_column('Role')
+        table.add_column('Message', overflow="ellipsis", no_wrap=True)
+        for i in range(page * page_size, min(len(self.results), (page + 1) * page_size)):
+            name, _, role, sent, preview = self.results[i]
+            table.add_row(os.path.basename(name).split('.')[0], sent, role, preview, style="on blue" if i == self.selected else None)
+        return table
+
+    def _update_renderables(self):
+        from rich.markdown import Markdown
+        self.renderables = [Text(f"Search: {self.query}", style="bold green")]
+        if self.search_index is None:
+            self.renderables.append(Text("Indexing chats...", style="bold blue"))
+        elif self.query:
+            shown = f", showing {len(self.results)}" if len(self.results) < self.total else ""
+            self.renderables.append(Text(f"{self.total} matches{shown} ({self.elapsed * 1000:.1f} ms)", style="bold white"))
+            self.renderables.append(self._table())
+        self.renderables.append(Rule(style="bold white"))
+        self.renderables.append(Markdown("Type to search all saved chats, UP/DOWN to select a message, ENTER to open its chat there, ESC to return."))
+
+    def handle_input(self, key):
+        query = self.query
+        if key == readchar.key.ESC:
+            self._loading.cancel()
+            return NewChat.ChatLoader(self)
+        elif key == readchar.key.ENTER:
+            if self.results:
+                return self._open()
+        elif key == readchar.key.UP:
+            self.selected = max(0, self.selected - 1)
+        elif key == readchar.key.DOWN:
+            self.selected = max(0, min(len(self.results) - 1, self.selected + 1))
+        elif key == readchar.key.PAGE_UP:
+            self.selected = max(0, self.selected - self._page_size())
+        elif key == readchar.key.PAGE_DOWN:
+            self.selected = max(0, min(len(self.results) - 1, self.selected + self._page_size()))
+        elif key == readchar.key.BACKSPACE:
+            query = query[:-1]
+        elif len(key) == 1 and key.isprintable():
+            query += key
+        if query != self.query:
+            self.query = query
+            if self.search_index:
+                self._search()
+        self._update_renderables()
+        self._render()
+        return self
+
+    async def _open(self):
+        """Loads the chat of the selected result in a worker thread, with the matching message as the current one.
+
+        Returns:
+        A Main Screen, ready to go for chatting."""
+        name, id = self.results[self.selected][:2]
+        self.file = os.path.join(NewChat.CHATS_PATH, name)
+        self.cur, self.messages, self.tree = await asyncio.to_thread(NewChat.load_file, self.file, id)
+        self.tree.touch(self.cur)
+        return MainScreen.MainScreen(self)
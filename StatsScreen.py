@@ -0,0 +1,87 @@
+import os
+
+import readchar
+
+from rich.rule import Rule
+
+import MainScreen
+import autoSave
+import chatArchive
+import chatCatalog
+import chatJournal
+import requestStats
+from NewChat import CHATS_PATH
+from Screen import Screen
+
+RECENT_CHATS = 10
+
+
+def _chat_usage(tree, file: str, catalog):
+    """Returns the per model stats of the open chat, without reading anything from disk: For a saved journal, what is on disk comes from its catalog entry, and only the messages that are not saved yet are summed up here. Any other chat was read completely when it was opened."""
+    if file and chatJournal.is_journal(file) and not chatArchive.is_archived(file) and os.path.exists(file):
+        usage = requestStats.merge({}, catalog.chats.get(os.path.basename(file), {}).get('usage', {}))
+        return requestStats.merge(usage, requestStats.aggregate(autoSave._changes(tree, file)[0]))
+    return requestStats.aggregate(chatCatalog.iter_nodes(tree.root))
+
+
+def _add_row(table, name: str, totals: dict):
+    ttft, speed, hit_rate = requestStats.summary(totals)
+    table.add_row(
+        name,
+        str(totals['requests']),
+        str(totals['prompt_tokens']),
+        str(totals['completion_tokens']),
+        f"{hit_rate:.0%}",
+        f"{ttft:.2f}s",
+        f"{speed:.1f}",
+    )
+
+
+def _table(title: str, first: str):
+    from rich.table import Table
+    table = Table(title=title, show_lines=True)
+    table.add_column(first, style="bold cyan")
+    for column in ("Requests", "Prompt", "Completion", "Cache Hits", "First Chunk", "Tokens/s"):
+        table.add_column(column, justify="right")
+    return table
+
+
+class StatsScreen(Screen):
+    """A screen summing up the request stats stored on generated messages: for the current chat per model, for the most recent saved chats, and for all saved chats (archived ones included) per model. Cache hits are prompt tokens the provider served from its prompt cache, which is what branching from a shared prefix should produce."""
+
+    def __init__(self, scr: "Screen"):
+        super().__init__(scr)
+
+    def _update_renderables(self):
+        catalog = chatCatalog.get_catalog(CHATS_PATH)
+        catalog.refresh()
+        current = _table("This Chat", "Model")
+        for model, totals in _chat_usage(self.tree, self.file, catalog).items():
+            _add_row(current, model, totals)
+
+        chats = _table("Recent Chats", "Chat")
+        per_model = {}
+        shown = 0
+        for name in catalog.ordered():
+            usage = catalog.chats[name].get('usage', {})
+            if not usage:
+                continue
+            requestStats.merge(per_model, usage)
+            if shown < RECENT_CHATS:
+                _add_row(chats, catalog.chats[name]['title'], requestStats.total(usage))
+                shown += 1
+        for entry in chatArchive.get_archive(CHATS_PATH).load().values():
+            requestStats.merge(per_model, entry['meta'].get('usage', {}))
+        models = _table("All Saved Chats", "Model")
+        for model, totals in per_model.items():
+            _add_row(models, model, totals)
+
+        from rich.markdown import Markdown
+        self.renderables = [current, chats, models, Rule(style="bold white")]
+        self.renderables.append(Markdown("ESC or 'i': Return to chat."))
+        self.renderables.append(Rule(style="bold white"))
+
+    def handle_input(self, key):
+        if key in (readchar.key.ESC, 'i'):
+            return MainScreen.MainScreen(self)
+        return self
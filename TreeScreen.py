@@ -0,0 +1,121 @@
+import readchar
+
+from rich.rule import Rule
+from rich.text import Text
+
+import MainScreen
+from renderCache import CachedMarkdown
+from Screen import Screen
+
+ROLE_STYLES = {"assistant": "bold red", "user": "bold green", "system": "bold blue"}
+FOOTER_LINES = 4
+FOOTER = "UP/DOWN or PAGE UP/PAGE DOWN to select a message, ENTER to jump to it, 'c' to select the current one, ESC or 't' to return."
+
+
+def _preview(node, width: int):
+    """Returns the start of a message on a single line, at most width characters long."""
+    text = " ".join(node.content[:width * 2].split())
+    return text if len(text) <= width else text[:max(0, width - 1)] + "…"
+
+
+class TreeScreen(Screen):
+    """An outline of the whole conversation tree, one line per message. A message with a single reply is continued on the next line at the same indentation; Where the conversation branches, the alternatives are drawn as an indented tree. The current branch is highlighted, selecting a message and pressing ENTER jumps to it.
+
+    The outline is virtualized: rows are laid out in order by a depth first walk that is resumed whenever rows further down are needed, and only the rows in view are drawn. So opening and scrolling stay fast in trees with tens of thousands of messages, and branches of lazily opened chats are only read from disk once they are scrolled to."""
+
+    def __init__(self, scr: "Screen"):
+        self.console = scr.console
+        self.rows = []
+        self.row_of = {}
+        self._stack = [(scr.tree.root, "", "")]
+        self.on_path = set(scr.tree.path(scr.cur))
+        self.top = 0
+        self.selected = self._layout_to(scr.cur)
+        super().__init__(scr)
+
+    def _layout(self, until: int):
+        """Lays out more rows, until there are more than until of them or the whole tree is laid out."""
+        rows, stack = self.rows, self._stack
+        while len(rows) <= until and stack:
+            node, prefix, cont = stack.pop()
+            node.ensure_loaded()
+            self.row_of[node] = len(rows)
+            rows.append((node, prefix))
+            children = node.next
+            if len(children) == 1:
+                stack.append((children[0], cont, cont))
+            else:
+                for i in range(len(children) - 1, -1, -1):
+                    last = i == len(children) - 1
+                    stack.append((children[i], cont + ("└─ " if last else "├─ "), cont + ("   " if last else "│  ")))
+
+    def _layout_to(self, node):
+        """Lays out rows until node has one, and returns its row."""
+        while node not in self.row_of and self._stack:
+            self._layout(len(self.rows) + self._height())
+        return self.row_of.get(node, 0)
+
+    def _height(self):
+        """Returns how many rows fit on the terminal."""
+        return max(1, self.console.size.height - FOOTER_LINES)
+
+    def _scroll(self):
+        """Moves the view so the selected row is in it."""
+        height = self._height()
+        if self.selected < self.top:
+            self.top = self.selected
+        elif self.selected >= self.top + height:
+            self.top = self.selected - height + 1
+
+    def _row(self, i: int, width: int):
+        node, prefix = self.rows[i]
+        header = f"{node.role[0].upper()} {node.id[:8]} "
+        text = Text(prefix, style="dim", no_wrap=True, overflow="ellipsis")
+        text.append(header, style=ROLE_STYLES.get(node.role, "bold"))
+        text.append(_preview(node, width - len(prefix) - len(header)), style="bold" if node in self.on_path else "dim")
+        if i == self.selected:
+            text.stylize("on blue")
+        return text
+
+    def _update_renderables(self):
+        height = self._height()
+        self._scroll()
+        self._layout(self.top + height)
+        width = self.console.size.width
+        rows = Text("\n", no_wrap=True, overflow="ellipsis").join(self._row(i, width) for i in range(self.top, min(len(self.rows), self.top + height)))
+        total = f"{len(self.rows)}" if not self._stack else f"{len(self.rows)}+"
+        self.renderables = [rows, Rule(Text(f"{self.selected + 1}/{total}", style="bold white"), style="bold white"), CachedMarkdown(FOOTER, FOOTER)]
+
+    def handle_input(self, key):
+        height = self._height()
+        if key in (readchar.key.ESC, 't'):
+            return MainScreen.MainScreen(self)
+        elif key == readchar.key.ENTER:
+            return self._jump(self.rows[self.selected][0])
+        elif key == readchar.key.UP:
+            self.selected = max(0, self.selected - 1)
+        elif key == readchar.key.DOWN:
+            self._layout(self.selected + 1)
+            self.selected = min(len(self.rows) - 1, self.selected + 1)
+        elif key == readchar.key.PAGE_UP:
+            self.selected = max(0, self.selected - height)
+        elif key == readchar.key.PAGE_DOWN:
+            self._layout(self.selected + height)
+            self.selected = min(len(self.rows) - 1, self.selected + height)
+        elif key == readchar.key.HOME:
+            self.selected = 0
+        elif key == readchar.key.END:
+            self._layout(float("inf"))
+            self.selected = len(self.rows) - 1
+        elif key == 'c':
+            self.selected = self._layout_to(self.cur)
+        self._update_renderables()
+        self._render()
+        return self
+
+    def _jump(self, node):
+        """Makes node the current message, and returns to the main screen."""
+        self.cur = node
+        self.messages = [it.to_msg() for it in self.tree.path(node)]
+        self.tree.touch(node)
+        return MainScreen.MainScreen(self)
@@ -1,15 +1,14 @@
 import readchar
 
-from rich.table import Table
 from rich.rule import Rule
-from rich.markdown import Markdown
 
 from pathlib import Path
 import json
 import os
 
 import MainScreen
-from NewChat import load_recent
+import contextWindow
+import completionCache
 from Screen import Screen, _get_input
 
 
@@ -61,19 +60,29 @@ class SettingsScreen(Screen):
             "Temperature": 1,
             "FrequencyPenalty": 0.2,
             "PresencePenalty": 0.2,
+            "Alternatives": 3,
+            "ContextWindow": 65536,
+            "Truncation": "oldest",
+            "Cache": "off",
+            "CacheSizeMB": 64,
+            "ArchiveAfterDays": 0,
             }
     
     def __init__(self, scr:"Screen" = None):
         if not scr:
-            self.cur, self.messages, self.file = load_recent()
+            self.cur, self.messages, self.file, self.tree = None, [], None, None
             settings = load_settings()
             self.settings = settings if settings else self.default
+        for key, value in self.default.items():
+            (scr or self).settings.setdefault(key, value)
         self.index = 0
         super().__init__(scr)
         self.settings_keys= list(self.settings.keys())
 
     
     def _update_renderables(self):
+        from rich.markdown import Markdown
+        from rich.table import Table
         table = Table(title="Settings", show_header=False, show_lines=True)
         table.add_column("Key", style="bold cyan")
         table.add_column("Value", style="bold green")
@@ -127,4 +136,18 @@ class SettingsScreen(Screen):
                 new_val = float(new_val)
             except ValueError:
                 return
+        elif key in ["Alternatives", "ContextWindow", "CacheSizeMB"]:
+            try:
+                new_val = max(1, int(new_val))
+            except ValueError:
+                return
+        elif key == "ArchiveAfterDays":
+            try:
+                new_val = max(0, int(new_val))
+            except ValueError:
+                return
+        elif key == "Truncation" and new_val not in contextWindow.STRATEGIES:
+            return
+        elif key == "Cache" and new_val not in completionCache.CACHE_MODES:
+            return
         self.settings[key] = new_val
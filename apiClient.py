@@ -0,0 +1,117 @@
+import asyncio
+import importlib
+import importlib.util
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE = 10
+KEEPALIVE_EXPIRY = 120
+TIMEOUT = 600
+CONNECT_TIMEOUT = 10
+
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+RETRY_AFTER_MAX = 120
+RETRY_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+_http = None
+
+
+def http_client():
+    """Returns the HTTP client shared by all API clients of this app. It keeps connections alive in a bounded pool, so only the first request to a server pays for TCP and TLS setup; HTTP/2 is used if the optional h2 package is installed."""
+    global _http
+    if _http is None:
+        import httpx
+        _http = httpx.AsyncClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE, keepalive_expiry=KEEPALIVE_EXPIRY),
+            timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+    return _http
+
+
+class ApiClient:
+    """Connects to an OpenAI-compatible API. Importing openai takes longer than everything else at startup, so it happens in a worker thread, and the actual AsyncOpenAI client is set up in the background; Once it is ready, its connection is warmed up. Use get to wait for the client."""
+
+    def __init__(self, api_key: str, base_url: str):
+        """Starts setting up the client. Must be called while the event loop is running.
+
+        Args:
+        - api_key: The API key.
+        - base_url: The API's URL."""
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+        self._ready = asyncio.get_running_loop().create_task(self._setup())
+
+    async def _setup(self):
+        openai = await asyncio.to_thread(importlib.import_module, "openai")
+        self._client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=http_client(), max_retries=0)
+        await warm_up(self._client)
+
+    async def get(self):
+        """Returns the AsyncOpenAI client, once it is set up. Retries are not left to the client, see retry_delay."""
+        if self._client is None:
+            await self._ready
+        return self._client
+
+
+async def warm_up(client):
+    """Opens a connection to the API server, so it is ready in the pool by the time the first message is sent. The response itself doesn't matter, and failures are ignored."""
+    import httpx
+    try:
+        await http_client().head(str(client.base_url))
+    except httpx.HTTPError:
+        pass
+
+
+def _retry_after(response):
+    """Returns how many seconds the server asked us to wait before retrying, or None."""
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def retry_delay(error: Exception, attempt: int):
+    """Decides whether a failed request should be tried again.
+
+    Args:
+    - error: The exception the request raised.
+    - attempt: How many retries were made already.
+
+    Returns:
+    The seconds to wait before the next attempt, or None if the error is permanent or all retries are used up. Delays grow exponentially with full jitter, unless the server sent a Retry-After header: Then the next attempt waits exactly as long as asked, and none is made if that is longer than RETRY_AFTER_MAX. Connections that break while a reply is read (which httpx reports directly, not wrapped by openai) count as connection errors."""
+    from httpx import TransportError
+    from openai import APIConnectionError, APIStatusError
+    if attempt >= MAX_RETRIES:
+        return None
+    if isinstance(error, APIStatusError):
+        if error.status_code not in RETRY_STATUS:
+            return None
+        requested = _retry_after(error.response)
+        if requested is not None:
+            return max(0, requested) if requested <= RETRY_AFTER_MAX else None
+    elif not isinstance(error, (APIConnectionError, TransportError)):
+        return None
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def describe(error: Exception):
+    """Returns a short description of an error, to show while waiting for a retry."""
+    from openai import APIStatusError
+    if isinstance(error, APIStatusError):
+        return f"{error.status_code} {error.response.reason_phrase}"
+    return type(error).__name__
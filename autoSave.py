@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import chatJournal
+
+RECOVERY_PATH = "./userInfo/recovery"
+SCRATCH_EXT = ".jsonl"
+DEBOUNCE = 2.0
+MAX_DELAY = 10.0
+
+_autosaver = None
+
+
+def _write_atomic(path: str, data: bytes):
+    """Writes data to a temporary file next to path, forces it to disk and then moves it over path. Readers only ever see the old or the new file, never half of one."""
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _changes(tree, file: str):
+    """Returns the nodes of a tree that are not in its chat file yet, parents before their children, and those in it that were pinned or unpinned since (see ChatJournal.changes). For chats that were never saved or are still legacy .json files, every node is unsaved."""
+    if file and chatJournal.is_journal(file) and os.path.exists(file):
+        return chatJournal.get_journal(file).changes(tree.root)
+    return [node for node in chatJournal._iter_tree(tree.root) if not node.source], []
+
+
+class AutoSaver:
+    """Saves the open chat in the background, so a crash or a lost terminal doesn't lose it. Changes are only noted by schedule, which returns right away; A worker thread waits until no change came in for DEBOUNCE seconds (or MAX_DELAY passed since the first one), then writes a snapshot of the chat to this session's scratch file.
+
+    The scratch file is a journal of the messages that are not in the chat's file yet (all of them, for chats without a journal) and of changed pins, headed by a record naming that file, and ending with the current message. It is replaced atomically, and removed once there is nothing unsaved left, or the chat was saved or discarded on purpose (see clear)."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}-{os.getpid()}{SCRATCH_EXT}")
+        self.error = None
+        self._cond = threading.Condition()
+        self._state = None
+        self._changed = None
+        self._first = None
+        self._last = None
+        self._closing = False
+        self._thread = None
+
+    def schedule(self, tree, cur, file: str, force: bool = False):
+        """Notes that the chat may have changed. Nothing happens if the tree, its size, the current message and the file are the same as last time, unless forced.
+
+        Args:
+        - tree: The chat's TreeIndex.
+        - cur: The current message node.
+        - file: The chat's file, or None if it was never saved.
+        - force: Whether the chat changed in a way the above doesn't show, like a message being pinned."""
+        last = self._last
+        if not force and last and last[0] is tree and last[1] is cur and last[2] == file and last[3] == len(tree.nodes):
+            return
+        self._last = (tree, cur, file, len(tree.nodes))
+        self._set((tree, cur, file))
+
+    def clear(self):
+        """Forgets the open chat, after it was saved or discarded: the scratch file is removed."""
+        self._last = None
+        self._set(None)
+
+    def _set(self, state):
+        with self._cond:
+            now = time.monotonic()
+            if self._changed is None:
+                self._first = now
+            self._state = state
+            self._changed = now
+            self._cond.notify()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._changed is None and not self._closing:
+                    self._cond.wait()
+                if self._changed is None:
+                    return
+                if self._state is not None and not self._closing:
+                    wait = min(self._changed + DEBOUNCE, self._first + MAX_DELAY) - time.monotonic()
+                    if wait > 0:
+                        self._cond.wait(wait)
+                        continue
+                state = self._state
+                self._changed = None
+            try:
+                self._save(state)
+                self.error = None
+            except Exception as e:
+                self.error = f"Autosave failed: {e}"
+
+    def _save(self, state):
+        """Writes the snapshot of state to the scratch file, or removes the file if there is nothing to keep."""
+        unsaved, repinned = [], []
+        if state:
+            tree, cur, file = state
+            unsaved, repinned = _changes(tree, file)
+        if not any(node.prev for node in unsaved) and not repinned:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        header = {'op': 'autosave', 'file': file, 'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'messages': len(unsaved) + len(repinned)}
+        records = [header] + [chatJournal.node_record(node) for node in unsaved] + [chatJournal.pin_record(node) for node in repinned] + [chatJournal.cur_record(cur.id)]
+        os.makedirs(self.directory, exist_ok=True)
+        _write_atomic(self.path, "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode('utf-8'))
+
+    def adopt(self, path: str):
+        """Makes a scratch file left behind by an earlier session this session's own, after its chat was recovered."""
+        os.replace(path, self.path)
+        self._last = None
+
+    def close(self):
+        """Writes any pending change right away, and stops the worker thread. Blocks until it is done."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def get_autosaver():
+    """Returns the autosaver of this session."""
+    global _autosaver
+    if _autosaver is None:
+        _autosaver = AutoSaver(RECOVERY_PATH)
+    return _autosaver
+
+
+def close():
+    """Stops the autosaver, if it was ever used, once pending changes are written."""
+    if _autosaver is not None:
+        _autosaver.close()
+
+
+def read(path: str):
+    """Reads a scratch file.
+
+    Returns:
+    - Its header: the chat file it belongs to ('file', None if the chat was never saved), when it was written ('time'), and how many messages it holds ('messages').
+    - The journal records of those messages and of the current one."""
+    with open(path, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        return header, [json.loads(line) for line in f]
+
+
+def _running(name: str):
+    """Returns whether the session that owns a scratch file is still running, going by the process ID at the end of its name."""
+    try:
+        pid = int(name[:-len(SCRATCH_EXT)].rsplit('-', 1)[1])
+    except (IndexError, ValueError):
+        return False
+    if pid == os.getpid():
+        return False
+    if os.name == 'nt':
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def unsaved():
+    """Returns the scratch files earlier sessions left behind, the newest first, as tuples of their path and header. These hold chats that were neither saved nor discarded, for example after a crash. Scratch files of sessions that are still running are left to them."""
+    own = get_autosaver().path
+    found = []
+    try:
+        with os.scandir(RECOVERY_PATH) as entries:
+            for entry in entries:
+                if not entry.name.endswith(SCRATCH_EXT) or entry.path == own or _running(entry.name):
+                    continue
+                try:
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        found.append((entry.stat().st_mtime, entry.path, json.loads(f.readline())))
+                except (OSError, ValueError):
+                    pass
+    except FileNotFoundError:
+        return []
+    found.sort(key=lambda item: item[0], reverse=True)
+    return [(path, header) for _, path, header in found]
+
+
+def discard(path: str):
+    """Deletes a scratch file left behind by an earlier session."""
+    os.remove(path)
@@ -0,0 +1,143 @@
+"""Benchmark of the chat archive (see chatArchive) against loose chat files.
+
+It builds --chats synthetic chats (see benchmarks.trees) and stores them in four layouts, each in its own directory:
+- loose_json: One pretty-printed legacy .json file per chat (indent=4), as older versions saved them.
+- loose_journal: One .jsonl journal per chat (plus its .idx file), as chats are saved now.
+- pack_zlib, pack_lzma: The --source chats moved into a single pack archive, compressed with zlib or lzma.
+
+For every layout it reports:
+- files: How many files the chats take up.
+- disk_kb: Their total size; allocated_kb: The disk space allocated for them, where the file system reports it (small files take up whole blocks).
+- archive_ms: For packs, moving all chats into the pack at once.
+- list_ms: Listing the chats the way the chat loader does, starting without a catalog: loose chats are all read to build it, archived ones are listed from the pack's index.
+- load_ms, load_p95_ms: NewChat.load_file on a sample of --sample chats; median and 95th percentile.
+- unarchive_ms: For packs, moving one chat out of the pack and back in (median over the sample).
+
+Run from the repository root:
+    python -m benchmarks.archive [--chats 500] [--nodes 40] [--source json] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import MainScreen  # The screens import each other, NewChat can only be imported after MainScreen.
+import NewChat
+import chatArchive
+import chatCatalog
+import chatJournal
+from benchmarks import trees
+from benchmarks.suite import write_report
+
+
+def _ms(start: float):
+    return (time.perf_counter() - start) * 1000
+
+
+def _disk(directory: str):
+    """Returns the number of files in a directory, their total size and the space allocated for them, in KiB."""
+    files = size = allocated = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            stat = entry.stat()
+            files += 1
+            size += stat.st_size
+            allocated += getattr(stat, 'st_blocks', 0) * 512 or stat.st_size
+    return files, size / 1024, allocated / 1024
+
+
+def _forget(directory: str):
+    """Drops everything held in memory about a chat directory, and its catalog file, so the next listing starts cold."""
+    chatCatalog._catalogs.pop(directory, None)
+    chatArchive._archives.pop(directory, None)
+    catalog = os.path.join(directory, chatCatalog.CATALOG_NAME)
+    if os.path.exists(catalog):
+        os.remove(catalog)
+
+
+def _write(directory: str, chats: list, layout: str):
+    """Stores the chats, as tuples of (name, tree, current node), in a directory as loose .json or journal files."""
+    for name, tree, cur in chats:
+        if layout == "json":
+            with open(os.path.join(directory, name + ".json"), 'w', encoding='utf-8') as f:
+                json.dump(json.loads("".join(tree.root.iter_serialize(cur))), f, indent=4)
+        else:
+            chatJournal.create(os.path.join(directory, name + chatJournal.JOURNAL_EXT)).append(tree.root, cur)
+
+
+def run_layout(layout: str, chats: list, args, directory: str):
+    """Stores the chats in one layout and runs every measurement on it. Returns a dictionary of results."""
+    results = {}
+    source = layout if layout.startswith("loose_") else f"loose_{args.source}"
+    _write(directory, chats, source.split("_")[1])
+    if layout.startswith("pack_"):
+        catalog = chatCatalog.get_catalog(directory)
+        catalog.refresh()
+        files = [(os.path.join(directory, name), meta) for name, meta in catalog.chats.items()]
+        start = time.perf_counter()
+        chatArchive.get_archive(directory).add(files, codec=layout.split("_")[1])
+        results['archive_ms'] = _ms(start)
+    results['files'], results['disk_kb'], results['allocated_kb'] = _disk(directory)
+
+    NewChat.CHATS_PATH = directory
+    _forget(directory)
+    start = time.perf_counter()
+    paths = NewChat._load_chat_files()
+    results['list_ms'] = _ms(start)
+
+    sample = random.Random(args.seed).sample(paths, min(args.sample, len(paths)))
+    times = []
+    for path in sample:
+        start = time.perf_counter()
+        NewChat.load_file(path)
+        times.append(_ms(start))
+    results['load_ms'] = statistics.median(times)
+    results['load_p95_ms'] = statistics.quantiles(times, n=20)[-1] if len(times) > 1 else None
+
+    if layout.startswith("pack_"):
+        times = []
+        for path in sample:
+            start = time.perf_counter()
+            loose = chatArchive.unarchive(path)
+            chatArchive.get_archive(directory).add([(loose, chatCatalog.get_catalog(directory).chats[os.path.basename(loose)])], codec=layout.split("_")[1])
+            times.append(_ms(start))
+        results['unarchive_ms'] = statistics.median(times)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=500, help="number of chats")
+    parser.add_argument("--nodes", type=int, default=40, help="messages per chat")
+    parser.add_argument("--length", type=int, default=400, help="characters of prose per message")
+    parser.add_argument("--source", choices=("json", "journal"), default="json", help="format of the chats that are packed")
+    parser.add_argument("--sample", type=int, default=50, help="chats loaded (and unarchived) per layout")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the chats and the sample")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    chats = []
+    for i in range(args.chats):
+        shape = ("deep", "wide", "code")[i % 3]
+        tree, cur = trees.build(shape, args.nodes, length=args.length, code_lines=20, seed=args.seed + i)
+        chats.append((f"chat-{i:05}", tree, cur))
+
+    results = {}
+    root = tempfile.mkdtemp(prefix="nodechat-bench-")
+    try:
+        for layout in ("loose_json", "loose_journal", "pack_zlib", "pack_lzma"):
+            directory = os.path.join(root, layout)
+            os.mkdir(directory)
+            results[layout] = run_layout(layout, chats, args, directory)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    write_report(results, args)
+
+
+if __name__ == "__main__":
+    main()
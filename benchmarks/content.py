@@ -0,0 +1,152 @@
+"""Benchmark of message text deduplication (see contentStore), against keeping a full copy of every text.
+
+Two kinds of chats are generated from seeded random text (see benchmarks.trees):
+- edited: A single chat of --messages messages of about --length characters, each edited --edits times; Every edit changes a few words of the one before it, as when a prompt is refined over and over.
+- prompt: --chats chats that all start with the same system prompt of about --prompt characters, followed by --turns short messages.
+
+Both are saved as journals and loaded back, once keeping full copies ("copies": no deltas, nothing in the content store) and once deduplicated ("dedup"). Every run reports:
+- disk_kb: The size of the chat files (and of the content store).
+- ram_kb: The memory the loaded chats take up, measured with tracemalloc; For prompt, all chats are held at once, as when the chat catalog or the search index is rebuilt.
+- load_ms: Loading the chats from disk.
+- edit_ms, edit_p95_ms: For edited, the time contentStore.delta takes per edit; median and 95th percentile.
+
+Run from the repository root:
+    python -m benchmarks.content [--messages 40] [--edits 10] [--chats 200] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import gc
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import chatJournal
+import contentStore
+from conversationTree import TIME_FORMAT, Msg_Node, TreeIndex
+from benchmarks import trees
+from benchmarks.suite import write_report
+
+
+def _ms(start: float):
+    return (time.perf_counter() - start) * 1000
+
+
+def _disk(directory: str):
+    """Returns the total size of the files in a directory, in KiB."""
+    with os.scandir(directory) as entries:
+        return sum(entry.stat().st_size for entry in entries) / 1024
+
+
+def _reword(rng: random.Random, text: str, changes: int = 3):
+    """Returns text with a few of its words replaced."""
+    words = text.split(" ")
+    for _ in range(changes):
+        words[rng.randrange(len(words))] = rng.choice(trees.WORDS)
+    return " ".join(words)
+
+
+def _load(files: list):
+    """Loads chat journals, starting without any of their texts in memory.
+
+    Returns:
+    - The roots of the loaded chats, to keep them alive until the caller is done.
+    - The bytes they take up.
+    - The time loading took, in milliseconds."""
+    contentStore._stores.clear()
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    roots = [chatJournal.load(file, track=False)[0] for file in files]
+    elapsed = _ms(start)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return roots, size / 1024, elapsed
+
+
+def run_edited(args, dedup: bool, directory: str):
+    """Builds, saves and loads the edited chat. Returns a dictionary of results."""
+    rng = random.Random(args.seed)
+    tree = TreeIndex()
+    node = Msg_Node(None, "system", "You are a helpful assistant.", trees.START.strftime(TIME_FORMAT), 0)
+    tree.add(node)
+    times = []
+    for i in range(args.messages):
+        role = ("user", "assistant")[i % 2]
+        node = Msg_Node(node, role, trees._prose(rng, args.length), trees.START.strftime(TIME_FORMAT), i + 1)
+        tree.add(node)
+        for _ in range(args.edits):
+            text = _reword(rng, node.content)
+            start = time.perf_counter()
+            content = contentStore.delta(node, text) if dedup else text
+            times.append(_ms(start))
+            node = Msg_Node(node.prev, role, content, trees.START.strftime(TIME_FORMAT), i + 1)
+            tree.add(node)
+    file = os.path.join(directory, "edited" + chatJournal.JOURNAL_EXT)
+    chatJournal.create(file).append(tree.root, node)
+    chatJournal.forget(file)
+    del tree, node
+    roots, ram, load = _load([file])
+    return {
+        'disk_kb': _disk(directory),
+        'ram_kb': ram,
+        'load_ms': load,
+        'edit_ms': statistics.median(times) if dedup and times else None,
+        'edit_p95_ms': statistics.quantiles(times, n=20)[-1] if dedup and len(times) > 1 else None,
+    }
+
+
+def run_prompt(args, directory: str):
+    """Saves and loads the chats sharing a system prompt. Returns a dictionary of results."""
+    rng = random.Random(args.seed)
+    prompt = trees._prose(rng, args.prompt)
+    files = []
+    for i in range(args.chats):
+        tree = TreeIndex()
+        node = Msg_Node(None, "system", prompt, trees.START.strftime(TIME_FORMAT), 0)
+        tree.add(node)
+        for depth in range(1, args.turns + 1):
+            node = Msg_Node(node, ("user", "assistant")[depth % 2 - 1], trees._prose(rng, args.length), trees.START.strftime(TIME_FORMAT), depth)
+            tree.add(node)
+        files.append(os.path.join(directory, f"chat-{i:05}" + chatJournal.JOURNAL_EXT))
+        chatJournal.create(files[-1]).append(tree.root, node)
+        chatJournal.forget(files[-1])
+    roots, ram, load = _load(files)
+    return {'disk_kb': _disk(directory), 'ram_kb': ram, 'load_ms': load}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=40, help="messages in the edited chat")
+    parser.add_argument("--edits", type=int, default=10, help="edits of every message")
+    parser.add_argument("--length", type=int, default=2000, help="characters per message")
+    parser.add_argument("--chats", type=int, default=200, help="chats sharing a system prompt")
+    parser.add_argument("--prompt", type=int, default=4000, help="characters of the shared system prompt")
+    parser.add_argument("--turns", type=int, default=4, help="messages per chat after the system prompt")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated text")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    results = {}
+    share = contentStore.SHARE_MIN_SIZE
+    root = tempfile.mkdtemp(prefix="nodechat-bench-")
+    try:
+        for dedup in (False, True):
+            name = "dedup" if dedup else "copies"
+            contentStore.SHARE_MIN_SIZE = share if dedup else float('inf')
+            for scenario in ("edited", "prompt"):
+                directory = os.path.join(root, f"{scenario}_{name}")
+                os.mkdir(directory)
+                results[f"{scenario}_{name}"] = run_edited(args, dedup, directory) if scenario == "edited" else run_prompt(args, directory)
+    finally:
+        contentStore.SHARE_MIN_SIZE = share
+        shutil.rmtree(root, ignore_errors=True)
+    write_report(results, args)
+
+
+if __name__ == "__main__":
+    main()
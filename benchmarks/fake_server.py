@@ -0,0 +1,218 @@
+"""A local stand-in for an OpenAI-compatible API, for load tests that don't spend API credits.
+
+It speaks just enough HTTP/1.1 for POST /chat/completions with stream=True: replies are sent as server-sent events, in chunks of --chunk tokens at --rate tokens per second (0 means as fast as possible), after --latency seconds. A final chunk reports token usage if the request asked for it (stream_options.include_usage). Errors can be injected per request: a 429 with a Retry-After header, a 500, or a connection that drops in the middle of the reply. Any other request (like the warm-up HEAD request) gets an empty 200.
+
+Only the standard library is used, so it runs anywhere the app runs. Start it, then set NodeChat's URL to the address it prints:
+    python -m benchmarks.fake_server [--port 8000] [--rate 50] [--tokens 300] [--error-429 0.1] [--markdown]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+WORDS = ("the", "tree", "branch", "message", "model", "reply", "context", "token", "render", "python", "function",
+         "value", "list", "index", "cache", "stream", "prompt", "answer", "question", "because", "which", "would")
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+class FakeServer:
+    """The fake API server. Every request draws its injected error (if any) from a seeded random generator, and the counts of what was served are kept in stats (along with cpu_s, the CPU time used while serving, once closed)."""
+
+    def __init__(self, rate: float = 0, chunk: int = 1, tokens: int = 300, latency: float = 0, error_429: float = 0, error_500: float = 0, disconnect: float = 0, retry_after: float = 0, markdown: bool = False, seed: int = 0):
+        """Args:
+        - rate: Tokens per second per reply, 0 to send them as fast as possible.
+        - chunk: Tokens per streamed chunk.
+        - tokens: Tokens per reply.
+        - latency: Seconds before a reply starts.
+        - error_429, error_500, disconnect: Probabilities of answering a request with a 429, a 500, or of dropping the connection halfway through the reply.
+        - retry_after: Value of the Retry-After header sent with 429s.
+        - markdown: Whether replies hold markdown (paragraphs, lists and code blocks) rather than plain words.
+        - seed: Seed for the random generator deciding about errors and reply text."""
+        self.rate = rate
+        self.chunk = max(1, chunk)
+        self.tokens = tokens
+        self.latency = latency
+        self.error_429 = error_429
+        self.error_500 = error_500
+        self.disconnect = disconnect
+        self.retry_after = retry_after
+        self.markdown = markdown
+        self.rng = random.Random(seed)
+        self.stats = {'requests': 0, 'replies': 0, 'chunks': 0, 'tokens': 0, '429': 0, '500': 0, 'disconnects': 0}
+        self.server = None
+        self._connections = {}
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        """Starts listening. Returns the base URL to use as the API's URL."""
+        self._cpu = time.process_time()
+        self.server = await asyncio.start_server(self._connection, host, port)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}/v1"
+
+    async def close(self):
+        """Stops listening, and closes the connections that are still open. The CPU time used since start is added to stats."""
+        self.server.close()
+        self.stats['cpu_s'] = time.process_time() - self._cpu
+        for writer in self._connections:
+            writer.transport.abort()
+        await asyncio.gather(*self._connections.values(), return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def _connection(self, reader, writer):
+        """Serves the requests of one keep-alive connection, until the client closes it."""
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode('latin-1').split("\r\n")
+                method, path = lines[0].split(" ")[:2]
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                if method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+                    if not await self._completion(json.loads(body or b"{}"), writer):
+                        return
+                else:
+                    self._respond(writer, 200, b"")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    def _respond(self, writer, status: int, body: bytes, headers: dict = None):
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Length: {len(body)}", "Content-Type: application/json"]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+
+    def _error(self, writer, status: int, message: str, headers: dict = None):
+        body = json.dumps({'error': {'message': message, 'type': "fake_server_error", 'code': status}}).encode('utf-8')
+        self._respond(writer, status, body, headers)
+
+    def _text(self, count: int):
+        """Returns count tokens of reply text."""
+        if not self.markdown:
+            return [self.rng.choice(WORDS) + " " for _ in range(count)]
+        tokens = []
+        while len(tokens) < count:
+            kind = self.rng.random()
+            if kind < 0.15:
+                tokens += ["```python\n"] + [f"{self.rng.choice(WORDS)} = {self.rng.randint(0, 99)}\n" for _ in range(8)] + ["```\n\n"]
+            elif kind < 0.3:
+                tokens += [f"- {self.rng.choice(WORDS)} " + f"**{self.rng.choice(WORDS)}**\n" for _ in range(3)] + ["\n"]
+            else:
+                tokens += [self.rng.choice(WORDS) + " " for _ in range(30)] + ["\n\n"]
+        return tokens[:count]
+
+    async def _completion(self, request: dict, writer):
+        """Answers a chat completion request. Returns False if the connection was dropped on purpose."""
+        self.stats['requests'] += 1
+        roll = self.rng.random()
+        if roll < self.error_429:
+            self.stats['429'] += 1
+            self._error(writer, 429, "Rate limit reached (injected by the fake server).", {'Retry-After': f"{self.retry_after:g}"})
+            return True
+        if roll < self.error_429 + self.error_500:
+            self.stats['500'] += 1
+            self._error(writer, 500, "Internal error (injected by the fake server).")
+            return True
+        if not request.get('stream'):
+            self._error(writer, 400, "The fake server only supports streaming.")
+            return True
+        drop = self.rng.random() < self.disconnect
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+        model = request.get('model', "fake")
+        created = int(time.time())
+        tokens = self._text(self.tokens)
+        start = time.perf_counter()
+        sent = 0
+        for i in range(0, len(tokens), self.chunk):
+            if drop and i >= len(tokens) // 2:
+                self.stats['disconnects'] += 1
+                await writer.drain()
+                writer.transport.abort()
+                return False
+            part = tokens[i:i + self.chunk]
+            self._event(writer, {'id': "chatcmpl-fake", 'object': "chat.completion.chunk", 'created': created, 'model': model,
+                                 'choices': [{'index': 0, 'delta': {'role': "assistant", 'content': "".join(part)}, 'finish_reason': None}]})
+            sent += len(part)
+            self.stats['chunks'] += 1
+            if self.rate:
+                delay = start + sent / self.rate - time.perf_counter()
+                if delay > 0:
+                    await writer.drain()
+                    await asyncio.sleep(delay)
+            else:
+                await writer.drain()
+        self._event(writer, {'id': "chatcmpl-fake", 'object': "chat.completion.chunk", 'created': created, 'model': model,
+                             'choices': [{'index': 0, 'delta': {}, 'finish_reason': "stop"}]})
+        if (request.get('stream_options') or {}).get('include_usage'):
+            prompt = sum(len(str(message.get('content', ""))) for message in request.get('messages', [])) // 4
+            self._event(writer, {'id': "chatcmpl-fake", 'object': "chat.completion.chunk", 'created': created, 'model': model, 'choices': [],
+                                 'usage': {'prompt_tokens': prompt, 'completion_tokens': sent, 'total_tokens': prompt + sent}})
+        self._chunk(writer, b"data: [DONE]\n\n")
+        self._chunk(writer, b"")
+        self.stats['replies'] += 1
+        self.stats['tokens'] += sent
+        return True
+
+    def _event(self, writer, data: dict):
+        self._chunk(writer, b"data: " + json.dumps(data).encode('utf-8') + b"\n\n")
+
+    def _chunk(self, writer, data: bytes):
+        """Writes data as one chunk of a chunked response body; Empty data ends the body."""
+        writer.write(f"{len(data):x}\r\n".encode('latin-1') + data + b"\r\n")
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Adds the server's settings to a command line parser, see FakeServer for what they do."""
+    parser.add_argument("--rate", type=float, default=0, help="tokens per second per reply, 0 for as fast as possible")
+    parser.add_argument("--chunk", type=int, default=1, help="tokens per streamed chunk")
+    parser.add_argument("--tokens", type=int, default=300, help="tokens per reply")
+    parser.add_argument("--latency", type=float, default=0, help="seconds before a reply starts")
+    parser.add_argument("--error-429", type=float, default=0, help="probability of answering with a 429")
+    parser.add_argument("--error-500", type=float, default=0, help="probability of answering with a 500")
+    parser.add_argument("--disconnect", type=float, default=0, help="probability of dropping the connection in the middle of a reply")
+    parser.add_argument("--retry-after", type=float, default=0, help="Retry-After sent with 429s, in seconds")
+    parser.add_argument("--markdown", action="store_true", help="send markdown with lists and code blocks instead of plain words")
+    parser.add_argument("--seed", type=int, default=0, help="seed for errors and reply text")
+
+
+def server_options(args):
+    """Returns FakeServer's keyword arguments from parsed command line arguments."""
+    return {name: getattr(args, name) for name in ("rate", "chunk", "tokens", "latency", "error_429", "error_500", "disconnect", "retry_after", "markdown", "seed")}
+
+
+async def serve(args):
+    """Serves until interrupted, then prints the counts of what was served as JSON."""
+    server = FakeServer(**server_options(args))
+    url = await server.start(args.host, args.port)
+    print(url, flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+        print(json.dumps(server.stats), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on, 0 picks a free one")
+    add_arguments(parser)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
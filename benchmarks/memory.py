@@ -0,0 +1,106 @@
+"""Memory benchmark for conversation trees.
+
+Loads a generated chat of --nodes messages from JSON, once into the previous node layout (a plain object with a __dict__, string IDs and times, and a list of children on every node) and once into Msg_Node, and reports the bytes each takes up per node, measured with tracemalloc. The message texts themselves are reported separately, they cost the same either way.
+
+Run from the repository root:
+    python -m benchmarks.memory [--nodes 100000] [--length 200]
+"""
+import argparse
+import gc
+import json
+import random
+import sys
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+from conversationTree import Msg_Node
+
+ROLES = ("user", "assistant")
+
+
+class LegacyNode:
+    """The layout of message nodes before they were made compact, with the same fields."""
+
+    def __init__(self, prev, role, content, time, depth, id, index):
+        self.prev = prev
+        if prev:
+            prev.next.append(self)
+        self.index = index
+        self.next = []
+        self.role = role
+        self.content = content
+        self.time = time
+        self.depth = depth
+        self.id = id
+        self.source = None
+        self.tokens = None
+        self.path_tokens = None
+        self.path_hash = None
+        self.pinned = False
+        self.stats = None
+
+
+def _chat(nodes: int, length: int):
+    """Returns a chat as JSON text: a list of node records, parents first. Most messages continue the previous one, some start a new branch further up."""
+    rng = random.Random(0)
+    start = datetime(2025, 1, 1)
+    records = [{'prev': None, 'role': "system", 'content': "x" * length, 'time': start.strftime("%Y-%m-%d %H:%M:%S"), 'depth': 0, 'id': str(uuid.UUID(int=rng.getrandbits(128))), 'index': 1}]
+    children = [0]
+    for i in range(1, nodes):
+        parent = i - 1 if rng.random() < 0.9 else rng.randrange(i)
+        children.append(0)
+        children[parent] += 1
+        records.append({
+            'prev': parent,
+            'role': ROLES[records[parent]['depth'] % 2],
+            'content': "x" * length,
+            'time': (start + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S"),
+            'depth': records[parent]['depth'] + 1,
+            'id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'index': children[parent],
+        })
+    return json.dumps(records)
+
+
+def measure(cls, text: str):
+    """Parses the chat and builds its tree with cls.
+
+    Returns:
+    - The bytes still allocated once the tree is built and the parsed records are gone.
+    - The bytes taken up by the message texts alone.
+    - The tree's nodes, to keep them alive until the caller is done."""
+    gc.collect()
+    tracemalloc.start()
+    records = json.loads(text)
+    nodes = []
+    for record in records:
+        prev = nodes[record['prev']] if record['prev'] is not None else None
+        nodes.append(cls(prev, record['role'], record['content'], record['time'], record['depth'], record['id'], record['index']))
+    del records, record
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    content = sum(sys.getsizeof(node.content) for node in nodes)
+    return size, content, nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=100000, help="messages in the generated chat")
+    parser.add_argument("--length", type=int, default=200, help="characters per message")
+    args = parser.parse_args()
+
+    text = _chat(args.nodes, args.length)
+    results = {}
+    for name, cls in (("before (dict layout)", LegacyNode), ("after (Msg_Node)", Msg_Node)):
+        size, content, nodes = measure(cls, text)
+        results[name] = (size - content) / args.nodes
+        print(f"{name}: {size / args.nodes:7.1f} bytes per node, {(size - content) / args.nodes:7.1f} without message text")
+        del nodes
+    before, after = results.values()
+    print(f"overhead per node reduced by {before - after:.1f} bytes ({1 - after / before:.0%})")
+
+
+if __name__ == "__main__":
+    main()
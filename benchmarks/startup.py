@@ -0,0 +1,82 @@
+"""Startup benchmark, based on python -X importtime.
+
+Measures what gets imported before the placeholder frame (import main) and before the first real frame (the screens), and fails if a module that should only be imported on first use shows up, or if importing takes longer than --max-ms.
+
+Run from the repository root:
+    python -m benchmarks.startup [--runs 5] [--max-ms 150]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+STAGES = {
+    "placeholder": "import main",
+    "first frame": "import main, MainScreen, UserSettings",
+}
+DEFERRED = ("openai", "httpx", "prompt_toolkit", "rich.markdown", "markdown_it", "pygments")
+TOP = 8
+MARKER = "-- startup benchmark --"
+
+
+def _importtime(code: str):
+    """Imports code in a fresh interpreter. Only imports made by code are counted, not the ones of the interpreter's own startup.
+
+    Returns:
+    - The wall time of the whole process, in milliseconds.
+    - A dictionary mapping every imported module to its (self, cumulative) import time in microseconds.
+    - The names of the top level imports."""
+    start = time.perf_counter()
+    marked = f"import sys; sys.stderr.write({MARKER!r} + '\\n'); {code}"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", marked], capture_output=True, text=True, check=True)
+    wall = (time.perf_counter() - start) * 1000
+    modules = {}
+    top = []
+    lines = result.stderr.splitlines()
+    for line in lines[lines.index(MARKER) + 1:]:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(own), int(cumulative))
+        if name.startswith(" ") and not name.startswith("  "):
+            top.append(name.strip())
+    return wall, modules, top
+
+
+def measure(code: str, runs: int):
+    """Runs _importtime several times, returns the median wall time, the median total import time (both in milliseconds) and the modules of the last run."""
+    walls = []
+    totals = []
+    for _ in range(runs):
+        wall, modules, top = _importtime(code)
+        walls.append(wall)
+        totals.append(sum(modules[name][1] for name in top) / 1000)
+    return statistics.median(walls), statistics.median(totals), modules, top
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per stage, the median is reported")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if importing the first frame's modules takes longer")
+    args = parser.parse_args()
+
+    failed = False
+    for stage, code in STAGES.items():
+        wall, total, modules, top = measure(code, args.runs)
+        print(f"{stage}: {total:.1f} ms importing, {wall:.1f} ms process wall time ({code})")
+        heaviest = sorted(top, key=lambda name: modules[name][1], reverse=True)[:TOP]
+        for name in heaviest:
+            print(f"    {modules[name][1] / 1000:8.1f} ms  {name}")
+        eager = [name for name in DEFERRED if name in modules]
+        if eager:
+            print(f"    imported too early: {', '.join(eager)}")
+            failed = True
+        if stage == "first frame" and args.max_ms is not None and total > args.max_ms:
+            print(f"    slower than {args.max_ms:.0f} ms")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Throughput harness for the streaming path: MainScreen._generate against the fake API server (see benchmarks.fake_server), so no API credits are spent.
+
+For every token rate in --rates (tokens per second per reply, 0 for as fast as the server can send), a fake server is started in its own process and --runs generations of --alternatives replies each are streamed in. Every rate gets these results:
+- tokens_per_s: Tokens received per second, from the first chunk until the replies are complete. At rate 0 (rate_max) this is the most the app sustains.
+- sustained: tokens_per_s as a share of the rate asked for (times the alternatives streamed at once).
+- chunk_overhead_us: The app's CPU time per received chunk, in microseconds. It covers everything done while streaming: parsing events, collecting text and drawing frames.
+- client_cpu_pct, server_cpu_pct: CPU time used by the app and by the server, as a share of the time the generations took.
+- frames, frame_ms, frame_p95_ms: Frames drawn per generation, and the time MainScreen._refresh takes to draw one; median and 95th percentile.
+- flush_ms: Time StreamRenderer.flush takes per frame to render the markdown that arrived; --markdown makes the server send lists and code blocks.
+- terminal_kb: Bytes written to the terminal per generation.
+
+With --errors P, one more server answers a share P of requests with a 429, another P with a 500, and drops the connection halfway through a reply for another P. Its results count the generations that completed, those that kept a partial reply, those that failed, the retries made, and errors that escaped the app (which should be 0).
+
+Frames are drawn into a fixed size console that writes to memory, as in benchmarks.suite; Results are printed in the same JSON format and can be compared the same way. --profile prints the functions that took the most time while streaming to stderr.
+
+Run from the repository root:
+    python -m benchmarks.stream [--rates 100,1000,10000,0] [--tokens 500] [--chunk 1] [--runs 3] [--errors 0.1] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import cProfile
+import io
+import json
+import pstats
+import shutil
+import signal
+import statistics
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime
+
+from rich.console import Console
+
+import MainScreen
+import UserSettings
+import apiClient
+import autoSave
+from conversationTree import Msg_Node, TreeIndex
+from streamRenderer import StreamRenderer
+from benchmarks.suite import WIDTH, HEIGHT, write_report
+
+_flushes = []
+
+
+def _timed_flush(flush):
+    def timed(self, final: bool = False):
+        start = time.perf_counter()
+        flush(self, final)
+        _flushes.append((time.perf_counter() - start) * 1000)
+    return timed
+
+
+class _Server:
+    """A fake API server running in a child process."""
+
+    def __init__(self, options: list):
+        self.options = options
+
+    async def __aenter__(self):
+        self.process = await asyncio.create_subprocess_exec(sys.executable, "-m", "benchmarks.fake_server", "--port", "0", *self.options, stdout=asyncio.subprocess.PIPE)
+        self.url = (await self.process.stdout.readline()).decode().strip()
+        return self
+
+    async def __aexit__(self, *_):
+        """Stops the server, and keeps the counts of what it served in stats."""
+        self.process.send_signal(signal.SIGINT)
+        self.stats = json.loads((await self.process.stdout.readline()) or b"{}")
+        await self.process.wait()
+
+
+def _screen(url: str):
+    """Returns a main screen holding a short chat, connected to the API at url and drawing into a headless console."""
+    tree = TreeIndex()
+    root = Msg_Node(None, "system", "You are a helpful assistant.", datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 0)
+    prompt = Msg_Node(root, "user", "Please write a long answer.", datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 1)
+    tree.add(root)
+    tree.add(prompt)
+    settings = dict(UserSettings.SettingsScreen.default)
+    settings.update({"URL": url, "ApiKey": "fake", "Cache": "off"})
+    state = types.SimpleNamespace(
+        cur=prompt,
+        messages=[root.to_msg(), prompt.to_msg()],
+        settings=settings,
+        console=Console(file=io.StringIO(), width=WIDTH, height=HEIGHT, force_terminal=True, color_system="truecolor"),
+        file=None,
+        tree=tree,
+        client=apiClient.ApiClient("fake", url),
+    )
+    return MainScreen.MainScreen(state), prompt
+
+
+async def _run(screen, prompt: Msg_Node, n: int, frames: list):
+    """Generates n replies to prompt and waits until they are complete.
+
+    Returns:
+    - The finished generation.
+    - Seconds from the first chunk to the end, or None if no chunk arrived.
+    - Errors that escaped the generation's tasks."""
+    screen.cur = prompt
+    screen.messages = [node.to_msg() for node in screen.tree.path(prompt)]
+    refresh = MainScreen.MainScreen._refresh.__get__(screen)
+
+    def timed():
+        start = time.perf_counter()
+        refresh()
+        frames.append((time.perf_counter() - start) * 1000)
+    screen._refresh = timed
+    screen._generate(n)
+    generation = screen.generation
+    outcomes = await asyncio.gather(*generation.tasks, return_exceptions=True)
+    end = time.time()
+    first = [t for t in generation._first if t is not None]
+    escaped = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    return generation, end - min(first) if first else None, escaped
+
+
+async def run_rate(rate: float, args, profiler: cProfile.Profile = None):
+    """Streams args.runs generations from a server sending rate tokens per second. Returns a dictionary of results."""
+    options = ["--rate", f"{rate:g}", "--tokens", str(args.tokens), "--chunk", str(args.chunk), "--latency", f"{args.latency:g}", "--seed", str(args.seed)]
+    if args.markdown:
+        options.append("--markdown")
+    frames = []
+    tokens = chunks = 0
+    streaming = busy = cpu = 0.0
+    written = 0
+    async with _Server(options) as server:
+        screen, prompt = _screen(server.url)
+        await screen.client.get()
+        output = screen.console.file
+        _flushes.clear()
+        wall = time.perf_counter()
+        for _ in range(args.runs):
+            output.seek(0)
+            output.truncate()
+            cpu_start = time.process_time()
+            start = time.perf_counter()
+            if profiler:
+                profiler.enable()
+            generation, seconds, _ = await _run(screen, prompt, args.alternatives, frames)
+            if profiler:
+                profiler.disable()
+            cpu += time.process_time() - cpu_start
+            busy += time.perf_counter() - start
+            streaming += seconds or 0
+            chunks += sum(len(renderer.chunks) for renderer in generation.renderers)
+            tokens += sum(usage.completion_tokens for usage in generation._usage if usage)
+            written += output.tell()
+        wall = time.perf_counter() - wall
+    flushes = list(_flushes)
+    rate_per_s = tokens / streaming if streaming else None
+    return {
+        'tokens': tokens,
+        'chunks': chunks,
+        'tokens_per_s': rate_per_s,
+        'sustained': rate_per_s / (rate * args.alternatives) if rate and rate_per_s else None,
+        'chunk_overhead_us': cpu / chunks * 1e6 if chunks else None,
+        'client_cpu_pct': cpu / busy * 100 if busy else None,
+        'server_cpu_pct': server.stats.get('cpu_s', 0) / wall * 100,
+        'frames': len(frames) / args.runs,
+        'frame_ms': statistics.median(frames) if frames else None,
+        'frame_p95_ms': statistics.quantiles(frames, n=20)[-1] if len(frames) > 1 else None,
+        'flush_ms': statistics.median(flushes) if flushes else None,
+        'terminal_kb': written / args.runs / 1024,
+    }
+
+
+async def run_errors(args):
+    """Streams args.error_runs generations from a server injecting errors with probability args.errors each. Returns a dictionary of results."""
+    options = ["--rate", "0", "--tokens", str(args.tokens), "--chunk", str(args.chunk), "--seed", str(args.seed), "--retry-after", "0",
+               "--error-429", f"{args.errors:g}", "--error-500", f"{args.errors:g}", "--disconnect", f"{args.errors:g}"]
+    results = {'generations': args.error_runs, 'complete': 0, 'partial': 0, 'failed': 0, 'escaped': 0}
+    async with _Server(options) as server:
+        screen, prompt = _screen(server.url)
+        await screen.client.get()
+        for _ in range(args.error_runs):
+            generation, _, escaped = await _run(screen, prompt, args.alternatives, [])
+            results['escaped'] += len(escaped)
+            if not generation.errors:
+                results['complete'] += 1
+            elif generation.nodes:
+                results['partial'] += 1
+            else:
+                results['failed'] += 1
+    results['requests'] = server.stats.get('requests', 0)
+    results['retries'] = results['requests'] - args.error_runs * args.alternatives
+    for name in ('429', '500', 'disconnects'):
+        results[f'server_{name}'] = server.stats.get(name, 0)
+    return results
+
+
+async def run(args):
+    profiler = cProfile.Profile() if args.profile else None
+    results = {}
+    for rate in (float(rate) for rate in args.rates.split(",")):
+        name = f"rate_{rate:g}" if rate else "rate_max"
+        results[name] = await run_rate(rate, args, profiler)
+    if args.errors:
+        results['errors'] = await run_errors(args)
+    await apiClient.http_client().aclose()
+    if profiler:
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("tottime").print_stats(25)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", default="100,1000,10000,0", help="comma separated tokens per second per reply, 0 for as fast as possible")
+    parser.add_argument("--tokens", type=int, default=500, help="tokens per reply")
+    parser.add_argument("--chunk", type=int, default=1, help="tokens per streamed chunk")
+    parser.add_argument("--latency", type=float, default=0, help="seconds before a reply starts")
+    parser.add_argument("--markdown", action="store_true", help="stream markdown with lists and code blocks instead of plain words")
+    parser.add_argument("--runs", type=int, default=3, help="generations per rate")
+    parser.add_argument("--alternatives", type=int, default=1, help="replies streamed at once per generation")
+    parser.add_argument("--errors", type=float, default=0, help="probability of each injected error in the error run, 0 to skip it")
+    parser.add_argument("--error-runs", type=int, default=20, help="generations in the error run")
+    parser.add_argument("--backoff", type=float, default=0.01, help="base delay between retries in seconds, instead of the app's")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the server's errors and reply text")
+    parser.add_argument("--profile", action="store_true", help="print the functions that took the most time while streaming")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    apiClient.BACKOFF_BASE = args.backoff
+    StreamRenderer.flush = _timed_flush(StreamRenderer.flush)
+    directory = tempfile.mkdtemp(prefix="nodechat-bench-")
+    try:
+        autoSave.RECOVERY_PATH = directory
+        results = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    write_report(results, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Benchmark suite for tree I/O, rendering and navigation.
+
+For every tree shape (see benchmarks.trees) it measures, in milliseconds unless noted:
+- save_full_ms: SaveScreen.save writing the whole chat as a new journal (including its catalog and search index entries).
+- save_append_ms: SaveScreen.save after one message was added to an already saved chat.
+- serialize_ms: Msg_Node.iter_serialize turning the whole tree into legacy .json text.
+- load_journal_ms, load_journal_peak_kb: NewChat.load_file opening the journal (lazily, if it is large), and the peak memory it allocates.
+- load_json_ms, load_json_peak_kb: The same for the legacy .json chat.
+- render_cold_ms, render_warm_ms: Rendering a single message (Msg_Node.render), without and with the render cache.
+- update_renderables_ms: MainScreen._update_renderables after a navigation step.
+- key_to_frame_ms, key_to_frame_p95_ms: MainScreen.handle_input for a navigation key, until the frame is written; median and 95th percentile.
+- burst_ms: The same navigation keys arriving at once, as when an arrow key is held: all of them are handled, but only the last frame is drawn (see FrameRenderer.hold). burst_unbatched_ms is what they take with a frame each.
+
+Everything runs headless: chats are written to a temporary directory, and frames are drawn into a fixed size console that writes to memory. Results are printed as JSON on stdout (or written to --output), a readable summary goes to stderr. Pass --compare with the JSON of an earlier run to see what changed.
+
+Run from the repository root:
+    python -m benchmarks.suite [--shapes deep,wide,code] [--nodes 2000] [--repeat 5] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime
+
+import readchar
+from rich.console import Console
+
+import MainScreen
+import NewChat
+import autoSave
+import SaveScreen
+import UserSettings
+from conversationTree import Msg_Node
+from renderCache import RENDER_CACHE
+from terminalRenderer import RENDERER
+from benchmarks import trees
+
+WIDTH = 120
+HEIGHT = 40
+RENDER_SAMPLE = 20
+
+
+def _ms(start: float):
+    return (time.perf_counter() - start) * 1000
+
+
+def _median(fn, repeat: int):
+    """Calls fn repeat times, returns the median time a call took."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(_ms(start))
+    return statistics.median(times)
+
+
+def _peak_kb(fn):
+    """Calls fn once, returns the peak memory it allocated in KiB."""
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def _state(tree, cur: Msg_Node, file: str = None):
+    """Returns the state screens are constructed from (see Screen), holding a chat and a headless console."""
+    console = Console(file=io.StringIO(), width=WIDTH, height=HEIGHT, force_terminal=True, color_system="truecolor")
+    return types.SimpleNamespace(
+        cur=cur,
+        messages=[node.to_msg() for node in tree.path(cur)],
+        settings=dict(UserSettings.SettingsScreen.default),
+        console=console,
+        file=file,
+        tree=tree,
+        client=None,
+    )
+
+
+def _save(state, file: str):
+    """Saves the chat held by state to file, the way SaveScreen does it."""
+    state.file = file
+    asyncio.run(SaveScreen.SaveScreen(state, cont=False).save())
+
+
+def _navigation(screen, steps: int):
+    """Yields navigation keys for screen, deciding each one after the previous was handled: up the branch, back down, then through the current message's siblings. RIGHT is never pressed on the last sibling, as that would generate a reply."""
+    for _ in range(steps):
+        if not screen.cur.prev:
+            break
+        yield readchar.key.UP
+    for _ in range(steps):
+        if not screen.cur.next:
+            break
+        yield readchar.key.DOWN
+    for _ in range(steps):
+        if not screen.cur.prev or screen.cur.index >= len(screen.cur.prev.next):
+            break
+        yield readchar.key.RIGHT
+    for _ in range(steps):
+        if screen.cur.index <= 1:
+            break
+        yield readchar.key.LEFT
+
+
+def _render_times(console, nodes: list):
+    """Renders every node once, returns the median time per node."""
+    times = []
+    for node in nodes:
+        start = time.perf_counter()
+        list(console.render(node.render()))
+        times.append(_ms(start))
+    return statistics.median(times)
+
+
+def run_shape(shape: str, args, directory: str):
+    """Builds a tree of the given shape and runs every measurement on it. Returns a dictionary of results."""
+    tree, cur = trees.build(shape, args.nodes, branching=args.branching, length=args.length, code_lines=args.code_lines)
+    root = tree.root
+    results = {'nodes': len(tree.nodes)}
+    state = _state(tree, cur)
+
+    journal = os.path.join(directory, f"{shape}.jsonl")
+    runs = iter(range(args.repeat))
+    results['save_full_ms'] = _median(lambda: _save(state, os.path.join(directory, f"{shape}-full{next(runs)}.jsonl")), args.repeat)
+    _save(state, journal)
+
+    results['serialize_ms'] = _median(lambda: "".join(root.iter_serialize(cur)), args.repeat)
+    legacy = os.path.join(directory, f"{shape}.json")
+    with open(legacy, 'w', encoding='utf-8') as f:
+        f.writelines(root.iter_serialize(cur))
+
+    for name, file in (('journal', journal), ('json', legacy)):
+        results[f'load_{name}_ms'] = _median(lambda: NewChat.load_file(file), args.repeat)
+        results[f'load_{name}_peak_kb'] = _peak_kb(lambda: NewChat.load_file(file))
+
+    sample = tree.path(cur)[-RENDER_SAMPLE:]
+    RENDER_CACHE.clear()
+    results['render_cold_ms'] = _render_times(state.console, sample)
+    results['render_warm_ms'] = _render_times(state.console, sample)
+
+    screen = MainScreen.MainScreen(state)
+    keys = []
+    updates = []
+    for key in _navigation(screen, args.steps):
+        screen.console.file.seek(0)
+        screen.console.file.truncate()
+        start = time.perf_counter()
+        screen.handle_input(key)
+        keys.append(_ms(start))
+        start = time.perf_counter()
+        screen._update_renderables()
+        updates.append(_ms(start))
+    results['navigation_steps'] = len(keys)
+    results['update_renderables_ms'] = statistics.median(updates) if updates else None
+    results['key_to_frame_ms'] = statistics.median(keys) if keys else None
+    results['key_to_frame_p95_ms'] = statistics.quantiles(keys, n=20)[-1] if len(keys) > 1 else None
+
+    state.messages = [node.to_msg() for node in tree.path(cur)]
+    screen = MainScreen.MainScreen(state)
+    start = time.perf_counter()
+    with RENDERER.hold():
+        for key in _navigation(screen, args.steps):
+            screen.handle_input(key)
+    results['burst_ms'] = _ms(start)
+    results['burst_unbatched_ms'] = sum(keys)
+
+    def append():
+        state.cur = Msg_Node(state.cur, "user" if state.cur.role != "user" else "assistant", "One more message.", datetime.now().strftime("%Y-%m-%d %H:%M:%S"), state.cur.depth + 1)
+        tree.add(state.cur)
+        _save(state, journal)
+    state.cur = cur
+    results['save_append_ms'] = _median(append, args.repeat)
+    return results
+
+
+def _summary(results: dict, baseline: dict = None):
+    """Writes the results as a table to stderr; With a baseline, every value is followed by its change."""
+    for shape, values in results.items():
+        print(f"{shape}:", file=sys.stderr)
+        old = (baseline or {}).get(shape, {})
+        for metric, value in values.items():
+            line = f"    {metric:24} {value:12.2f}" if isinstance(value, float) else f"    {metric:24} {value!s:>12}"
+            if isinstance(value, (int, float)) and isinstance(old.get(metric), (int, float)) and old[metric]:
+                line += f"   {old[metric]:12.2f} before, {value / old[metric] - 1:+.0%}"
+            print(line, file=sys.stderr)
+
+
+def write_report(results: dict, args):
+    """Prints the results as JSON on stdout (or writes them to args.output) along with the run's settings, and their summary to stderr, compared with args.compare if it is set."""
+    report = {
+        'meta': {
+            'time': datetime.now().isoformat(timespec="seconds"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': {name: value for name, value in vars(args).items() if name not in ("output", "compare")},
+        },
+        'results': results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    _summary(results, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shapes", default=",".join(trees.SHAPES), help="comma separated tree shapes to run")
+    parser.add_argument("--nodes", type=int, default=2000, help="messages per tree")
+    parser.add_argument("--branching", type=int, default=4, help="replies per message in wide trees")
+    parser.add_argument("--length", type=int, default=400, help="characters of prose per message")
+    parser.add_argument("--code-lines", type=int, default=60, help="lines per code block in code trees")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per timing, the median is reported")
+    parser.add_argument("--steps", type=int, default=30, help="key presses per navigation direction")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="nodechat-bench-")
+    try:
+        SaveScreen.CHATS_PATH = directory
+        autoSave.RECOVERY_PATH = os.path.join(directory, "recovery")
+        results = {shape: run_shape(shape, args, directory) for shape in args.shapes.split(",")}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    write_report(results, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Synthetic conversation trees for the benchmarks.
+
+Every shape is built from seeded random text, so runs with the same arguments get the same trees (apart from node IDs):
+- deep: a single branch, every message answers the previous one.
+- wide: a tree where every message has --branching alternative replies, filled breadth first.
+- code: a single branch of fewer but large messages; every reply holds fenced code blocks of --code-lines lines, which is what makes rendering expensive.
+"""
+import random
+from collections import deque
+from datetime import datetime, timedelta
+
+from conversationTree import Msg_Node, TreeIndex
+
+WORDS = ("the", "tree", "branch", "message", "model", "reply", "context", "token", "render", "python", "function",
+         "value", "list", "index", "cache", "stream", "prompt", "answer", "question", "because", "which", "would")
+START = datetime(2025, 1, 1)
+
+
+def _prose(rng: random.Random, length: int):
+    """Returns about length characters of markdown prose: sentences, now and then a bold word or a bullet list."""
+    parts = []
+    size = 0
+    while size < length:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(6, 16))]
+        if rng.random() < 0.2:
+            words[-1] = f"**{words[-1]}**"
+        sentence = " ".join(words).capitalize() + "."
+        if rng.random() < 0.1:
+            sentence += "\n\n" + "\n".join(f"- {rng.choice(WORDS)} {rng.choice(WORDS)}" for _ in range(3)) + "\n\n"
+        parts.append(sentence)
+        size += len(sentence) + 1
+    return " ".join(parts)
+
+
+def _code(rng: random.Random, lines: int):
+    """Returns a fenced python code block of the given number of lines."""
+    body = []
+    for i in range(lines):
+        indent = "    " * min(3, i % 4)
+        name = rng.choice(WORDS)
+        body.append(f"{indent}{name}_{i} = [{rng.choice(WORDS)!r} for _ in range({rng.randint(1, 99)})]  # {rng.choice(WORDS)}")
+    return "```python\n" + "\n".join(body) + "\n```"
+
+
+class _Builder:
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.tree = TreeIndex()
+        self.count = 0
+
+    def add(self, prev: Msg_Node, content: str):
+        role = "system" if prev is None else ("user" if prev.role != "user" else "assistant")
+        time = (START + timedelta(seconds=self.count)).strftime("%Y-%m-%d %H:%M:%S")
+        node = Msg_Node(prev, role, content, time, prev.depth + 1 if prev else 0)
+        self.tree.add(node)
+        self.count += 1
+        return node
+
+
+def deep(nodes: int, length: int = 400, seed: int = 0, **_):
+    builder = _Builder(seed)
+    node = builder.add(None, "You are a helpful assistant.")
+    for _ in range(nodes - 1):
+        node = builder.add(node, _prose(builder.rng, length))
+    return builder.tree, node
+
+
+def wide(nodes: int, branching: int = 4, length: int = 400, seed: int = 0, **_):
+    builder = _Builder(seed)
+    root = builder.add(None, "You are a helpful assistant.")
+    queue = deque([root])
+    last = root
+    while builder.count < nodes:
+        parent = queue.popleft()
+        for _ in range(min(branching, nodes - builder.count)):
+            last = builder.add(parent, _prose(builder.rng, length))
+            queue.append(last)
+    return builder.tree, last
+
+
+def code(nodes: int, code_lines: int = 60, length: int = 400, seed: int = 0, **_):
+    builder = _Builder(seed)
+    node = builder.add(None, "You are a helpful programming assistant.")
+    for _ in range(nodes - 1):
+        if node.role == "user":
+            content = "\n\n".join((_prose(builder.rng, length // 2), _code(builder.rng, code_lines), _prose(builder.rng, length // 2), _code(builder.rng, code_lines // 2)))
+        else:
+            content = _prose(builder.rng, length // 2)
+        node = builder.add(node, content)
+    return builder.tree, node
+
+
+SHAPES = {"deep": deep, "wide": wide, "code": code}
+
+
+def build(shape: str, nodes: int, **options):
+    """Builds a tree of the given shape.
+
+    Returns:
+    - The tree's TreeIndex.
+    - The node a chat of that shape would be saved at: the end of the branch, or the last node added."""
+    return SHAPES[shape](nodes, **options)
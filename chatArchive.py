@@ -0,0 +1,282 @@
+import json
+import lzma
+import os
+import struct
+import threading
+import time
+import zlib
+
+import chatCatalog
+import chatJournal
+import contentStore
+from conversationTree import TreeIndex
+
+PACK_NAME = "archive.pack"
+MAGIC = b"NCPACK1\n"
+HEADER = struct.Struct("<8sQQ")
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 9), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+CODEC = "zlib"
+COMPACT_MIN_BYTES = 1 << 20
+COMPACT_RATIO = 0.5
+
+_archives = {}
+
+
+def is_archived(path: str):
+    """Returns True if path names a chat inside a pack archive rather than a loose chat file. Archived chats are addressed as if the pack were a directory: <chats>/archive.pack/<chat file name>."""
+    return os.path.basename(os.path.dirname(path)) == PACK_NAME
+
+
+def exists(path: str):
+    """Returns True if path is an archived chat that is in its pack."""
+    return is_archived(path) and os.path.basename(path) in get_archive(os.path.dirname(os.path.dirname(path))).load()
+
+
+class ChatArchive:
+    """A single compressed file holding many chats, so thousands of old chats don't have to be kept (and scanned, and backed up) as loose files.
+
+    The pack starts with a fixed size header: a magic number, and the offset and length of the index. The index is compressed JSON listing, for every chat file name, where its compressed bytes are, how they were compressed, a checksum, and the chat's catalog entry; So the chat list never has to decompress a chat, and loading one only decompresses that one. Chats are stored exactly as their loose files were, journal or legacy .json.
+
+    Archiving appends the new chats and a new index to the end of the pack, and only then points the header at the new index; Unarchiving just writes an index without the chat. A crash in between leaves the old index in charge. Space taken up by old indexes and removed chats is reclaimed by rewriting the pack once it makes up a large part of it."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, PACK_NAME)
+        self.entries = {}
+        self.size = 0
+        self.live = 0
+        self._stat = None
+        self._order = None
+        self._lock = threading.RLock()
+
+    def load(self):
+        """Reads the index, unless the pack did not change since it was last read. Returns the entries by chat file name."""
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self.entries, self.size, self.live, self._stat, self._order = {}, 0, 0, None, None
+                return self.entries
+            if (stat.st_mtime_ns, stat.st_size) == self._stat:
+                return self.entries
+            with open(self.path, 'rb') as f:
+                magic, offset, length = HEADER.unpack(f.read(HEADER.size))
+                if magic != MAGIC:
+                    raise ValueError(f"{self.path} is not a chat archive")
+                f.seek(offset)
+                self.entries = json.loads(zlib.decompress(f.read(length)))['entries'] if length else {}
+            self.size = stat.st_size
+            self.live = sum(entry['length'] for entry in self.entries.values()) + length
+            self._stat = (stat.st_mtime_ns, stat.st_size)
+            self._order = None
+            return self.entries
+
+    def ordered(self):
+        """Returns the names of all archived chats, the most recently modified first."""
+        entries = self.load()
+        if self._order is None:
+            self._order = sorted(entries, key=lambda name: entries[name]['meta']['mtime'], reverse=True)
+        return self._order
+
+    def read(self, name: str):
+        """Returns the original bytes of an archived chat file, decompressing only that chat. Raises FileNotFoundError if it is not in the pack."""
+        with self._lock:
+            entry = self.load().get(name)
+            if entry is None:
+                raise FileNotFoundError(f"{name} is not in {self.path}")
+            with open(self.path, 'rb') as f:
+                f.seek(entry['offset'])
+                data = f.read(entry['length'])
+        data = CODECS[entry['codec']][1](data)
+        if zlib.crc32(data) != entry['crc']:
+            raise ValueError(f"{name} is damaged in {self.path}")
+        return data
+
+    def _commit(self, f, chunks: list):
+        """Appends chunks and a new index to the open pack, forces them to disk, then points the header at the new index."""
+        f.seek(0, os.SEEK_END)
+        offset = f.tell()
+        for name, data in chunks:
+            self.entries[name]['offset'] = offset
+            offset += len(data)
+            f.write(data)
+        index = zlib.compress(json.dumps({'entries': self.entries}, ensure_ascii=False).encode('utf-8'))
+        f.write(index)
+        f.flush()
+        os.fsync(f.fileno())
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, offset, len(index)))
+        f.flush()
+        os.fsync(f.fileno())
+        self.size = offset + len(index)
+        self.live = sum(entry['length'] for entry in self.entries.values()) + len(index)
+        stat = os.fstat(f.fileno())
+        self._stat = (stat.st_mtime_ns, stat.st_size)
+        self._order = None
+
+    def _write(self, chunks: list):
+        """Commits the entries in memory to the pack, creating it if there is none yet. If that fails, the entries are read from the pack again."""
+        try:
+            if not os.path.exists(self.path):
+                with open(self.path, 'wb') as f:
+                    f.write(HEADER.pack(MAGIC, HEADER.size, 0))
+            with open(self.path, 'r+b') as f:
+                self._commit(f, chunks)
+        except OSError:
+            self._stat = None
+            raise
+
+    def add(self, files: list, codec: str = CODEC):
+        """Moves loose chat files into the pack, replacing archived chats of the same name. A file is only deleted once the pack holding it is on disk.
+
+        Args:
+        - files: Tuples of a chat file's path and its catalog entry.
+        - codec: The compression to use, one of CODECS."""
+        chunks = []
+        with self._lock:
+            self.load()
+            for file, meta in files:
+                with open(file, 'rb') as f:
+                    raw = f.read()
+                name = os.path.basename(file)
+                data = CODECS[codec][0](raw)
+                self.entries[name] = {'offset': 0, 'length': len(data), 'size': len(raw), 'crc': zlib.crc32(raw), 'codec': codec, 'meta': meta}
+                chunks.append((name, data))
+            if not chunks:
+                return
+            self._write(chunks)
+            for file, _ in files:
+                chatJournal.forget(file)
+                for path in (file, file + chatJournal.INDEX_EXT):
+                    if os.path.exists(path):
+                        os.remove(path)
+            self._compact()
+
+    def extract(self, name: str):
+        """Moves an archived chat back to a loose file in the chat directory, with its original modification time.
+
+        Returns:
+        - The path of the loose file.
+        - The chat's catalog entry.
+        Raises FileExistsError if a loose chat of the same name exists."""
+        with self._lock:
+            data = self.read(name)
+            entry = self.entries[name]
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path):
+                raise FileExistsError(f"{path} already exists")
+            tmp = path + ".tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.utime(tmp, (entry['meta']['mtime'], entry['meta']['mtime']))
+            os.replace(tmp, path)
+            meta = dict(entry['meta'], mtime=os.stat(path).st_mtime)
+            del self.entries[name]
+            self._write([])
+            self._compact()
+            return path, meta
+
+    def _compact(self):
+        """Rewrites the pack without the space old indexes and removed chats take up, if there is enough of it. Chats are copied as they are, without decompressing them."""
+        dead = self.size - HEADER.size - self.live
+        if dead < max(COMPACT_MIN_BYTES, COMPACT_RATIO * self.size):
+            return
+        tmp = self.path + ".tmp"
+        with open(self.path, 'rb') as f, open(tmp, 'w+b') as out:
+            out.write(HEADER.pack(MAGIC, HEADER.size, 0))
+            chunks = []
+            for name, entry in self.entries.items():
+                f.seek(entry['offset'])
+                chunks.append((name, f.read(entry['length'])))
+            self._commit(out, chunks)
+        os.replace(tmp, self.path)
+        stat = os.stat(self.path)
+        self._stat = (stat.st_mtime_ns, stat.st_size)
+
+
+def get_archive(directory: str):
+    """Returns the pack archive of a chat directory, whether or not it exists yet."""
+    archive = _archives.get(directory)
+    if archive is None:
+        archive = _archives[directory] = ChatArchive(directory)
+    return archive
+
+
+def read_tree(path: str, cur_id: str = None, index: TreeIndex = None):
+    """Loads an archived chat, see chatJournal.read_tree for the arguments and return values; Like chatJournal.load, it raises ValueError if no message could be read. As the whole chat is in memory anyway, legacy .json chats are parsed in one go rather than streamed (see chatJournal.parse_legacy)."""
+    name = os.path.basename(path)
+    directory = os.path.dirname(os.path.dirname(path))
+    data = get_archive(directory).read(name)
+    if not chatJournal.is_journal(name):
+        return chatJournal.parse_legacy(data, cur_id, index)
+
+    def records():
+        for line in data.splitlines():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                pass
+    root, cur = chatJournal.replay(records(), cur_id, index, contentStore.get_store(directory))
+    if root is None:
+        raise ValueError(f"{path} holds no messages")
+    return root, cur
+
+
+def archive(file: str):
+    """Moves a loose chat file into its directory's pack archive, along with its catalog entry."""
+    directory = os.path.dirname(file)
+    catalog = chatCatalog.get_catalog(directory)
+    catalog.refresh()
+    meta = catalog.chats[os.path.basename(file)]
+    get_archive(directory).add([(file, meta)])
+    catalog.refresh()
+
+
+def unarchive(path: str):
+    """Moves an archived chat back to a loose file. Its catalog entry comes along, so the file is not read again to list it.
+
+    Returns:
+    The path of the loose file."""
+    directory = os.path.dirname(os.path.dirname(path))
+    file, meta = get_archive(directory).extract(os.path.basename(path))
+    catalog = chatCatalog.get_catalog(directory)
+    catalog.chats[os.path.basename(file)] = meta
+    catalog.refresh()
+    return file
+
+
+def locate(file: str):
+    """Returns where a chat is now, as it may have been archived or unarchived since its path was noted: file itself, its archived or loose counterpart, or None if neither exists."""
+    if os.path.exists(file) or exists(file):
+        return file
+    if is_archived(file):
+        loose = os.path.join(os.path.dirname(os.path.dirname(file)), os.path.basename(file))
+        return loose if os.path.exists(loose) else None
+    archived = os.path.join(get_archive(os.path.dirname(file)).path, os.path.basename(file))
+    return archived if exists(archived) else None
+
+
+def archive_inactive(directory: str, days: float, exclude=()):
+    """Archives all loose chats of a directory that were not modified for the given number of days, in one go. The most recently modified chat always stays loose.
+
+    Args:
+    - directory: The chat directory.
+    - days: How long a chat has to be inactive to be archived.
+    - exclude: Optional paths of chats that stay loose, like the one that is open.
+
+    Returns:
+    How many chats were archived."""
+    catalog = chatCatalog.get_catalog(directory)
+    catalog.refresh()
+    cutoff = time.time() - days * 86400
+    files = [(os.path.join(directory, name), meta) for name, meta in catalog.chats.items()
+             if meta['mtime'] < cutoff and name != catalog.recent and os.path.join(directory, name) not in exclude]
+    if files:
+        get_archive(directory).add(files)
+        catalog.refresh()
+    return len(files)
@@ -0,0 +1,147 @@
+import json
+import os
+
+import chatJournal
+import requestStats
+
+CATALOG_NAME = ".catalog.json"
+CHAT_EXTS = (".json", chatJournal.JOURNAL_EXT)
+PREVIEW_LEN = 80
+
+_catalogs = {}
+
+
+def _title(file: str):
+    return os.path.basename(file).split('.')[0]
+
+
+def preview(text: str):
+    """Returns the first PREVIEW_LEN characters of a message on a single line."""
+    text = " ".join(text.split())
+    return text if len(text) <= PREVIEW_LEN else text[:PREVIEW_LEN - 1] + "…"
+
+
+def iter_nodes(root):
+    """Yields every node of a tree. Branches of lazily opened chats that were not visited yet are read from disk."""
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        node.ensure_loaded()
+        yield node
+        stack.extend(node.next)
+
+
+class ChatCatalog:
+    """A persistent index of all chats in a directory, stored next to them. For every chat it keeps the title, modification time, node count, a preview of the current message, the model used and the summed up request stats per model, so listing chats (or comparing models) does not require opening them. The directory is only rescanned if its modification time changed, and only files whose own modification time changed get parsed again."""
+
+    def __init__(self, directory: str):
+        """Loads the catalog of a chat directory, or starts an empty one if none exists yet."""
+        self.directory = directory
+        self.path = os.path.join(directory, CATALOG_NAME)
+        self.dir_mtime = None
+        self.recent = None
+        self.chats = {}
+        self._order = None
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.dir_mtime = data['dir_mtime']
+                self.recent = data['recent']
+                self.chats = data['chats']
+            except (ValueError, KeyError):
+                pass
+
+    def refresh(self):
+        """Makes sure the catalog matches the directory. If the directory's modification time did not change since the last check this costs a single stat call."""
+        dir_mtime = os.stat(self.directory).st_mtime
+        if dir_mtime == self.dir_mtime:
+            return
+        chats = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.name.endswith(CHAT_EXTS):
+                    continue
+                mtime = entry.stat().st_mtime
+                old = self.chats.get(entry.name)
+                if old and old['mtime'] == mtime:
+                    chats[entry.name] = old
+                else:
+                    chats[entry.name] = self._describe(entry.path, mtime, old)
+        self.chats = chats
+        self.dir_mtime = dir_mtime
+        readable = [name for name in chats if chats[name]['nodes']]
+        self.recent = max(readable, key=lambda name: chats[name]['mtime']) if readable else None
+        self._order = None
+        self._store()
+
+    def _describe(self, file: str, mtime: float, old: dict = None):
+        """Reads a chat file to collect its catalog entry. The model is kept from the old entry, as it is not stored in the chat itself. Files that can't be read, or hold no messages, get an empty entry."""
+        try:
+            root, cur = chatJournal.read_tree(file, track=False)
+        except (OSError, ValueError, KeyError):
+            return {'title': _title(file), 'mtime': mtime, 'nodes': 0, 'preview': "", 'model': "", 'usage': {}}
+        cur = cur or root
+        nodes = list(iter_nodes(root))
+        return {
+            'title': _title(file),
+            'mtime': mtime,
+            'nodes': len(nodes),
+            'preview': preview(cur.content),
+            'model': old['model'] if old else "",
+            'usage': requestStats.aggregate(nodes),
+        }
+
+    def update(self, file: str, nodes: int, cur, model: str, replaces: str = None, added = (), fresh: bool = False):
+        """Updates the entry of a single chat right after it was saved.
+
+        Args:
+        - file: Path of the saved chat.
+        - nodes: The amount of message nodes in the chat.
+        - cur: The current message node.
+        - model: The model currently in use.
+        - replaces: Optional path of a chat file that was removed by this save, for example a converted legacy chat.
+        - added: The message nodes this save wrote; Their request stats are added to the entry's.
+        - fresh: Whether the file was written from scratch, so the old entry's stats no longer apply."""
+        name = os.path.basename(file)
+        mtime = os.stat(file).st_mtime
+        old = self.chats.get(name)
+        usage = requestStats.merge({}, old.get('usage', {})) if old and not fresh else {}
+        self.chats[name] = {
+            'title': _title(file),
+            'mtime': mtime,
+            'nodes': nodes,
+            'preview': preview(cur.content),
+            'model': model,
+            'usage': requestStats.merge(usage, requestStats.aggregate(added)),
+        }
+        if replaces:
+            self.chats.pop(os.path.basename(replaces), None)
+        self.recent = name
+        self._order = None
+        self._store()
+
+    def most_recent(self):
+        """Returns the path of the most recently saved chat, or None if there are no chats."""
+        self.refresh()
+        return os.path.join(self.directory, self.recent) if self.recent else None
+
+    def ordered(self):
+        """Returns the names of all chats, the most recently modified first."""
+        self.refresh()
+        if self._order is None:
+            self._order = sorted(self.chats, key=lambda name: self.chats[name]['mtime'], reverse=True)
+        return self._order
+
+    def _store(self):
+        """Writes the catalog to disk. The file is rewritten in place rather than replaced, as renaming would change the directory's modification time and force a rescan; A damaged catalog is simply rebuilt."""
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'dir_mtime': self.dir_mtime, 'recent': self.recent, 'chats': self.chats}, f, ensure_ascii=False)
+
+
+def get_catalog(directory: str):
+    """Returns the catalog of a chat directory, loading it on first use."""
+    catalog = _catalogs.get(directory)
+    if catalog is None:
+        catalog = _catalogs[directory] = ChatCatalog(directory)
+    return catalog
@@ -0,0 +1,198 @@
+"""Exports saved chats as JSONL datasets, without starting the app.
+
+Every chat in the chat directory (loose and archived, see chatArchive) is read in a pool of worker processes, one chat per task, and turned into records in one of these modes:
+- paths: One record per conversation, from the root to every leaf of the tree: {"chat", "id", "messages"}, where id is the leaf's and messages are {"role", "content"} dictionaries.
+- current: The same, but only for the branch that was current when the chat was saved.
+- pairs: Preference pairs from alternative replies: {"chat", "id", "prompt", "chosen", "rejected"}, where prompt holds the messages before the alternatives and id is the last one's. The alternative that was kept is the one on the current branch, or else the only one the conversation went on from; Every other alternative becomes a rejected reply. Alternatives where neither applies are skipped.
+
+Records are written in the order of the chat files' names, as one JSON object per line. Workers write the records of their chat to a temporary file as they go, which the output is then copied from, so neither a worker nor the main process holds all records of a chat at once.
+
+Run from the repository root:
+    python chatExport.py [--mode paths|current|pairs] [--output dataset.jsonl] [--workers 4] [--directory ./userInfo/chats]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import chatArchive
+import chatCatalog
+import chatJournal
+
+CHATS_PATH = "./userInfo/chats"
+MODES = ("paths", "current", "pairs")
+
+
+def chat_files(directory: str):
+    """Returns the paths of all chats in a directory, loose and archived, sorted by file name. Nothing but the directory and the archive's index is read; An archive that can't be read is skipped with a warning."""
+    with os.scandir(directory) as entries:
+        loose = [entry.path for entry in entries if not entry.name.startswith('.') and entry.name.endswith(chatCatalog.CHAT_EXTS)]
+    archive = chatArchive.get_archive(directory)
+    archived = []
+    if os.path.exists(archive.path):
+        try:
+            archived = [os.path.join(archive.path, name) for name in archive.load()]
+        except (OSError, ValueError) as e:
+            print(f"Skipped {archive.path}: {type(e).__name__}: {e}", file=sys.stderr)
+    return sorted(loose + archived, key=os.path.basename)
+
+
+def read_tree(path: str):
+    """Reads a whole chat, loose or archived. Returns its root and current message (the root, if the current message is not found). Legacy .json chats are parsed in one go, which is faster than streaming them and takes up memory for just this one chat. Raises ValueError if the chat holds no messages."""
+    if chatArchive.is_archived(path):
+        root, cur = chatArchive.read_tree(path)
+    elif chatJournal.is_journal(path):
+        root, cur = chatJournal.read_tree(path, track=False)
+    else:
+        with open(path, 'rb') as f:
+            root, cur = chatJournal.parse_legacy(f.read())
+    return root, cur or root
+
+
+def _branch(cur):
+    """Returns the nodes from the root to cur."""
+    nodes = []
+    while cur:
+        nodes.append(cur)
+        cur = cur.prev
+    nodes.reverse()
+    return nodes
+
+
+def _walk(root):
+    """Yields every node of a tree together with the messages leading up to it (itself included). The list is shared and changes as the walk goes on, so copy what has to be kept. This uses an explicit stack, so deep chats don't hit Python's recursion limit."""
+    messages = []
+    stack = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        del messages[depth:]
+        messages.append(node.to_msg())
+        yield node, messages
+        stack.extend((child, depth + 1) for child in reversed(node.next))
+
+
+def _chosen(alternatives: list, current: set):
+    """Returns the alternative reply that was kept: the one on the current branch, or else the only one the conversation went on from; None if neither applies."""
+    for node in alternatives:
+        if node in current:
+            return node
+    continued = [node for node in alternatives if node.next]
+    return continued[0] if len(continued) == 1 else None
+
+
+def chat_records(path: str, mode: str):
+    """Yields the dataset records of a single chat, see the module's description for the modes. Only this chat's tree is held in memory."""
+    root, cur = read_tree(path)
+    name = os.path.basename(path)
+    if mode == "current":
+        yield {'chat': name, 'id': cur.id, 'messages': [node.to_msg() for node in _branch(cur)]}
+        return
+    current = set(_branch(cur)) if mode == "pairs" else None
+    for node, messages in _walk(root):
+        if mode == "paths":
+            if not node.next:
+                yield {'chat': name, 'id': node.id, 'messages': list(messages)}
+            continue
+        alternatives = [child for child in node.next if child.role == "assistant"]
+        if len(alternatives) < 2:
+            continue
+        chosen = _chosen(alternatives, current)
+        if chosen is None:
+            continue
+        for rejected in alternatives:
+            if rejected is not chosen:
+                yield {'chat': name, 'id': node.id, 'prompt': list(messages), 'chosen': chosen.to_msg(), 'rejected': rejected.to_msg()}
+
+
+def _export_chat(path: str, mode: str, directory: str):
+    """Runs in a worker process: Writes the records of a chat as lines of JSON to a new temporary file in directory, one record at a time. Any error is caught, so one broken chat never ends the whole export.
+
+    Returns:
+    - The path of the chat.
+    - The temporary file, or None if the chat could not be read.
+    - An error message if it could not be read, None otherwise."""
+    fd, tmp = tempfile.mkstemp(suffix=".jsonl", dir=directory)
+    try:
+        with open(fd, 'w', encoding='utf-8') as out:
+            for record in chat_records(path, mode):
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return path, tmp, None
+    except Exception as e:
+        os.remove(tmp)
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+def _lines(results, errors: list):
+    """Yields the lines of the files _export_chat wrote, removing each once it is read, and notes their errors."""
+    for path, tmp, error in results:
+        if error and errors is not None:
+            errors.append((path, error))
+        if tmp is None:
+            continue
+        try:
+            with open(tmp, 'r', encoding='utf-8') as f:
+                yield from f
+        finally:
+            os.remove(tmp)
+
+
+def export(files: list, mode: str, workers: int = None, errors: list = None):
+    """Yields the dataset records of many chats as lines of JSON, in the order of files. The chats are read in a pool of worker processes, one chat per task; At most two tasks per worker are in flight at once, so results never pile up faster than they are consumed.
+
+    Args:
+    - files: The chat files.
+    - mode: One of MODES.
+    - workers: The number of worker processes, by default one per CPU; 0 reads the chats in this process instead.
+    - errors: Optional list that gets a tuple of path and error message for every chat that could not be read."""
+    with tempfile.TemporaryDirectory(prefix="nodechat-export-") as directory:
+        if workers == 0:
+            results = (_export_chat(path, mode, directory) for path in files)
+            yield from _lines(results, errors)
+            return
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(workers) as pool:
+            window = 2 * workers
+            pending = deque()
+            paths = iter(files)
+
+            def results():
+                for path in paths:
+                    pending.append(pool.submit(_export_chat, path, mode, directory))
+                    if len(pending) >= window:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            yield from _lines(results(), errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=MODES, default="paths", help="which records to export")
+    parser.add_argument("--output", help="write the records to this file instead of stdout")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, by default one per CPU; 0 for none")
+    parser.add_argument("--directory", default=CHATS_PATH, help="the chat directory")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    files = chat_files(args.directory)
+    errors = []
+    records = 0
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for line in export(files, args.mode, args.workers, errors):
+            out.write(line)
+            records += 1
+    finally:
+        if args.output:
+            out.close()
+    for path, error in errors:
+        print(f"Skipped {path}: {error}", file=sys.stderr)
+    print(f"Exported {records} records from {len(files) - len(errors)} chats in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,557 @@
+import io
+import json
+import os
+import sys
+import threading
+
+import contentStore
+from conversationTree import Msg_Node, TreeIndex, _adopt, _pack_id, deserialize, stream_deserialize
+
+JOURNAL_EXT = ".jsonl"
+INDEX_EXT = ".idx"
+COMPACT_MIN_RECORDS = 256
+COMPACT_RATIO = 2
+LAZY_MIN_SIZE = 1 << 18
+
+_journals = {}
+
+
+def is_journal(file: str):
+    """Returns True if the given chat file uses the append-only journal format, False for legacy .json chats."""
+    return file.endswith(JOURNAL_EXT)
+
+
+def journal_path(file: str):
+    """Given any chat file path, return the path its journal lives at."""
+    return os.path.splitext(file)[0] + JOURNAL_EXT
+
+
+def node_record(node: Msg_Node, store: contentStore.ContentStore = None):
+    """Returns the journal record describing a single message node. Its children are not included, they get records of their own.
+
+    Args:
+    node: The message node.
+    store: Optional content store of the chat's directory. Long system prompts are put there, and the record only refers to them by hash ('ref').
+
+    Edits kept as deltas are written as such ('delta'); Any other text is written in full ('content')."""
+    record = {
+        'op': 'node',
+        'id': node.id,
+        'prev': node.prev.id if node.prev else None,
+        'index': node.index,
+        'role': node.role,
+        'time': node.time,
+        'depth': node.depth,
+    }
+    content = node._content
+    if isinstance(content, contentStore.Delta):
+        record['delta'] = content.to_record()
+    elif store is not None and node.role == "system" and content and len(content) >= contentStore.SHARE_MIN_SIZE:
+        record['ref'] = store.put(content)
+    else:
+        record['content'] = content
+    if node.stats:
+        record['stats'] = node.stats
+    if node.pinned:
+        record['pinned'] = True
+    return record
+
+
+def cur_record(cur_id: str):
+    """Returns the journal record marking the message with cur_id as the current one."""
+    return {'op': 'cur', 'id': cur_id}
+
+
+def pin_record(node: Msg_Node):
+    """Returns the journal record noting that a message that is on disk already was pinned or unpinned."""
+    return {'op': 'pin', 'id': node.id, 'pinned': node.pinned}
+
+
+def _dump(record: dict):
+    return (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+
+
+def _scan(f, offset: int = 0, limit: int = None):
+    """Yields all complete records of an open journal file, together with their position. A torn last line (for example after a crash mid-write) is skipped.
+
+    Args:
+    f: The journal, opened in binary mode and positioned at offset.
+    offset: The byte offset reading starts at.
+    limit: Optional byte offset at which to stop reading.
+
+    Yields:
+    Tuples of the record's byte offset, its length in bytes, and the record itself."""
+    for line in f:
+        if limit is not None and offset + len(line) > limit:
+            return
+        try:
+            yield offset, len(line), json.loads(line)
+        except ValueError:
+            pass
+        offset += len(line)
+
+
+def _record_content(record: dict, siblings = (), store: contentStore.ContentStore = None):
+    """Returns the text of a node record, or the Delta it is stored as. The message an edit is based on is one of its siblings, and comes before it, so it is among the siblings read already. Raises ValueError if a record refers to a text that is missing."""
+    if 'delta' in record:
+        key = _pack_id(record['delta']['base'])
+        base = next((node for node in siblings if node._id == key), None)
+        if base is None:
+            raise ValueError(f"The message {record['delta']['base']} that message {record['id']} is an edit of is missing")
+        return contentStore.Delta(base, record['delta']['ops'])
+    if 'ref' in record:
+        if store is None:
+            raise ValueError(f"Message {record['id']} refers to a stored text, but there is no content store")
+        return store.get(record['ref'])
+    return record['content']
+
+
+def _from_record(record: dict, prev: Msg_Node = None, store: contentStore.ContentStore = None, siblings: list = None):
+    """Builds the message node a record describes, as a child of prev. Loaders that read many nodes pass the list of prev's children read so far as siblings: The node is added to that list, and the loader makes them prev's children at once (see conversationTree._adopt)."""
+    node = Msg_Node(
+        prev if siblings is None else None,
+        role=record['role'],
+        content=_record_content(record, (prev.next if prev else ()) if siblings is None else siblings, store),
+        time=record['time'],
+        depth=record['depth'],
+        id=record['id'],
+        index=record['index'],
+    )
+    if siblings is not None:
+        node.prev = prev
+        siblings.append(node)
+    node.stats = record.get('stats')
+    node.pinned = record.get('pinned', False)
+    return node
+
+
+def replay(records, cur_id: str = None, index: TreeIndex = None, store: contentStore.ContentStore = None):
+    """Rebuilds a conversation tree from a sequence of journal records.
+
+    Args:
+    records: An iterable of journal records, parents always come before their children.
+    cur_id: Optional ID of the message that will become the current one; overrides any 'cur' record.
+    index: Optional TreeIndex all nodes are added to. Records are in the order messages were added, so are its leaves.
+    store: The content store texts referred to by hash are read from.
+
+    Returns:
+    - The root of the tree.
+    - The current message node, or the root if the current message is not found."""
+    nodes = {}
+    children = {}
+    root = None
+    last_cur = None
+    for record in records:
+        if record['op'] == 'cur':
+            last_cur = record['id']
+            continue
+        if record['op'] == 'pin':
+            if record['id'] in nodes:
+                nodes[record['id']].pinned = record['pinned']
+            continue
+        if record['id'] in nodes:
+            continue
+        prev = nodes.get(record['prev'])
+        node = _from_record(record, prev, store, children.setdefault(record['prev'], []) if prev else None)
+        nodes[record['id']] = node
+        if index is not None:
+            index.add(node)
+        if not prev:
+            root = node
+    for id, siblings in children.items():
+        _adopt(nodes[id], siblings)
+    cur = nodes.get(cur_id or last_cur, root)
+    return root, cur
+
+
+def _iter_tree(root: Msg_Node):
+    """Yields every node of a tree in pre-order, so parents always come before their children."""
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.next))
+
+
+class ChatJournal:
+    """An append-only chat file. Every message node is written exactly once as its own record, changes of the current message are appended as small 'cur' records, and pins of messages that are on disk already as 'pin' records. Once the journal holds too many stale records it is compacted in a background thread.
+
+    Next to the journal, an index file lists the byte offset, length, parent and position of every record. It lets chats be opened lazily: only the current branch is read, all other messages are read the first time they are visited.
+
+Records don't always hold their message's text: edits may be stored as a delta against the message they edit, and long system prompts live in the directory's content store (see contentStore), shared by all chats that start with them."""
+
+    def __init__(self, path: str):
+        """Constructs an empty journal handle, use _note to fill in records that are already on disk."""
+        self.path = path
+        self.index_path = path + INDEX_EXT
+        self.store = contentStore.get_store(os.path.dirname(path))
+        self.written = {}
+        self.children = {}
+        self.records = 0
+        self.size = 0
+        self.cur_id = None
+        self._cur_entry = None
+        self.pinned = set()
+        self._pin_entries = {}
+        self._keys = None
+        self._lock = threading.Lock()
+        self._compacting = False
+
+    def _note(self, offset: int, length: int, record: dict):
+        """Remembers where a record lives in the journal file."""
+        self.records += 1
+        self.size = max(self.size, offset + length)
+        if record['op'] == 'cur':
+            self.cur_id = record['id']
+            self._cur_entry = (offset, length)
+        elif record['op'] == 'pin':
+            self._pin_entries[record['id']] = (offset, length)
+            if record['pinned']:
+                self.pinned.add(record['id'])
+            else:
+                self.pinned.discard(record['id'])
+        elif record['id'] not in self.written:
+            self.written[record['id']] = (offset, length, record['prev'], record['index'])
+            self.children.setdefault(record['prev'], []).append(record['id'])
+            if record.get('pinned'):
+                self.pinned.add(record['id'])
+            if self._keys is not None:
+                self._keys.add(_pack_id(record['id']))
+
+    def keys(self):
+        """Returns the IDs of the nodes on disk the way nodes store them (see _pack_id), so whole trees can be checked against the journal without building every node's ID string. The set is built on first use, under the journal's lock, as saves may add to the journal from another thread."""
+        with self._lock:
+            if self._keys is None:
+                self._keys = {_pack_id(id) for id in self.written}
+            return self._keys
+
+    def _index_lines(self, records: list):
+        """Formats index lines for records, given as tuples of (offset, length, record)."""
+        lines = []
+        for offset, length, record in records:
+            if record['op'] == 'cur':
+                lines.append(f"c {offset} {length} {record['id']}\n")
+            elif record['op'] == 'pin':
+                lines.append(f"p {offset} {length} {record['id']} {int(record['pinned'])}\n")
+            else:
+                pinned = " p" if record.get('pinned') else ""
+                lines.append(f"n {offset} {length} {record['id']} {record['prev'] or '-'} {record['index']}{pinned}\n")
+        return "".join(lines)
+
+    def _write_index(self):
+        """Rewrites the whole index file from memory. Pins are noted as they are now, which is all loading needs."""
+        records = [(offset, length, {'op': 'node', 'id': id, 'prev': prev, 'index': index, 'pinned': id in self.pinned}) for id, (offset, length, prev, index) in self.written.items()]
+        records += [(offset, length, {'op': 'pin', 'id': id, 'pinned': id in self.pinned}) for id, (offset, length) in self._pin_entries.items()]
+        if self.cur_id:
+            records.append((*self._cur_entry, cur_record(self.cur_id)))
+        records.sort(key=lambda record: record[0])
+        tmp = self.index_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self._index_lines(records))
+        os.replace(tmp, self.index_path)
+
+    def _read_index(self):
+        """Fills this handle from the index file instead of the journal itself.
+
+        Returns:
+        True if the index exists and covers exactly the whole journal, False otherwise."""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 4 and parts[0] == 'c':
+                        self._note(int(parts[1]), int(parts[2]), cur_record(parts[3]))
+                    elif len(parts) == 5 and parts[0] == 'p':
+                        self._note(int(parts[1]), int(parts[2]), {'op': 'pin', 'id': parts[3], 'pinned': parts[4] == '1'})
+                    elif len(parts) in (6, 7) and parts[0] == 'n':
+                        prev = None if parts[4] == '-' else parts[4]
+                        self._note(int(parts[1]), int(parts[2]), {'op': 'node', 'id': parts[3], 'prev': prev, 'index': int(parts[5]), 'pinned': len(parts) == 7})
+            return self.size == os.path.getsize(self.path)
+        except (OSError, ValueError):
+            return False
+
+    def changes(self, root: Msg_Node):
+        """Compares a tree with what is on disk.
+
+        Returns:
+        - The nodes that are not in the journal yet, parents before their children.
+        - The nodes in it that were pinned or unpinned since. Placeholders are left out, they are pinned as on disk."""
+        keys = self.keys()
+        with self._lock:
+            pinned = {_pack_id(id) for id in self.pinned}
+        new_nodes = []
+        repinned = []
+        for node in _iter_tree(root):
+            if node._id not in keys:
+                new_nodes.append(node)
+            elif not node.source and node.pinned != (node._id in pinned):
+                repinned.append(node)
+        return new_nodes, repinned
+
+    def append(self, root: Msg_Node, cur: Msg_Node):
+        """Appends all nodes of the tree that are not yet on disk, pins that changed, and the current message if it changed. A torn last line left by a crash is ended first, so it can't swallow the next record.
+
+        Args:
+        root: The root of the conversation tree.
+        cur: The current message node.
+
+        Returns:
+        A list of all nodes that were newly written."""
+        new_nodes, repinned = self.changes(root)
+        records = [node_record(node, self.store) for node in new_nodes] + [pin_record(node) for node in repinned]
+        if cur.id != self.cur_id:
+            records.append(cur_record(cur.id))
+        if not records:
+            return new_nodes
+        lines = [_dump(record) for record in records]
+        with self._lock:
+            with open(self.path, 'a+b') as f:
+                offset = f.seek(0, os.SEEK_END)
+                if offset > self.size:
+                    f.seek(offset - 1)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+                        offset += 1
+                f.write(b"".join(lines))
+            positions = []
+            for record, line in zip(records, lines):
+                self._note(offset, len(line), record)
+                positions.append((offset, len(line), record))
+                offset += len(line)
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(self._index_lines(positions))
+        if self._needs_compaction():
+            self.compact_async()
+        return new_nodes
+
+    def read_record(self, id: str):
+        """Reads the record of a single node straight from its position in the journal."""
+        with self._lock:
+            offset, length = self.written[id][:2]
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                return json.loads(f.read(length))
+
+    def _stub(self, prev: Msg_Node, id: str, siblings: list):
+        """Adds a placeholder for a node that has not been read yet to siblings, the list of prev's children being read (see _from_record). It knows its ID and position, its content is read by materialize once it is visited."""
+        node = Msg_Node(None, None, None, None, prev.depth + 1, id=id, index=self.written[id][3])
+        node.prev = prev
+        siblings.append(node)
+        node.pinned = id in self.pinned
+        node.source = self
+        return node
+
+    def materialize(self, node: Msg_Node):
+        """Reads a placeholder node's content from disk, and adds placeholders for its children."""
+        record = self.read_record(node.id)
+        node.role = sys.intern(record['role'])
+        node.content = _record_content(record, node.prev.next if node.prev else (), self.store)
+        node.time = record['time']
+        node.depth = record['depth']
+        node.stats = record.get('stats')
+        node.source = None
+        stubs = []
+        for child in self.children.get(node.id, ()):
+            self._stub(node, child, stubs)
+        _adopt(node, stubs)
+
+    def _needs_compaction(self):
+        return not self._compacting and self.records > max(COMPACT_MIN_RECORDS, COMPACT_RATIO * len(self.written))
+
+    def compact_async(self):
+        """Starts compacting this journal in a background thread."""
+        self._compacting = True
+        threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        """Rewrites the journal so it holds every node once and a single 'cur' record; Pins are folded into the node records. Records appended while compacting are carried over, and the old file is only replaced once the new one is complete."""
+        tmp = self.path + ".tmp"
+        compacted = ChatJournal(self.path)
+        try:
+            with self._lock:
+                size = os.path.getsize(self.path)
+                pinned = set(self.pinned)
+            cur = None
+            offset = 0
+            with open(self.path, 'rb') as f, open(tmp, 'wb') as out:
+                for _, _, record in _scan(f, limit=size):
+                    if record['op'] == 'cur':
+                        cur = record
+                    elif record['op'] != 'pin' and record['id'] not in compacted.written:
+                        record.pop('pinned', None)
+                        if record['id'] in pinned:
+                            record['pinned'] = True
+                        line = _dump(record)
+                        out.write(line)
+                        compacted._note(offset, len(line), record)
+                        offset += len(line)
+                if cur:
+                    line = _dump(cur)
+                    out.write(line)
+                    compacted._note(offset, len(line), cur)
+                    offset += len(line)
+            with self._lock:
+                with open(self.path, 'rb') as f, open(tmp, 'ab') as out:
+                    f.seek(size)
+                    for _, length, record in _scan(f, offset):
+                        compacted._note(offset, length, record)
+                        offset += length
+                    f.seek(size)
+                    out.write(f.read())
+                    out.flush()
+                    os.fsync(out.fileno())
+                os.replace(tmp, self.path)
+                self.written = compacted.written
+                self.children = compacted.children
+                self._keys = None
+                self.records = compacted.records
+                self.size = compacted.size
+                self.cur_id = compacted.cur_id
+                self._cur_entry = compacted._cur_entry
+                self.pinned = compacted.pinned
+                self._pin_entries = compacted._pin_entries
+                self._write_index()
+        finally:
+            self._compacting = False
+
+
+def create(path: str):
+    """Starts a fresh, empty journal at the given path, replacing any file that already exists there."""
+    open(path, 'w', encoding='utf-8').close()
+    journal = ChatJournal(path)
+    journal._write_index()
+    _journals[path] = journal
+    return journal
+
+
+def get_journal(path: str):
+    """Returns the journal handle for a chat file, creating an empty journal if the file does not exist yet."""
+    journal = _journals.get(path)
+    if journal is None:
+        if not os.path.exists(path):
+            return create(path)
+        journal = ChatJournal(path)
+        if not journal._read_index():
+            journal = ChatJournal(path)
+            with open(path, 'rb') as f:
+                for offset, length, record in _scan(f):
+                    journal._note(offset, length, record)
+            journal._write_index()
+        _journals[path] = journal
+    return journal
+
+
+def forget(path: str):
+    """Drops the handle of a journal that is moved or deleted, so a new file at the same path starts out fresh."""
+    _journals.pop(path, None)
+
+
+def load(path: str, cur_id: str = None, track: bool = True, index: TreeIndex = None):
+    """Loads a journal chat file by replaying all of its records. The index file is rebuilt on the way if it is missing or out of date.
+
+    Args:
+    path: The journal file.
+    cur_id: Optional ID of the message to make current, instead of the one stored in the file.
+    track: Whether to keep a handle for appending to this journal later on.
+    index: Optional TreeIndex all nodes are added to.
+
+    Returns:
+    - The root of the tree.
+    - The current message node.
+    Raises ValueError if no message survived, as when the file is empty or its only record was torn by a crash during the first save."""
+    journal = ChatJournal(path)
+
+    def records(f):
+        for offset, length, record in _scan(f):
+            journal._note(offset, length, record)
+            yield record
+
+    with open(path, 'rb') as f:
+        root, cur = replay(records(f), cur_id, index, journal.store)
+    if root is None:
+        raise ValueError(f"{path} holds no messages")
+    if track:
+        journal._write_index()
+        _journals[path] = journal
+    return root, cur
+
+
+def load_lazy(path: str, cur_id: str = None, index: TreeIndex = None):
+    """Loads only the current branch of a journal chat file, using its index. Every node on the branch gets placeholders for its other children, so sibling counts are correct; Those placeholders are read from disk once they are visited, see Msg_Node.ensure_loaded.
+
+    Args:
+    path: The journal file.
+    cur_id: Optional ID of the message to make current, instead of the one stored in the file.
+    index: Optional TreeIndex the loaded nodes are added to. It reads any other node from the journal when it is looked up.
+
+    Returns:
+    - The root of the tree.
+    - The current message node.
+    Or None, if the index is missing or does not match the journal."""
+    journal = ChatJournal(path)
+    if not journal._read_index() or None not in journal.children:
+        return None
+    if cur_id not in journal.written:
+        cur_id = journal.cur_id if journal.cur_id in journal.written else journal.children[None][0]
+    branch = []
+    id = cur_id
+    while id:
+        branch.append(id)
+        id = journal.written[id][2]
+    branch.reverse()
+
+    _journals[path] = journal
+    root = _from_record(journal.read_record(branch[0]), store=journal.store)
+    root.pinned = root.id in journal.pinned
+    node = root
+    for nxt in branch[1:] + [None]:
+        following = None
+        siblings = []
+        for child in journal.children.get(node.id, ()):
+            if child == nxt:
+                following = _from_record(journal.read_record(child), node, journal.store, siblings)
+                following.pinned = child in journal.pinned
+            else:
+                journal._stub(node, child, siblings)
+        _adopt(node, siblings)
+        if following:
+            node = following
+    if index is not None:
+        for loaded in _iter_tree(root):
+            index.add(loaded)
+        index.attach(journal, (id for id in journal.written if id not in journal.children))
+    return root, node
+
+
+def parse_legacy(data: bytes, cur_id: str = None, index: TreeIndex = None):
+    """Loads a legacy .json chat that is in memory already, see read_tree for the arguments and return values. It is parsed in one go, which is faster than streaming it, unless it is nested too deeply for that. Like stream_deserialize, it raises ValueError if the data holds no chat."""
+    try:
+        chat = json.loads(data)
+    except RecursionError:
+        return stream_deserialize(io.StringIO(data.decode('utf-8')), cur_id, index)
+    if not isinstance(chat, dict) or not isinstance(chat.get('messages'), dict):
+        raise ValueError("The file holds no chat")
+    return deserialize(chat['messages'], cur_id or chat['cur_id'], index)
+
+
+def read_tree(file: str, cur_id: str = None, track: bool = True, lazy: bool = False, index: TreeIndex = None):
+    """Loads any chat file, either a journal or a legacy .json chat.
+
+    Args:
+    file: Path to the chat file.
+    cur_id: Optional ID of the message to make current, instead of the one stored in the file.
+    track: Whether to keep a handle for appending to a journal later on.
+    lazy: Whether large journals may be opened lazily, see load_lazy.
+    index: Optional TreeIndex all loaded nodes are added to.
+
+    Returns:
+    - The root of the tree.
+    - The current message node, or None if it is not found."""
+    if is_journal(file):
+        if lazy and os.path.getsize(file) >= LAZY_MIN_SIZE:
+            loaded = load_lazy(file, cur_id, index)
+            if loaded:
+                return loaded
+        return load(file, cur_id, track, index)
+    with open(file, 'r', encoding='utf-8') as f:
+        return stream_deserialize(f, cur_id, index)
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+
+from conversationTree import Msg_Node
+
+CACHE_PATH = "./userInfo/cache"
+CACHE_MODES = ("off", "on", "offline")
+CACHE_EXT = ".json"
+
+_caches = {}
+
+
+def _digest(*parts: str):
+    sha = hashlib.sha256()
+    for part in parts:
+        sha.update(part.encode('utf-8'))
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def path_hash(node: Msg_Node):
+    """Returns a hash of the whole path from the root to node (roles and contents). It is built incrementally: every node caches the hash of its own path, which only takes its parent's hash and its own message to compute, so this is not O(path length) for every request."""
+    if node.path_hash is not None:
+        return node.path_hash
+    pending = []
+    while node and node.path_hash is None:
+        pending.append(node)
+        node = node.prev
+    digest = node.path_hash if node else ""
+    for node in reversed(pending):
+        node.ensure_loaded()
+        digest = node.path_hash = _digest(digest, node.role, node.content)
+    return digest
+
+
+def request_key(settings: dict, cur: Msg_Node, messages: list, dropped: int):
+    """Returns the cache key of a request: a hash of the model, the sampling parameters and the messages sent.
+
+    Args:
+    - settings: The user settings the request is made with.
+    - cur: The last message of the current branch.
+    - messages: The messages sent.
+    - dropped: How many messages of the branch were left out to fit the context window; If none were, the branch's cached path hash is used."""
+    sent = path_hash(cur) if not dropped else _digest(*(f"{msg['role']}\0{msg['content']}" for msg in messages))
+    return _digest(settings['Model'], str(settings['Temperature']), str(settings['FrequencyPenalty']), str(settings['PresencePenalty']), sent)
+
+
+def variant_key(key: str, variant: int):
+    """Returns the key of one of several replies to the same request. The first reply to a message is variant 0, the next alternative variant 1, and so on, so replaying a branch brings back the same alternatives in the same order."""
+    return _digest(key, str(variant))
+
+
+class CompletionCache:
+    """An on-disk cache of replies, one file per request key. Its size is bounded: once it holds more than max_bytes, the least recently used replies are evicted. A file's modification time marks when it was last used."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str):
+        return os.path.join(self.directory, key + CACHE_EXT)
+
+    def get(self, key: str):
+        """Returns the chunks of the cached reply stored under key, or None if there is none. A hit marks the reply as recently used."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                chunks = json.load(f)['chunks']
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return chunks
+
+    def put(self, key: str, chunks: list):
+        """Stores the chunks of a complete reply under key, and evicts old replies if the cache got too big."""
+        path = self._path(key)
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'chunks': chunks}, f, ensure_ascii=False)
+        added = os.path.getsize(tmp)
+        old = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp, path)
+        if self.size is None:
+            self.size = self._measure()
+        else:
+            self.size += added - old
+        if self.size > self.max_bytes:
+            self._evict()
+
+    def _measure(self):
+        with os.scandir(self.directory) as entries:
+            return sum(entry.stat().st_size for entry in entries if entry.name.endswith(CACHE_EXT))
+
+    def _evict(self):
+        """Removes the least recently used replies until the cache is at most three quarters full, so not every new reply triggers another eviction."""
+        with os.scandir(self.directory) as entries:
+            files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries if entry.name.endswith(CACHE_EXT)]
+        files.sort()
+        self.size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.size <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+
+def get_cache(settings: dict):
+    """Returns the completion cache, or None if it is turned off in settings."""
+    if settings.get("Cache", "off") not in ("on", "offline"):
+        return None
+    max_bytes = int(settings.get("CacheSizeMB", 64)) << 20
+    cache = _caches.get(CACHE_PATH)
+    if cache is None:
+        cache = _caches[CACHE_PATH] = CompletionCache(CACHE_PATH, max_bytes)
+    cache.max_bytes = max_bytes
+    return cache
@@ -0,0 +1,152 @@
+import difflib
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+
+STORE_NAME = ".contents.jsonl"
+SHARE_MIN_SIZE = 512
+DELTA_MIN_SIZE = 256
+DELTA_RATIO = 0.5
+MAX_CHAIN = 8
+COPY_COST = 12
+MATCH_MAX_CHARS = 8192
+
+_TOKEN = re.compile(r'\s*\S+|\s+')
+
+_stores = {}
+
+
+def digest(text: str):
+    """Returns the hash a message text is stored under."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+class Delta:
+    """A message text kept as changes to the text of one of its siblings, the message it is an edit of. The operations are either (start, end) ranges copied from the base's text, or inserted strings; The text itself is put together on every access (see Msg_Node.content), which is cheap next to rendering or sending it."""
+
+    __slots__ = ('base', 'ops', 'depth')
+
+    def __init__(self, base, ops):
+        """Args:
+        - base: The sibling message node whose text the changes apply to.
+        - ops: The operations, as described above."""
+        self.base = base
+        self.ops = tuple(op if isinstance(op, str) else tuple(op) for op in ops)
+        self.depth = base._content.depth + 1 if isinstance(base._content, Delta) else 1
+
+    def text(self):
+        """Returns the full text."""
+        self.base.ensure_loaded()
+        base = self.base.content
+        return "".join(op if isinstance(op, str) else base[op[0]:op[1]] for op in self.ops)
+
+    def to_record(self):
+        """Returns the delta as it is stored in a chat journal."""
+        return {'base': self.base.id, 'ops': self.ops}
+
+
+def _common_prefix(a: str, b: str):
+    """Returns the length of the longest common prefix of two strings, comparing halves of what is left at a time."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[low:mid] == b[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def delta(base, text: str):
+    """Returns the text of an edit of base as a Delta against base's text, or the text itself if that isn't much smaller (short texts, rewrites, and long chains of edits of edits are kept whole).
+
+    Most edits change a few places in a long text: The unchanged start and end are found first, and only what lies between is compared word by word (line by line, if it is long), so small changes in long paragraphs stay small without comparing everything."""
+    if len(text) < DELTA_MIN_SIZE or isinstance(base._content, Delta) and base._content.depth >= MAX_CHAIN:
+        return text
+    old_text = base.content
+    start = _common_prefix(old_text, text)
+    end = _common_prefix(old_text[start:][::-1], text[start:][::-1])
+    old_end, new_end = len(old_text) - end, len(text) - end
+    words = max(old_end, new_end) - start <= MATCH_MAX_CHARS
+    old = _TOKEN.findall(old_text[start:old_end]) if words else old_text[start:old_end].splitlines(True)
+    new = _TOKEN.findall(text[start:new_end]) if words else text[start:new_end].splitlines(True)
+    offsets = list(itertools.accumulate(map(len, old), initial=start))
+    ops = [(0, start)] if start else []
+    size = COPY_COST if start else 0
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=not words).get_opcodes():
+        if tag == 'equal':
+            ops.append((offsets[i1], offsets[i2]))
+            size += COPY_COST
+        elif j2 > j1:
+            ops.append("".join(new[j1:j2]))
+            size += len(ops[-1])
+        if size > DELTA_RATIO * len(text):
+            return text
+    if end:
+        ops.append((old_end, len(old_text)))
+    return Delta(base, ops)
+
+
+class ContentStore:
+    """Message texts shared by the chats of a directory, stored once and referred to by their hash instead of being repeated in every chat file. This is used for long system prompts, which hundreds of chats may start with.
+
+    The store is an append-only file of records holding a hash and its text. Texts are kept in memory once read, so all chats referring to one share a single string. Entries are never removed; There is one per distinct prompt, and a text is forced to disk before any chat refers to it."""
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, STORE_NAME)
+        self.texts = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Reads the records appended since the last read, by this session or another one. A torn last line is left for later."""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self._size)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    self._size += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.texts.setdefault(record['hash'], record['content'])
+        except FileNotFoundError:
+            pass
+
+    def get(self, hash: str):
+        """Returns the text stored under hash. Raises ValueError if there is none."""
+        with self._lock:
+            text = self.texts.get(hash)
+            if text is None:
+                self._load()
+                text = self.texts.get(hash)
+        if text is None:
+            raise ValueError(f"Message text {hash} is missing from {self.path}")
+        return text
+
+    def put(self, text: str):
+        """Stores a text, unless it is stored already. Returns its hash."""
+        hash = digest(text)
+        with self._lock:
+            if hash not in self.texts:
+                self._load()
+            if hash not in self.texts:
+                with open(self.path, 'ab') as f:
+                    f.write((json.dumps({'hash': hash, 'content': text}, ensure_ascii=False) + "\n").encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.texts[hash] = text
+        return hash
+
+
+def get_store(directory: str):
+    """Returns the content store of a chat directory, whether or not it exists yet."""
+    store = _stores.get(directory)
+    if store is None:
+        store = _stores[directory] = ContentStore(directory)
+    return store
@@ -0,0 +1,92 @@
+from conversationTree import Msg_Node
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD = 4
+REPLY_RESERVE = 4096
+STRATEGIES = ("oldest", "none")
+
+
+def count_tokens(text: str):
+    """Estimates the amount of tokens a text takes up. Tokenizers differ between vendors, so this uses the common rule of thumb of about four characters per token, rounded up."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def node_tokens(node: Msg_Node):
+    """Returns the tokens a single message takes up, including a small overhead for its role. The count is computed once and then cached on the node; Message content never changes, edits create new nodes."""
+    if node.tokens is None:
+        node.ensure_loaded()
+        node.tokens = count_tokens(node.content) + MESSAGE_OVERHEAD
+    return node.tokens
+
+
+def path_tokens(node: Msg_Node):
+    """Returns the tokens taken up by the whole path from the root to node. Every node caches the count for its own path, so after the first call this only costs one lookup, and a new message only adds its own count to its parent's."""
+    if node.path_tokens is not None:
+        return node.path_tokens
+    pending = []
+    while node and node.path_tokens is None:
+        pending.append(node)
+        node = node.prev
+    total = node.path_tokens if node else 0
+    for node in reversed(pending):
+        total += node_tokens(node)
+        node.path_tokens = total
+    return total
+
+
+def budget(settings: dict):
+    """Returns the amount of tokens a request may use for its messages, leaving room for the reply."""
+    return max(0, int(settings.get("ContextWindow", 0)) - REPLY_RESERVE)
+
+
+def _path(cur: Msg_Node):
+    nodes = []
+    while cur:
+        nodes.append(cur)
+        cur = cur.prev
+    nodes.reverse()
+    return nodes
+
+
+def _turns(nodes: list):
+    """Splits messages into turns, each starting with a user message and holding the replies that follow it."""
+    turns = []
+    for node in nodes:
+        if node.role == "user" or not turns:
+            turns.append([node])
+        else:
+            turns[-1].append(node)
+    return turns
+
+
+def build_context(cur: Msg_Node, messages: list, limit: int, strategy: str = "oldest"):
+    """Picks the messages sent with a request, so they fit into the model's context window.
+
+    Args:
+    - cur: The last message of the current branch.
+    - messages: The current branch as a list of messages, from the root to cur.
+    - limit: The amount of tokens the messages may take up; See budget.
+    - strategy: How to make room if the branch doesn't fit:
+        - "oldest": Drop the oldest turns, but keep the system prompt, pinned messages (and the turns holding them), and the last turn.
+        - "none": Send the whole branch anyway.
+
+    Returns:
+    - The messages to send.
+    - How many messages were dropped."""
+    if strategy == "none" or path_tokens(cur) <= limit:
+        return messages, 0
+    nodes = _path(cur)
+    system = [node for node in nodes[:1] if node.role == "system"]
+    turns = _turns(nodes[len(system):])
+    total = path_tokens(cur)
+    dropped = set()
+    for turn in turns[:-1]:
+        if total <= limit:
+            break
+        if any(node.pinned for node in turn):
+            continue
+        for node in turn:
+            dropped.add(node)
+            total -= node_tokens(node)
+    kept = [node.to_msg() for node in nodes if node not in dropped]
+    return kept, len(dropped)
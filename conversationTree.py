@@ -1,21 +1,57 @@
-from rich.markdown import Markdown
 from rich.text import Text
 from rich.console import Group
 from rich.rule import Rule
+import calendar
+import json
+import re
+import sys
 import uuid
+from time import gmtime, strftime
 
-def deserialize(data: dict, cur_id: str):
-    """Recursively converts a dicitonary into a doubly-linked tree of conversation nodes.
+from contentStore import Delta
+from renderCache import CachedMarkdown
 
-    Args:
-    data: A recursive dict holding the chat to be loaded.
-    cur_id: The unique ID of the message which will become the current one.
+CHUNK_SIZE = 1 << 16
 
-    Returns:
-    - The root of the tree.
-    - The message node corresponding to the current message, or None if the message with cur_id is not (yet) found.
-    """
-    cur = None
+_NUMBER = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?')
+_LITERALS = {'true': True, 'false': False, 'null': None}
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = ',:]}' + _WHITESPACE
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+NO_CHILDREN = ()
+ID_PREFIX = 8
+
+
+def _pack_id(id: str):
+    """Returns a UUID string as a 128-bit int. Anything that isn't a UUID in its usual form is kept as it is, so every ID is written back exactly as it was read."""
+    if len(id) == 36:
+        try:
+            value = uuid.UUID(id)
+        except ValueError:
+            return id
+        if str(value) == id:
+            return value.int
+    return id
+
+
+def _unpack_id(id):
+    """Turns an ID stored by _pack_id back into its string."""
+    return str(uuid.UUID(int=id)) if isinstance(id, int) else id
+
+
+def _pack_time(time: str):
+    """Returns a time stamp like "2025-01-31 12:00:00" as seconds since the epoch. The seconds are counted on the same (local) clock the stamp was written with, so it formats back to exactly the same text. Anything else is kept as it is."""
+    if isinstance(time, str) and len(time) == 19 and time[4] == time[7] == '-' and time[10] == ' ' and time[13] == time[16] == ':':
+        try:
+            return calendar.timegm((int(time[:4]), int(time[5:7]), int(time[8:10]), int(time[11:13]), int(time[14:16]), int(time[17:])))
+        except ValueError:
+            pass
+    return time
+
+
+def _node_from_dict(data: dict):
+    """Builds a single, unattached message node from its serialized fields (children are ignored)."""
     node = Msg_Node(
         prev = None,
         role=data['role'],
@@ -25,18 +61,190 @@ def deserialize(data: dict, cur_id: str):
         id = data['id'],
         index = data['index']
     )
-    if node.id == cur_id: cur = node
+    node.stats = data.get('stats')
+    node.pinned = data.get('pinned', False)
+    return node
+
+
+def _adopt(node: "Msg_Node", children: list):
+    """Makes a list of nodes the children of node, all at once. Loaders collect a node's children before doing this, as adding them one at a time (see Msg_Node.add_child) copies the tuple every time."""
+    node.next = tuple(children)
+    for child in children:
+        child.prev = node
+
+
+def deserialize(data: dict, cur_id: str, index: "TreeIndex" = None):
+    """Converts a nested dicitonary into a doubly-linked tree of conversation nodes. This works with an explicit stack instead of recursion, so arbitrarily deep chats can be loaded.
+
+    Args:
+    data: A nested dict holding the chat to be loaded.
+    cur_id: The unique ID of the message which will become the current one.
+    index: Optional TreeIndex all nodes are added to.
+
+    Returns:
+    - The root of the tree.
+    - The message node corresponding to the current message, or None if no message with cur_id exists.
+    """
+    index = index if index is not None else TreeIndex()
+    root = _node_from_dict(data)
+    index.add(root)
+    stack = [(root, data['next'])]
+    while stack:
+        node, children = stack.pop()
+        built = [_node_from_dict(nxt) for nxt in children]
+        _adopt(node, built)
+        for child, nxt in zip(built, children):
+            index.add(child)
+            stack.append((child, nxt['next']))
+    index.sort_leaves()
+    return root, index.get(cur_id)
+
+
+def _iter_events(f, chunk_size: int = CHUNK_SIZE):
+    """Tokenizes a JSON document while reading it in chunks, without recursion.
+
+    Args:
+    f: A file-like object opened in text mode.
+    chunk_size: The amount of characters read at once. While a token (like a long message) doesn't fit into what was read, the amount doubles with every read, so it is scanned again only a few times instead of once per chunk.
+
+    Yields:
+    Tuples of an event name ('start_map', 'end_map', 'start_array', 'end_array', 'key' or 'value') and the parsed value, if any."""
+    buf = ""
+    pos = 0
+    eof = False
+    size = chunk_size
+    expect_key = []
+
+    def refill(grow: bool = False):
+        nonlocal buf, pos, eof, size
+        size = size * 2 if grow else chunk_size
+        chunk = f.read(size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                return
+            refill()
+            continue
+        char = buf[pos]
+        if char == '{':
+            pos += 1
+            expect_key.append(True)
+            yield 'start_map', None
+        elif char == '}':
+            pos += 1
+            expect_key.pop()
+            yield 'end_map', None
+        elif char == '[':
+            pos += 1
+            expect_key.append(False)
+            yield 'start_array', None
+        elif char == ']':
+            pos += 1
+            expect_key.pop()
+            yield 'end_array', None
+        elif char == ',':
+            pos += 1
+            if expect_key and expect_key[-1] is not False:
+                expect_key[-1] = True
+        elif char == ':':
+            pos += 1
+        elif char == '"':
+            try:
+                value, end = json.decoder.scanstring(buf, pos + 1)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                refill(grow=True)
+                continue
+            pos = end
+            if expect_key and expect_key[-1] is True:
+                expect_key[-1] = None
+                yield 'key', value
+            else:
+                yield 'value', value
+        else:
+            end = pos
+            while end < len(buf) and buf[end] not in _DELIMITERS:
+                end += 1
+            if end == len(buf) and not eof:
+                refill(grow=True)
+                continue
+            word = buf[pos:end]
+            pos = end
+            if word in _LITERALS:
+                yield 'value', _LITERALS[word]
+            elif _NUMBER.fullmatch(word):
+                yield 'value', float(word) if any(c in word for c in '.eE') else int(word)
+            else:
+                raise json.JSONDecodeError("Unexpected token", buf, pos)
+
+
+def stream_deserialize(f, cur_id: str = None, index: "TreeIndex" = None):
+    """Parses a saved .json chat straight from an open file, building message nodes as soon as each one has been read. The whole nested dict never exists in memory, and the parser is iterative so very deep chats load fine.
+
+    Args:
+    f: The chat file, opened in text mode.
+    cur_id: Optional ID of the message to make current; by default the one stored in the file is used.
+    index: Optional TreeIndex all nodes are added to.
+
+    Returns:
+    - The root of the tree.
+    - The message node corresponding to the current message, or None if it is not found.
+    Raises ValueError if the file doesn't hold a chat, for example because it is empty."""
+    index = index if index is not None else TreeIndex()
+    stack = []
+    keys = []
+    result = None
 
-    for nxt in data['next']: 
-        child, new_cur= deserialize(nxt, cur_id)
-        node.add_child(child)
-        if new_cur: cur = new_cur
+    def add(value):
+        nonlocal result
+        if not stack:
+            result = value
+        elif keys[-1] is None:
+            stack[-1].append(value)
+        else:
+            stack[-1][keys[-1]] = value
 
-    return node, cur
+    for event, value in _iter_events(f):
+        if event == 'key':
+            keys[-1] = value
+        elif event == 'value':
+            if cur_id is None and len(stack) == 1 and keys[-1] == 'cur_id':
+                cur_id = value
+            add(value)
+        elif event == 'start_map':
+            stack.append({})
+            keys.append('')
+        elif event == 'start_array':
+            stack.append([])
+            keys.append(None)
+        else:
+            data = stack.pop()
+            keys.pop()
+            if event == 'end_map' and 'role' in data:
+                node = _node_from_dict(data)
+                _adopt(node, data['next'])
+                index.add(node)
+                data = node
+            add(data)
+    if not isinstance(result, dict) or not isinstance(result.get('messages'), Msg_Node):
+        raise ValueError("The file holds no chat")
+    index.root = result['messages']
+    index.sort_leaves()
+    return result['messages'], index.get(cur_id)
 
 
 class Msg_Node:
-    """A node in the doubly linked conversation tree."""
+    """A node in the doubly linked conversation tree. Trees can hold a lot of nodes, so the layout is kept compact: nodes have slots instead of a __dict__, roles are interned, IDs are stored as 128-bit ints and times as epoch ints (both are turned back into text on access), and children are kept in a tuple, which is smaller than a list; Nodes without children share an empty one. Edits can keep their text as the changes to the message they edit."""
+
+    __slots__ = ('prev', 'next', 'index', 'role', '_content', '_time', 'depth', '_id', 'source', 'visited', 'tokens', 'path_tokens', 'path_hash', 'pinned', 'stats')
 
     def __init__(self, prev: "Msg_Node", role: str, content: str, time:str, depth:int, id = None, index = None):
         """Constructs a new message node.
@@ -44,26 +252,62 @@ class Msg_Node:
         Args:
         - prev: The parent of this node in the tree.
         - role: The author of this message (System, User, or Assistant).
-        - content: The actual message text.
+        - content: The actual message text, or a contentStore.Delta against a sibling's text.
         - time: The time the message was sent.
         - depth: The distance to the root.
         - id: The unique ID of this message. If left blank, a new one is generated.
         - index: The position in the list of children of this node's parent. If left blank and a parent is provided, calculate this automatically."""
         self.prev = prev
         if prev:
-            prev.next.append(self)
+            prev._append(self)
             self.index = len(prev.next)
         else: self.index=1
         if index: self.index = index
-        self.next = []
-        self.role = role
-        self.content = content
-        self.time = time
+        self.next = NO_CHILDREN
+        self.role = sys.intern(role) if role else role
+        self._content = content
+        self._time = _pack_time(time)
         self.depth = depth
         if id:
-            self.id = id
+            self._id = _pack_id(id)
         else:
-            self.id=str(uuid.uuid4())
+            self._id = uuid.uuid4().int
+        self.source = None
+        self.visited = None
+        self.tokens = None
+        self.path_tokens = None
+        self.path_hash = None
+        self.pinned = False
+        self.stats = None
+
+    @property
+    def id(self):
+        """The unique ID of this message, as a string."""
+        return _unpack_id(self._id)
+
+    @property
+    def content(self):
+        """The message text. Edits may keep theirs as a delta against the message they edit (see contentStore.delta), it is put together here."""
+        content = self._content
+        return content.text() if isinstance(content, Delta) else content
+
+    @content.setter
+    def content(self, content: str):
+        self._content = content
+
+    @property
+    def time(self):
+        """The time this message was sent, as a string."""
+        return strftime(TIME_FORMAT, gmtime(self._time)) if isinstance(self._time, int) else self._time
+
+    @time.setter
+    def time(self, time: str):
+        self._time = _pack_time(time)
+
+    def ensure_loaded(self):
+        """Makes sure this node's content and children are available. Nodes of lazily opened chats start out as placeholders and are read from their source (the chat's journal) on first use."""
+        if self.source:
+            self.source.materialize(self)
 
     def get_counts(self):
         """Returns both the amount of children self's parent has as well as self's position among them. If there is no parent, return 1, 1."""
@@ -77,14 +321,19 @@ class Msg_Node:
     
     def add_child(self, child):
         """Appends a child to this node."""
-        self.next.append(child)
+        self._append(child)
         child.prev = self
 
+    def _append(self, child):
+        self.next = self.next + (child,)
+
     def render(self):
-        """Returns a nicely formatted renderable of this node. This renderable contains basic info (time, depth, index) of this node, colorring indicating the role, and the message itself as markdown."""
+        """Returns a nicely formatted renderable of this node. This renderable contains basic info (time, depth, index) of this node, colorring indicating the role, and the message itself as markdown. The rendered markdown is cached, so flipping between messages doesn't parse and highlight them again."""
         total, this = self.get_counts()
 
-        header = f"{self.time} | {self.depth} | {this}/{total}"
+        header = f"{self.time} | {self.depth} | {this}/{total} | {self.id[:ID_PREFIX]}"
+        if self.pinned:
+            header += " | pinned"
 
         if self.role == "assistant":
             header_style = "bold red"
@@ -93,7 +342,7 @@ class Msg_Node:
         else:
             header_style = "bold blue"
         styled_header= Text(header, style = header_style, justify="center")
-        return Group(Rule(styled_header, style = header_style), Markdown(self.content))
+        return Group(Rule(styled_header, style = header_style), CachedMarkdown(self.id, self.content))
     
     def serialize(self, cur:str):
         """For saving to .json files.
@@ -109,15 +358,173 @@ class Msg_Node:
         }
         return serialized
     
-    def serialize_rec(self):
-        """The recursive part of the serialize procedure."""
-        serialized = {
+    def _fields(self):
+        """Returns this node's own fields as a dictionary, with an empty list of children. Request stats are only included for generated messages that have them, the pin only for pinned messages."""
+        fields = {
             'index': self.index,
             'role': self.role,
             'content': self.content,
             'time': self.time,
             'depth': self.depth,
             'id': self.id,
-            'next': [child.serialize_rec() for child in self.next],
         }
+        if self.stats:
+            fields['stats'] = self.stats
+        if self.pinned:
+            fields['pinned'] = True
+        fields['next'] = []
+        return fields
+
+    def serialize_rec(self):
+        """Builds the nested dictionary of the tree with this node as root. This uses an explicit stack instead of recursion, so deep trees don't hit Python's recursion limit."""
+        serialized = self._fields()
+        stack = [(self, serialized)]
+        while stack:
+            node, data = stack.pop()
+            for child in node.next:
+                child_data = child._fields()
+                data['next'].append(child_data)
+                stack.append((child, child_data))
         return serialized
+
+    def iter_serialize(self, cur: "Msg_Node"):
+        """Streams the same JSON as serialize, piece by piece, without building the nested dictionary first.
+
+        Args:
+        cur: The message that will be treated as current.
+
+        Yields:
+        Chunks of JSON text; Writing all of them in order produces a complete chat file."""
+        yield '{"cur_id": ' + json.dumps(cur.id) + ', "messages": '
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                yield node
+                continue
+            fields = node._fields()
+            del fields['next']
+            yield json.dumps(fields)[:-1] + ', "next": ['
+            stack.append(']}')
+            for i, child in enumerate(reversed(node.next)):
+                stack.append(child)
+                if i < len(node.next) - 1:
+                    stack.append(', ')
+        yield '}'
+
+
+class TreeIndex:
+    """An index over a conversation tree, so moving around it doesn't require walking it. It maps IDs to nodes, points to the root, keeps the tree's leaves ordered by last activity, and every node remembers its most recently visited child (see Msg_Node.visited).
+
+    For lazily opened chats (see chatJournal.load_lazy), only nodes that were read already are indexed; Others are read from the journal, the index's source, when they are looked up."""
+
+    def __init__(self):
+        self.root = None
+        self.nodes = {}
+        self.leaves = {}
+        self.source = None
+
+    def add(self, node: Msg_Node):
+        """Indexes a node. A node that has no children yet becomes the most recently active leaf, and its parent stops being a leaf. Nodes can also be added after their children, as happens while parsing nested JSON."""
+        self.nodes[node._id] = node
+        if node.prev:
+            self.leaves.pop(node.prev._id, None)
+        else:
+            self.root = node
+        if not node.next and not node.source:
+            self.leaves[node._id] = None
+
+    def attach(self, source, leaves):
+        """Makes the index read nodes it doesn't hold yet from source, for chats that were opened lazily.
+
+        Args:
+        - source: The ChatJournal the tree was loaded from.
+        - leaves: The IDs of all leaves of the whole tree, the most recently active one last."""
+        self.source = source
+        self.leaves = {_pack_id(id): None for id in leaves}
+
+    def get(self, id: str):
+        """Returns the node with the given ID, or None if there is none. For lazily opened chats, the path to the node is read from disk first if necessary."""
+        if id is None:
+            return None
+        return self._lookup(_pack_id(id))
+
+    def _lookup(self, key):
+        """Like get, but takes an ID the way nodes store it (see _pack_id)."""
+        node = self.nodes.get(key)
+        if node is None:
+            return self._read_path(_unpack_id(key)) if self.source else None
+        node.ensure_loaded()
+        return node
+
+    def _read_path(self, id: str):
+        """Reads the nodes between a node's closest indexed ancestor and the node itself from the index's source."""
+        written = self.source.written
+        branch = []
+        while id is not None and _pack_id(id) not in self.nodes:
+            if id not in written:
+                return None
+            branch.append(id)
+            id = written[id][2]
+        node = self.nodes.get(_pack_id(id)) if id is not None else None
+        for id in reversed(branch):
+            if node is None:
+                return None
+            node.ensure_loaded()
+            for child in node.next:
+                self.nodes.setdefault(child._id, child)
+            node = self.nodes.get(_pack_id(id))
+        if node:
+            node.ensure_loaded()
+        return node
+
+    def touch(self, node: Msg_Node):
+        """Marks node as visited: every node on its path remembers which child leads to it, and if node is a leaf, it becomes the most recently active one."""
+        child = node
+        while child.prev and child.prev.visited is not child:
+            child.prev.visited = child
+            child = child.prev
+        if not node.next and node._id in self.leaves:
+            del self.leaves[node._id]
+            self.leaves[node._id] = None
+
+    def recent_leaf(self, exclude: Msg_Node = None):
+        """Returns the most recently active leaf, other than exclude; Or None if there is none."""
+        skip = exclude._id if exclude else None
+        for key in reversed(self.leaves):
+            if key != skip:
+                node = self._lookup(key)
+                if node:
+                    return node
+        return None
+
+    def sort_leaves(self):
+        """Orders the leaves by the time their messages were sent. Used after loading chats that don't record in which order their messages were added."""
+        leaves = [node for node in map(self._lookup, self.leaves) if node]
+        leaves.sort(key=lambda node: node._time if isinstance(node._time, int) else 0)
+        self.leaves = {node._id: None for node in leaves}
+
+    def find(self, text: str):
+        """Returns the node whose ID is text, or else the only node whose ID starts with text; None if there is no such node, or more than one."""
+        node = self.get(text)
+        if node or not text:
+            return node
+        ids = self.source.written if self.source else (node.id for node in self.nodes.values())
+        matches = [id for id in ids if id.startswith(text)]
+        return self.get(matches[0]) if len(matches) == 1 else None
+
+    def split_point(self, node: Msg_Node):
+        """Returns the closest ancestor of node where the conversation branches, meaning it has more than one child; Or None if there is none."""
+        node = node.prev
+        while node and len(node.next) < 2:
+            node = node.prev
+        return node
+
+    def path(self, node: Msg_Node):
+        """Returns the nodes from the root to node, in that order."""
+        path = []
+        while node:
+            path.append(node)
+            node = node.prev
+        path.reverse()
+        return path
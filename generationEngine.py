@@ -0,0 +1,191 @@
+import asyncio
+import time
+from datetime import datetime
+
+from rich.console import Group
+from rich.text import Text
+
+from conversationTree import Msg_Node
+import requestStats
+import completionCache
+import apiClient
+from streamRenderer import StreamRenderer
+
+FRAME_RATE = 20
+
+
+class Generation:
+    """One or more replies to the same message, each streamed in by its own asyncio task, so the event loop (and with it the key loop) keeps running meanwhile. All streams run concurrently, so generating several alternatives takes about as long as generating one. A separate task redraws the screen at a fixed frame rate while new text arrives. Once a stream is complete, or cancelled, it becomes a message node below the message it answers; Its index follows the order the streams finish in."""
+
+    def __init__(self, client, settings: dict, parent: Msg_Node, messages: list, console, on_update, on_done, n: int = 1, cache = None, key: str = None):
+        """Starts streaming in n replies.
+
+        Args:
+        - client: The ApiClient to send requests with.
+        - settings: User settings holding the model and sampling parameters.
+        - parent: The message node the replies will be placed under.
+        - messages: The conversation sent to the API, ending with parent.
+        - console: The console used for rendering.
+        - on_update: Called without arguments whenever a new frame should be drawn.
+        - on_done: Called with this generation once all streams finished; Streams where no text arrived don't get a node, errors are collected in errors.
+        - n: The amount of alternative replies to generate.
+        - cache: Optional CompletionCache; Replies found in it are replayed instead of requested, new ones are stored in it.
+        - key: The request's cache key, see completionCache.request_key."""
+        self.parent = parent
+        self.renderers = [StreamRenderer(console) for _ in range(n)]
+        self.finished = [False] * n
+        self.nodes = []
+        self.errors = []
+        self.settings = settings
+        self._started = [time.time()] * n
+        self._first = [None] * n
+        self._usage = [None] * n
+        self._replayed = [False] * n
+        self.retrying = [None] * n
+        self.cache = cache
+        self.key = key
+        self.offline = settings.get("Cache") == "offline"
+        self._variant = len(parent.next)
+        self.done = False
+        self.on_update = on_update
+        self.on_done = on_done
+        loop = asyncio.get_running_loop()
+        self.tasks = [loop.create_task(self._stream(i, client, settings, messages)) for i in range(n)]
+        self._ticker = loop.create_task(self._tick())
+
+    @property
+    def node(self):
+        """The reply that finished first, or None if there is none (yet)."""
+        return self.nodes[0] if self.nodes else None
+
+    async def _stream(self, i: int, client, settings: dict, messages: list):
+        error = None
+        renderer = self.renderers[i]
+        self._started[i] = time.time()
+        key = completionCache.variant_key(self.key, self._variant + i) if self.cache else None
+        try:
+            if key:
+                chunks = await asyncio.to_thread(self.cache.get, key)
+                if chunks is not None:
+                    for text in chunks:
+                        renderer.feed(text)
+                    self._replayed[i] = True
+                    return
+                if self.offline:
+                    error = "No cached reply for this request (offline mode)."
+                    return
+            error = await self._generate(i, client, settings, messages)
+            if key and not error and renderer.chunks:
+                try:
+                    await asyncio.to_thread(self.cache.put, key, list(renderer.chunks))
+                except OSError:
+                    pass
+        finally:
+            self._finish_stream(i, error)
+
+    async def _generate(self, i: int, client, settings: dict, messages: list):
+        """Requests a single stream's reply, retrying after temporary errors as long as no text arrived yet.
+
+        Returns:
+        An error message if the request failed for good, otherwise None."""
+        api = await client.get()
+        from httpx import TransportError
+        from openai import OpenAIError
+        self._started[i] = time.time()
+        attempt = 0
+        while True:
+            try:
+                await self._request(i, api, settings, messages)
+                return None
+            except (OpenAIError, TransportError) as e:
+                delay = apiClient.retry_delay(e, attempt) if not self.renderers[i].chunks else None
+                if delay is None:
+                    return str(e)
+                attempt += 1
+                self.retrying[i] = (attempt, time.time() + delay, apiClient.describe(e))
+                self.on_update()
+                await asyncio.sleep(delay)
+                self.retrying[i] = None
+
+    async def _request(self, i: int, client, settings: dict, messages: list):
+        """Sends the request of a single stream and feeds the reply into its renderer as it arrives."""
+        stream = await client.chat.completions.create(
+            model=settings['Model'],
+            messages = messages,
+            stream = True,
+            stream_options = {"include_usage": True},
+            temperature = settings['Temperature'],
+            frequency_penalty = settings['FrequencyPenalty'],
+            presence_penalty = settings['PresencePenalty']
+        )
+        async with stream:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    if self._first[i] is None:
+                        self._first[i] = time.time()
+                    self.renderers[i].feed(chunk.choices[0].delta.content)
+                if chunk.usage:
+                    self._usage[i] = chunk.usage
+
+    def _retry_status(self, i: int):
+        """Returns a line describing a stream's pending retry, or None if there is none."""
+        if not self.retrying[i]:
+            return None
+        attempt, at, reason = self.retrying[i]
+        return f"{reason}, retry {attempt}/{apiClient.MAX_RETRIES} in {max(0.0, at - time.time()):.1f}s"
+
+    async def _tick(self):
+        """Draws a frame whenever new text arrived (or a retry is counting down), at most FRAME_RATE times per second. With several streams, there is still only one frame per tick."""
+        while not self.done:
+            await asyncio.sleep(1 / FRAME_RATE)
+            dirty = [renderer for i, renderer in enumerate(self.renderers) if renderer.dirty and not self.finished[i]]
+            if (dirty or any(self.retrying)) and not self.done:
+                for renderer in dirty:
+                    renderer.flush()
+                self.on_update()
+
+    def renderable(self):
+        """Returns the replies streamed in so far, as a renderable. A single reply is shown in full; For several, there is one progress line per stream instead. Pending retries are shown as well."""
+        if len(self.renderers) == 1:
+            retry = self._retry_status(0)
+            if retry:
+                return Text(retry, style="yellow")
+            return self.renderers[0].renderable()
+        lines = []
+        for i, renderer in enumerate(self.renderers):
+            status = "done" if self.finished[i] else self._retry_status(i) or "streaming"
+            line = Text(f"Alternative {i + 1}/{len(self.renderers)}: {renderer.words} words, {status}", style="green" if self.finished[i] else "yellow")
+            lines.append(line)
+        return Group(*lines)
+
+    def _finish_stream(self, i: int, error: str = None, cancelled: bool = False):
+        """Turns the text one stream received so far into a message node, unless that already happened. The node's stats record the request's timing, token usage and settings. Once every stream finished, on_done is called.
+
+        Args:
+        - i: The stream's position.
+        - error: Optional error message. It is kept in errors rather than in the tree; Text that arrived before the error still becomes a node.
+        - cancelled: Whether the user cancelled the stream."""
+        if self.finished[i]:
+            return
+        self.finished[i] = True
+        renderer = self.renderers[i]
+        text = renderer.finish()
+        if error:
+            self.errors.append(error)
+        if text:
+            node = Msg_Node(self.parent, "assistant", text, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), self.parent.depth + 1)
+            if not self._replayed[i]:
+                node.stats = requestStats.make(self.settings, self._started[i], self._first[i], time.time(), self._usage[i], cancelled)
+            self.nodes.append(node)
+        if all(self.finished):
+            self.done = True
+            self._ticker.cancel()
+            self.on_done(self)
+        else:
+            self.on_update()
+
+    def cancel(self):
+        """Stops all requests right away. Text that already arrived is kept as message nodes."""
+        for i, task in enumerate(self.tasks):
+            self._finish_stream(i, cancelled=True)
+            task.cancel()
@@ -0,0 +1,138 @@
+import asyncio
+import codecs
+import os
+import sys
+import threading
+import time
+
+ESC = "\x1b"
+ESC_TIMEOUT = 0.03
+POLL_INTERVAL = 0.05
+
+READER = None
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import select
+    import termios
+    import tty
+
+
+class KeyReader:
+    """Reads key presses in a dedicated thread and hands them to the asyncio event loop, so waiting for keys never blocks anything else. While a prompt is open, the reader is paused so it doesn't steal the prompt's input; see paused.
+
+    On POSIX systems the terminal stays in cbreak mode while the reader is active. A lone ESC is told apart from escape sequences (like arrow keys) by a short timeout."""
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.loop = asyncio.get_running_loop()
+        self._active = threading.Event()
+        self._parked = threading.Event()
+        self._closed = False
+        self._saved = None
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        global READER
+        READER = self
+        self.resume()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        global READER
+        self._closed = True
+        self.pause()
+        READER = None
+
+    async def get(self):
+        """Waits for the next key press, and returns it as a string using readchar's key constants."""
+        return await self.queue.get()
+
+    def get_nowait(self):
+        """Returns the next key press if one arrived already, or None without waiting."""
+        try:
+            return self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+
+    def pause(self):
+        """Stops reading keys and restores the terminal's normal mode. Returns once the reader thread is idle."""
+        self._active.clear()
+        if self._thread.is_alive():
+            self._parked.wait()
+        if self._saved is not None:
+            termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN, self._saved)
+            self._saved = None
+
+    def resume(self):
+        """Starts reading keys again after pause."""
+        if self._closed:
+            return
+        if os.name != 'nt' and sys.stdin.isatty():
+            fd = sys.stdin.fileno()
+            self._saved = termios.tcgetattr(fd)
+            tty.setcbreak(fd)
+        self._parked.clear()
+        self._active.set()
+
+    def _run(self):
+        while not self._closed:
+            if not self._active.is_set():
+                self._parked.set()
+                self._active.wait()
+                continue
+            if not self._ready(POLL_INTERVAL):
+                continue
+            key = self._read_key()
+            if key:
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, key)
+        self._parked.set()
+
+    def _ready(self, timeout: float):
+        """Waits up to timeout seconds for input, returns whether there is some."""
+        if os.name == 'nt':
+            if msvcrt.kbhit():
+                return True
+            time.sleep(timeout)
+            return msvcrt.kbhit()
+        return bool(select.select([sys.stdin], [], [], timeout)[0])
+
+    def _read_char(self):
+        char = ""
+        while not char:
+            char = self._decoder.decode(os.read(sys.stdin.fileno(), 1))
+        return char
+
+    def _read_key(self):
+        """Reads a single key press, which might be an escape sequence made up of several characters."""
+        if os.name == 'nt':
+            import readchar
+            return readchar.readkey()
+        char = self._read_char()
+        if char != ESC or not self._ready(ESC_TIMEOUT):
+            return char
+        second = self._read_char()
+        if second not in "[O":
+            return char + second
+        key = char + second
+        while True:
+            nxt = self._read_char()
+            key += nxt
+            if second == 'O' or '\x40' <= nxt <= '\x7e':
+                return key
+
+
+class paused:
+    """Context manager that pauses the active key reader (if there is one), for example while a prompt reads input."""
+
+    def __enter__(self):
+        self.reader = READER
+        if self.reader:
+            self.reader.pause()
+
+    def __exit__(self, *exc):
+        if self.reader:
+            self.reader.resume()
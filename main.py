@@ -1,17 +1,35 @@
-import readchar
-from MainScreen import MainScreen
-from UserSettings import SettingsScreen, load_settings
+import asyncio
+import inspect
+from keyInput import KeyReader
+from terminalRenderer import RENDERER
 
-def main():
-    settings = load_settings()
-    if not settings or settings["ApiKey"] == "enter-key-here":
-        cur_screen = SettingsScreen()
-    else:
-        cur_screen = MainScreen()
-    while cur_screen:
-        key = readchar.readkey()
-        cur_screen = cur_screen.handle_input(key)
+async def main():
+    """Runs the app: keys are read in a background thread and handled one by one by the current screen, while replies stream in as asyncio tasks. Keys that arrive faster than frames can be drawn (like a held arrow key) are all handled in order, but only the frame after the last of them is drawn. To get something on screen as fast as possible, a placeholder is drawn before the screens (and the libraries they need) are imported; The most recent chat then loads in the background, see MainScreen. On the way out, changes the autosaver has not written yet are written, see autoSave."""
+    RENDERER.placeholder("Starting NodeChat...")
+    with KeyReader() as keys:
+        from MainScreen import MainScreen
+        from UserSettings import SettingsScreen, load_settings
+        settings = load_settings()
+        if not settings or settings["ApiKey"] == "enter-key-here":
+            cur_screen = SettingsScreen()
+        else:
+            cur_screen = MainScreen()
+        try:
+            while cur_screen:
+                key = await keys.get()
+                with RENDERER.hold():
+                    cur_screen = cur_screen.handle_input(key)
+                    while cur_screen and not inspect.isawaitable(cur_screen):
+                        key = keys.get_nowait()
+                        if key is None:
+                            break
+                        cur_screen = cur_screen.handle_input(key)
+                if inspect.isawaitable(cur_screen):
+                    cur_screen = await cur_screen
+        finally:
+            import autoSave
+            await asyncio.to_thread(autoSave.close)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+
+from rich.segment import Segment
+
+CODE_THEME = "monokai"
+CACHE_SIZE = 128
+
+
+class RenderCache:
+    """A bounded least-recently-used cache of rendered output. Hits and misses are counted, to help with tuning its size."""
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the cached value for key and marks it as recently used, or None if it isn't cached."""
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """Stores a value, evicting the least recently used entries once the cache is full."""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        """Returns a dictionary with the amount of hits, misses and cached entries, as well as the hit rate."""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.entries),
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+RENDER_CACHE = RenderCache()
+
+
+def cache_key(key, text: str, width: int):
+    """Returns the key rendered markdown is stored under, see CachedMarkdown."""
+    return (key, hash(text), width, CODE_THEME)
+
+
+def render_markdown(console, text: str, options):
+    """Renders markdown text to a list of lines, each a list of segments. rich's markdown module is only imported on first use, as importing it (and pygments) noticeably slows down startup."""
+    from rich.markdown import Markdown
+    return console.render_lines(Markdown(text, code_theme=CODE_THEME), options, pad=False)
+
+
+class RenderedLines:
+    """A renderable made of lines that were rendered before."""
+
+    def __init__(self, lines: list):
+        self.lines = lines
+
+    def __rich_console__(self, console, options):
+        new_line = Segment.line()
+        for line in self.lines:
+            yield from line
+            yield new_line
+
+
+class CachedMarkdown:
+    """A markdown renderable whose output is cached. Parsing and syntax highlighting only happen the first time a text is drawn at a given width; After that the finished lines are reused until they are evicted.
+
+    The cache key holds the caller's key (for example a message ID), a hash of the text, the width and the code theme, so changed text or a resized terminal never get stale output."""
+
+    def __init__(self, key, text: str, cache: RenderCache = RENDER_CACHE):
+        self.key = key
+        self.text = text
+        self.cache = cache
+
+    def __rich_console__(self, console, options):
+        key = cache_key(self.key, self.text, options.max_width)
+        lines = self.cache.get(key)
+        if lines is None:
+            lines = render_markdown(console, self.text, options)
+            self.cache.put(key, lines)
+        yield RenderedLines(lines)
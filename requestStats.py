@@ -0,0 +1,100 @@
+TOTAL_FIELDS = ("requests", "with_usage", "prompt_tokens", "completion_tokens", "cached_tokens", "duration", "first_chunk", "streaming")
+
+
+def _cached_tokens(usage):
+    """Returns how many prompt tokens were served from the provider's prompt cache. DeepSeek reports them as prompt_cache_hit_tokens, OpenAI inside prompt_tokens_details."""
+    hits = getattr(usage, "prompt_cache_hit_tokens", None)
+    if hits is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        hits = getattr(details, "cached_tokens", None) if details else None
+    return hits or 0
+
+
+def make(settings: dict, start: float, first: float, end: float, usage = None, cancelled: bool = False):
+    """Builds the stats stored on a generated message node.
+
+    Args:
+    - settings: The user settings the request was made with.
+    - start: When the request was sent, as a Unix timestamp.
+    - first: When the first text arrived, or None.
+    - end: When the stream ended.
+    - usage: The usage reported at the end of the stream, if any; Cancelled streams don't get one.
+    - cancelled: Whether the user cancelled the stream.
+
+    Returns:
+    A dictionary that can be stored as JSON."""
+    return {
+        'model': settings['Model'],
+        'temperature': settings['Temperature'],
+        'frequency_penalty': settings['FrequencyPenalty'],
+        'presence_penalty': settings['PresencePenalty'],
+        'start': start,
+        'first_chunk': first,
+        'duration': end - start,
+        'prompt_tokens': usage.prompt_tokens if usage else None,
+        'completion_tokens': usage.completion_tokens if usage else None,
+        'cached_tokens': _cached_tokens(usage) if usage else None,
+        'cancelled': cancelled,
+    }
+
+
+def empty():
+    return dict.fromkeys(TOTAL_FIELDS, 0)
+
+
+def add(totals: dict, stats: dict):
+    """Adds the stats of a single request to totals, in place."""
+    totals['requests'] += 1
+    totals['duration'] += stats['duration']
+    if stats['first_chunk'] is not None:
+        totals['first_chunk'] += stats['first_chunk'] - stats['start']
+    if stats['completion_tokens'] is not None:
+        totals['with_usage'] += 1
+        totals['prompt_tokens'] += stats['prompt_tokens']
+        totals['completion_tokens'] += stats['completion_tokens']
+        totals['cached_tokens'] += stats['cached_tokens']
+        if stats['first_chunk'] is not None:
+            totals['streaming'] += stats['start'] + stats['duration'] - stats['first_chunk']
+
+
+def aggregate(nodes):
+    """Sums up the stats of message nodes, per model.
+
+    Returns:
+    A dictionary mapping model names to totals; Nodes without stats are skipped."""
+    per_model = {}
+    for node in nodes:
+        if node.stats:
+            add(per_model.setdefault(node.stats['model'], empty()), node.stats)
+    return per_model
+
+
+def merge(per_model: dict, other: dict):
+    """Adds the per model totals of other to per_model, in place, and returns it."""
+    for model, totals in other.items():
+        target = per_model.setdefault(model, empty())
+        for field in TOTAL_FIELDS:
+            target[field] += totals.get(field, 0)
+    return per_model
+
+
+def total(per_model: dict):
+    """Sums up per model totals into a single one."""
+    totals = empty()
+    for other in per_model.values():
+        for field in TOTAL_FIELDS:
+            totals[field] += other.get(field, 0)
+    return totals
+
+
+def summary(totals: dict):
+    """Derives averages from totals.
+
+    Returns:
+    - The average time to the first chunk, in seconds.
+    - The average completion speed in tokens per second, measured from the first chunk on.
+    - The share of prompt tokens served from the provider's prompt cache."""
+    ttft = totals['first_chunk'] / totals['requests'] if totals['requests'] else 0.0
+    speed = totals['completion_tokens'] / totals['streaming'] if totals['streaming'] else 0.0
+    hit_rate = totals['cached_tokens'] / totals['prompt_tokens'] if totals['prompt_tokens'] else 0.0
+    return ttft, speed, hit_rate
@@ -0,0 +1,250 @@
+import json
+import os
+import heapq
+import re
+import threading
+from bisect import bisect_left
+
+import chatArchive
+import chatCatalog
+import chatJournal
+
+INDEX_NAME = ".search.json"
+LOG_NAME = ".search.log"
+COMPACT_MIN_BYTES = 1 << 20
+COMPACT_RATIO = 0.5
+MAX_RESULTS = 500
+
+_WORD = re.compile(r"\w+")
+
+_indexes = {}
+
+
+def terms(text: str):
+    """Returns the distinct search terms of a text: its words, lower cased."""
+    return set(_WORD.findall(text.lower()))
+
+
+def _entries(nodes):
+    """Returns the index entries of message nodes, as stored in log records: ID, role, time, preview and terms."""
+    return [[node.id, node.role, node.time, chatCatalog.preview(node.content), sorted(terms(node.content))] for node in nodes]
+
+
+class SearchIndex:
+    """A persistent inverted index over the messages of all chats in a directory, stored next to them. Every indexed message is a document: its file, node ID, role, time and a short preview, so results can be listed without opening any chat. Every word maps to a posting list of the documents containing it; Postings are document numbers rather than (file, node ID) pairs, which keeps them small and makes intersecting them cheap.
+
+    On disk, the index is a snapshot plus a log of changes made since: saving a chat only appends the messages it wrote to the log, and the log is folded into the snapshot once it grows too big. Writing to the index does not require reading it, it is only loaded once it is searched. Documents of dropped chats are only blanked out, and left out the next time the snapshot is written.
+
+    Saves and refreshes run in worker threads, so the index is only read or changed while holding its lock; Chats are read without it."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_NAME)
+        self.log_path = os.path.join(directory, LOG_NAME)
+        self.loaded = False
+        self.docs = []
+        self.files = {}
+        self.terms = {}
+        self._sorted = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Reads the snapshot and replays the log. A damaged index is simply rebuilt by the next refresh."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.docs = data['docs']
+            self.files = data['files']
+            self.terms = data['terms']
+        except (OSError, ValueError, KeyError):
+            self.docs, self.files, self.terms = [], {}, {}
+        try:
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError):
+                        continue
+        except OSError:
+            pass
+        self.loaded = True
+
+    def _apply(self, record: dict):
+        """Applies a log record to the index in memory."""
+        name = record['file']
+        if record['op'] == 'drop':
+            self._drop(name)
+            return
+        if record.get('fresh'):
+            self._drop(name)
+        entry = self.files.get(name)
+        if entry is None:
+            # Messages written before the chat was indexed are missing, so let refresh read the whole file.
+            entry = self.files[name] = {'mtime': record['mtime'] if record.get('fresh') else None, 'nodes': {}}
+        elif entry['mtime'] is not None:
+            entry['mtime'] = record['mtime']
+        nodes = entry['nodes']
+        for id, role, time, preview, words in record['nodes']:
+            if id in nodes:
+                continue
+            doc = nodes[id] = len(self.docs)
+            self.docs.append([name, id, role, time, preview])
+            for word in words:
+                postings = self.terms.get(word)
+                if postings is None:
+                    postings = self.terms[word] = []
+                    self._sorted = None
+                postings.append(doc)
+
+    def _drop(self, name: str):
+        entry = self.files.pop(name, None)
+        if entry:
+            for doc in entry['nodes'].values():
+                self.docs[doc] = None
+
+    def _log(self, records: list):
+        """Appends records to the log, and applies them to the index if it is loaded. Folds the log into the snapshot once it got too big."""
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+        if not self.loaded:
+            return
+        for record in records:
+            self._apply(record)
+        self._compact()
+
+    def _compact(self):
+        """Folds the log into the snapshot, if the log is big compared to the snapshot."""
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        if log_size > COMPACT_MIN_BYTES and log_size > COMPACT_RATIO * (os.path.getsize(self.path) if os.path.exists(self.path) else 0):
+            self._store()
+
+    def _pack(self):
+        """Removes blanked out documents, renumbering the others."""
+        if None not in self.docs:
+            return
+        numbers = {}
+        docs = []
+        for doc, entry in enumerate(self.docs):
+            if entry is not None:
+                numbers[doc] = len(docs)
+                docs.append(entry)
+        for entry in self.files.values():
+            entry['nodes'] = {id: numbers[doc] for id, doc in entry['nodes'].items()}
+        terms = {}
+        for word, postings in self.terms.items():
+            postings = [numbers[doc] for doc in postings if doc in numbers]
+            if postings:
+                terms[word] = postings
+        self.docs, self.terms, self._sorted = docs, terms, None
+
+    def _store(self):
+        """Writes the whole index as a new snapshot and empties the log. Like the chat catalog, the files are rewritten in place so the directory's modification time stays the same."""
+        self._pack()
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'docs': self.docs, 'files': self.files, 'terms': self.terms}, ensure_ascii=False, separators=(',', ':')))
+        open(self.log_path, 'w').close()
+
+    def update(self, file: str, added = (), root = None, replaces: str = None, fresh: bool = False):
+        """Indexes the messages a save just wrote.
+
+        Args:
+        - file: Path of the saved chat.
+        - added: The message nodes this save wrote.
+        - root: The root of the saved chat; Needed if fresh is set.
+        - replaces: Optional path of a chat file that was removed by this save, for example a converted legacy chat.
+        - fresh: Whether the file was written from scratch, so all of its messages are indexed again."""
+        records = []
+        if replaces:
+            records.append({'op': 'drop', 'file': os.path.basename(replaces)})
+        nodes = chatCatalog.iter_nodes(root) if fresh else added
+        records.append({'op': 'add', 'file': os.path.basename(file), 'mtime': os.stat(file).st_mtime, 'fresh': fresh, 'nodes': _entries(nodes)})
+        with self._lock:
+            self._log(records)
+
+    def refresh(self):
+        """Loads the index if necessary, and makes sure it matches the directory: chats that were changed outside of this app (or never indexed) are read and indexed again, deleted ones are dropped. Archived chats are indexed as well, under their path inside the archive (see chatArchive.is_archived); Only chats that were archived since the last refresh are decompressed."""
+        with self._lock:
+            if not self.loaded:
+                self.load()
+            known_mtimes = {name: entry['mtime'] for name, entry in self.files.items()}
+        records = []
+        present = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.name.endswith(chatCatalog.CHAT_EXTS):
+                    continue
+                present.add(entry.name)
+                mtime = entry.stat().st_mtime
+                if known_mtimes.get(entry.name) == mtime:
+                    continue
+                try:
+                    root, _ = chatJournal.read_tree(entry.path, track=False)
+                except (OSError, ValueError, KeyError):
+                    continue
+                records.append({'op': 'add', 'file': entry.name, 'mtime': mtime, 'fresh': True, 'nodes': _entries(chatCatalog.iter_nodes(root))})
+        archive = chatArchive.get_archive(self.directory)
+        try:
+            archived = archive.load()
+        except (OSError, ValueError):
+            archived = {}
+        for name, entry in archived.items():
+            file = os.path.join(chatArchive.PACK_NAME, name)
+            present.add(file)
+            mtime = entry['meta']['mtime']
+            if known_mtimes.get(file) == mtime:
+                continue
+            try:
+                root, _ = chatArchive.read_tree(os.path.join(archive.path, name))
+            except (OSError, ValueError, KeyError):
+                continue
+            records.append({'op': 'add', 'file': file, 'mtime': mtime, 'fresh': True, 'nodes': _entries(chatCatalog.iter_nodes(root))})
+        with self._lock:
+            records += [{'op': 'drop', 'file': name} for name in self.files if name not in present]
+            if records:
+                self._log(records)
+            else:
+                self._compact()
+
+    def _matching(self, word: str):
+        """Returns the documents containing a term starting with word, as a set of document numbers."""
+        if self._sorted is None:
+            self._sorted = sorted(self.terms)
+        found = set()
+        i = bisect_left(self._sorted, word)
+        while i < len(self._sorted) and self._sorted[i].startswith(word):
+            found.update(self.terms[self._sorted[i]])
+            i += 1
+        return found
+
+    def search(self, query: str, limit: int = MAX_RESULTS):
+        """Finds the messages containing every word of query. Words match the beginning of words, so results show up while a word is still being typed.
+
+        Args:
+        - query: The words to search for, case does not matter.
+        - limit: The maximum number of results returned.
+
+        Returns:
+        - The matches, as tuples of (file name, node ID, role, time, preview); Messages of the most recently changed chats come first, and within a chat the newest messages.
+        - The total number of matches."""
+        words = sorted(set(_WORD.findall(query.lower())), key=len, reverse=True)
+        if not words:
+            return [], 0
+        with self._lock:
+            matches = self._matching(words[0])
+            for word in words[1:]:
+                if not matches:
+                    break
+                matches &= self._matching(word)
+            docs = [self.docs[doc] for doc in matches if self.docs[doc] is not None]
+            files = self.files
+            best = heapq.nlargest(limit, docs, key=lambda doc: (files[doc[0]]['mtime'] or 0, doc[3]))
+        return [tuple(doc) for doc in best], len(docs)
+
+
+def get_index(directory: str):
+    """Returns the search index of a chat directory. It is not read from disk until it is refreshed."""
+    index = _indexes.get(directory)
+    if index is None:
+        index = _indexes[directory] = SearchIndex(directory)
+    return index
@@ -0,0 +1,93 @@
+from rich.console import Console
+
+from renderCache import RenderedLines, render_markdown
+
+FENCES = ("```", "~~~")
+
+
+def _split_blocks(text: str):
+    """Splits markdown text after its last finished block. A block is finished once a blank line follows it outside of a code fence; Only whole lines are considered.
+
+    Returns:
+    - The finished blocks, as a list of strings.
+    - The unfinished rest of the text."""
+    blocks = []
+    start = 0
+    pos = 0
+    in_fence = False
+    while True:
+        end = text.find("\n", pos)
+        if end == -1:
+            break
+        line = text[pos:end].strip()
+        if line.startswith(FENCES):
+            in_fence = not in_fence
+        elif not line and not in_fence:
+            if text[start:pos].strip():
+                blocks.append(text[start:pos])
+            start = end + 1
+        pos = end + 1
+    return blocks, text[start:]
+
+
+class StreamRenderer:
+    """Renders a reply as markdown while it streams in. Chunks are collected in a list and only rendered when a frame is drawn, which happens at a fixed rate rather than once per chunk. Finished markdown blocks are rendered once and kept; Only the trailing, unfinished block is rendered again on every frame."""
+
+    def __init__(self, console: Console):
+        self.console = console
+        self.chunks = []
+        self.words = 0
+        self._in_word = False
+        self.lines = []
+        self.dirty = False
+        self._tail = []
+        self._tail_lines = []
+
+    def feed(self, text: str):
+        """Adds a chunk of the reply, and counts its words; A word split between chunks is counted once. Nothing is rendered until the next flush."""
+        self.chunks.append(text)
+        words = len(text.split())
+        if words and self._in_word and not text[0].isspace():
+            words -= 1
+        if text:
+            self._in_word = not text[-1].isspace()
+        self.words += words
+        self._tail.append(text)
+        self.dirty = True
+
+    def flush(self, final: bool = False):
+        """Renders the reply's current state: newly finished blocks are rendered for good, the unfinished one replaces its previous version.
+
+        Args:
+        final: Whether the reply is complete; Then the remaining text is treated as a finished block."""
+        tail = "".join(self._tail)
+        blocks, rest = _split_blocks(tail)
+        if final:
+            if rest.strip():
+                blocks.append(rest)
+            rest = ""
+        self._tail = [rest] if rest else []
+
+        options = self.console.options
+        for block in blocks:
+            self.lines.extend(self._separated(render_markdown(self.console, block, options)))
+        self._tail_lines = self._separated(render_markdown(self.console, rest, options)) if rest.strip() else []
+        self.dirty = False
+
+    def _separated(self, lines: list):
+        """Puts a blank line in front of a block's lines if it follows another block, unless the block starts with one itself."""
+        if self.lines and lines and lines[0]:
+            return [[]] + lines
+        return lines
+
+    def renderable(self):
+        """Returns the reply rendered so far, as a renderable. Call flush first to bring it up to date."""
+        return RenderedLines(self.lines + self._tail_lines)
+
+    def finish(self):
+        """Renders the completed reply.
+
+        Returns:
+        The full reply text."""
+        self.flush(final=True)
+        return "".join(self.chunks)
@@ -0,0 +1,101 @@
+import sys
+from contextlib import contextmanager
+
+CLEAR = "\033[2J\033[3J\033[H"
+
+
+class FrameRenderer:
+    """Draws screens into the terminal. The previous frame is kept as a list of lines, and a new frame only rewrites the lines that changed, using ANSI cursor movement. Nothing is cleared or reprinted as a whole, so there is no flicker, and no shell is started.
+
+    Frames are cut to the terminal's height (keeping the bottom part), so every line has a fixed row. Whenever something else writes to the terminal (a prompt, a streamed reply), invalidate must be called, and the next frame is drawn in full.
+
+    While drawing is held (see hold), frames are not drawn but only remembered, and the last one is drawn once the hold ends; So a burst of key presses only costs a single frame."""
+
+    def __init__(self):
+        self.lines = None
+        self.size = None
+        self.pending = None
+        self._holds = 0
+
+    def invalidate(self):
+        """Forgets the previous frame, so the next one gets drawn from scratch."""
+        self.lines = None
+
+    @contextmanager
+    def hold(self):
+        """Context manager during which frames are only remembered, not drawn. On the way out, the last of them is drawn."""
+        self._holds += 1
+        try:
+            yield self
+        finally:
+            self._holds -= 1
+            if not self._holds:
+                self.flush()
+
+    def flush(self):
+        """Draws the frame remembered while drawing was held, if there is one, even if drawing is still held. Used before something else writes to the terminal, like a prompt, so it shows up below the current frame."""
+        if self.pending:
+            console, renderables = self.pending
+            self.pending = None
+            self._draw(console, renderables)
+
+    def clear(self, file = None):
+        """Clears the terminal, including its scrollback, and forgets the previous frame (and one that was held back)."""
+        self.pending = None
+        file = file or sys.stdout
+        file.write(CLEAR)
+        file.flush()
+        self.invalidate()
+
+    def placeholder(self, text: str, file = None):
+        """Clears the terminal and shows a line of plain text. This doesn't need rich, so it can be drawn before rich (or anything else slow) is imported."""
+        self.pending = None
+        file = file or sys.stdout
+        file.write(CLEAR + text + "\n")
+        file.flush()
+        self.invalidate()
+
+    def draw(self, console: "Console", renderables: list):
+        """Draws a frame made up of renderables, top to bottom.
+
+        Args:
+        console: The console used for rendering and output.
+        renderables: Everything the frame holds, top to bottom."""
+        if self._holds:
+            self.pending = (console, renderables)
+            return
+        self.pending = None
+        self._draw(console, renderables)
+
+    def _draw(self, console: "Console", renderables: list):
+        if console.legacy_windows:
+            console.clear()
+            for renderable in renderables:
+                console.print(renderable)
+            self.invalidate()
+            return
+
+        with console.capture() as capture:
+            for renderable in renderables:
+                console.print(renderable)
+        lines = capture.get().split("\n")[:-1]
+        size = console.size
+        if len(lines) >= size.height:
+            lines = lines[len(lines) - size.height + 1:]
+
+        out = []
+        if self.lines is None or self.size != size:
+            out.append(CLEAR)
+            out.extend(line + "\033[0m\n" for line in lines)
+        else:
+            for row, line in enumerate(lines):
+                if row >= len(self.lines) or self.lines[row] != line:
+                    out.append(f"\033[{row + 1};1H{line}\033[0m\033[K")
+            out.append(f"\033[{len(lines) + 1};1H\033[J")
+        console.file.write("".join(out))
+        console.file.flush()
+        self.lines = lines
+        self.size = size
+
+
+RENDERER = FrameRenderer()
@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversationTree import Msg_Node, TreeIndex
+
+TIME = "2025-01-01 12:00:00"
+
+
+@pytest.fixture
+def chat():
+    """A small chat with a branch: a system prompt, a question, two alternative answers, and a follow-up question on the second one.
+
+    Returns:
+    - The chat's TreeIndex.
+    - Its nodes, by name."""
+    tree = TreeIndex()
+    nodes = {}
+
+    def add(name, prev, role, content):
+        nodes[name] = Msg_Node(prev, role, content, TIME, prev.depth + 1 if prev else 0)
+        tree.add(nodes[name])
+        return nodes[name]
+
+    add("system", None, "system", "You are a helpful assistant.")
+    add("question", nodes["system"], "user", "What is a tree?")
+    add("first", nodes["question"], "assistant", "A plant.")
+    add("second", nodes["question"], "assistant", "A data structure.")
+    add("followup", nodes["second"], "user", "Which kind?")
+    return tree, nodes
+
+
+def branch(node):
+    """Returns the texts from the root to node."""
+    texts = []
+    while node:
+        node.ensure_loaded()
+        texts.append(node.content)
+        node = node.prev
+    return texts[::-1]
+
+
+def shape(root):
+    """Returns a tree as nested (id, role, content, pinned, children) tuples, reading placeholders as needed."""
+    root.ensure_loaded()
+    return (root.id, root.role, root.content, root.pinned, tuple(shape(child) for child in root.next))
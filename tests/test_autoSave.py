@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+import autoSave
+import chatJournal
+from conftest import TIME, branch, shape
+from conversationTree import Msg_Node
+
+import MainScreen  # NewChat and MainScreen import each other, MainScreen has to come first.
+import NewChat
+
+
+@pytest.fixture
+def recovery(tmp_path, monkeypatch):
+    """Points the autosaver of this session at a temporary recovery directory."""
+    directory = str(tmp_path / "recovery")
+    monkeypatch.setattr(autoSave, "RECOVERY_PATH", directory)
+    monkeypatch.setattr(autoSave, "_autosaver", None)
+    return directory
+
+
+def _left_behind(directory, tree, cur, file):
+    """Autosaves a chat the way a session that crashed afterwards would have. Returns the scratch file."""
+    saver = autoSave.AutoSaver(directory)
+    saver.path = os.path.join(directory, f"2025-01-01_12-00-00-{2 ** 31 - 1}{autoSave.SCRATCH_EXT}")
+    saver._save((tree, cur, file))
+    return saver.path
+
+
+def test_new_chats_are_recovered(recovery, chat):
+    tree, nodes = chat
+    nodes["first"].pinned = True
+    path = _left_behind(recovery, tree, nodes["followup"], None)
+
+    assert autoSave.unsaved() == [(path, autoSave.read(path)[0])]
+    cur, messages, file, recovered = NewChat.recover(path)
+    assert file is None
+    assert cur.id == nodes["followup"].id
+    assert [message['content'] for message in messages] == branch(nodes["followup"])
+    assert shape(recovered.root) == shape(tree.root)
+    assert os.listdir(recovery) == [os.path.basename(autoSave.get_autosaver().path)]
+
+
+def test_unsaved_messages_and_pins_are_recovered(tmp_path, recovery, chat):
+    tree, nodes = chat
+    file = str(tmp_path / "chat.jsonl")
+    chatJournal.create(file).append(tree.root, nodes["followup"])
+    answer = Msg_Node(nodes["followup"], "assistant", "A rooted one.", TIME, 4)
+    tree.add(answer)
+    nodes["question"].pinned = True
+    path = _left_behind(recovery, tree, answer, file)
+
+    header, records = autoSave.read(path)
+    assert header['file'] == file and header['messages'] == 2
+    assert [record['op'] for record in records] == ['node', 'pin', 'cur']
+    chatJournal.forget(file)
+    cur, messages, _, recovered = NewChat.recover(path)
+    assert cur.id == answer.id
+    assert messages[-1]['content'] == "A rooted one."
+    assert shape(recovered.root) == shape(tree.root)
+
+
+def test_nothing_unsaved_removes_the_scratch_file(tmp_path, recovery, chat):
+    tree, nodes = chat
+    file = str(tmp_path / "chat.jsonl")
+    path = _left_behind(recovery, tree, nodes["followup"], None)
+    chatJournal.create(file).append(tree.root, nodes["followup"])
+
+    saver = autoSave.AutoSaver(recovery)
+    saver.path = path
+    saver._save((tree, nodes["followup"], file))
+    assert not os.path.exists(path)
+
+
+def test_running_sessions_keep_their_scratch_files(recovery, chat):
+    tree, nodes = chat
+    path = _left_behind(recovery, tree, nodes["followup"], None)
+    live = autoSave.AutoSaver(recovery)
+    live.path = os.path.join(recovery, f"2025-01-01_12-00-00-{os.getppid()}{autoSave.SCRATCH_EXT}")
+    live._save((tree, nodes["followup"], None))
+
+    assert autoSave._running(os.path.basename(live.path))
+    assert not autoSave._running(os.path.basename(path))
+    assert [path for path, _ in autoSave.unsaved()] == [path]
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+import chatArchive
+import chatJournal
+from conftest import shape
+
+
+def _save(tmp_path, tree, cur, name="chat.jsonl"):
+    path = str(tmp_path / name)
+    chatJournal.create(path).append(tree.root, cur)
+    return path
+
+
+def test_archive_and_unarchive(tmp_path, chat):
+    tree, nodes = chat
+    path = _save(tmp_path, tree, nodes["followup"])
+    _save(tmp_path, tree, nodes["first"], "other.jsonl")
+    with open(path, 'rb') as f:
+        data = f.read()
+    os.utime(path, (1e9, 1e9))
+
+    chatArchive.archive(path)
+    packed = os.path.join(str(tmp_path), chatArchive.PACK_NAME, "chat.jsonl")
+    assert not os.path.exists(path) and not os.path.exists(path + chatJournal.INDEX_EXT)
+    assert chatArchive.is_archived(packed) and chatArchive.exists(packed)
+    assert chatArchive.locate(path) == packed
+    root, cur = chatArchive.read_tree(packed)
+    assert shape(root) == shape(tree.root)
+    assert cur.id == nodes["followup"].id
+
+    chatArchive._archives.clear()
+    assert chatArchive.unarchive(packed) == path
+    with open(path, 'rb') as f:
+        assert f.read() == data
+    assert os.path.getmtime(path) == 1e9
+    assert not chatArchive.exists(packed)
+    assert chatArchive.locate(packed) == path
+    with pytest.raises(FileNotFoundError):
+        chatArchive.get_archive(str(tmp_path)).read("chat.jsonl")
+
+
+def test_archive_inactive_keeps_recent_and_excluded_chats(tmp_path, chat):
+    tree, nodes = chat
+    paths = [_save(tmp_path, tree, nodes["followup"], f"chat{i}.jsonl") for i in range(4)]
+    for i, path in enumerate(paths):
+        os.utime(path, (1e9 + i, 1e9 + i))
+
+    assert chatArchive.archive_inactive(str(tmp_path), 1, exclude=(paths[0],)) == 2
+    assert [os.path.exists(path) for path in paths] == [True, False, False, True]
+    archive = chatArchive.get_archive(str(tmp_path))
+    assert archive.ordered() == ["chat2.jsonl", "chat1.jsonl"]
+    path, meta = archive.extract("chat1.jsonl")
+    assert path == paths[1] and meta['mtime'] == 1e9 + 1
+    _save(tmp_path, tree, nodes["first"], "chat2.jsonl")
+    with pytest.raises(FileExistsError):
+        archive.extract("chat2.jsonl")
+
+
+def test_corrupt_pack_raises(tmp_path):
+    with open(tmp_path / chatArchive.PACK_NAME, 'wb') as f:
+        f.write(b"not a pack, but long enough for a header")
+
+    with pytest.raises(ValueError):
+        chatArchive.get_archive(str(tmp_path)).load()
+
+
+def test_archived_chat_without_messages_raises(tmp_path):
+    path = str(tmp_path / "empty.jsonl")
+    open(path, 'w').close()
+    chatArchive.get_archive(str(tmp_path)).add([(path, {'mtime': 0})])
+
+    with pytest.raises(ValueError):
+        chatArchive.read_tree(os.path.join(str(tmp_path), chatArchive.PACK_NAME, "empty.jsonl"))
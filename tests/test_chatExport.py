@@ -0,0 +1,65 @@
+import json
+import os
+
+import chatArchive
+import chatExport
+import chatJournal
+from conftest import branch
+
+
+def _save(tmp_path, tree, cur, name):
+    path = str(tmp_path / name)
+    chatJournal.create(path).append(tree.root, cur)
+    return path
+
+
+def _export(files, mode, workers=0):
+    errors = []
+    records = [json.loads(line) for line in chatExport.export(files, mode, workers, errors)]
+    return records, errors
+
+
+def test_modes(tmp_path, chat):
+    tree, nodes = chat
+    path = _save(tmp_path, tree, nodes["followup"], "chat.jsonl")
+    texts = lambda messages: [message['content'] for message in messages]
+
+    paths, _ = _export([path], "paths")
+    assert [record['id'] for record in paths] == [nodes["first"].id, nodes["followup"].id]
+    assert texts(paths[1]['messages']) == branch(nodes["followup"])
+
+    current, _ = _export([path], "current")
+    assert current == [paths[1]]
+
+    pairs, _ = _export([path], "pairs")
+    assert len(pairs) == 1
+    assert pairs[0]['id'] == nodes["question"].id
+    assert texts(pairs[0]['prompt']) == branch(nodes["question"])
+    assert pairs[0]['chosen']['content'] == "A data structure."
+    assert pairs[0]['rejected']['content'] == "A plant."
+
+
+def test_archived_and_broken_chats(tmp_path, chat):
+    tree, nodes = chat
+    paths = [_save(tmp_path, tree, nodes["first"], f"chat{i}.jsonl") for i in range(3)]
+    chatArchive.archive(paths[1])
+    with open(paths[2], 'w') as f:
+        f.write("")
+    files = chatExport.chat_files(str(tmp_path))
+    assert files == [paths[0], os.path.join(str(tmp_path), chatArchive.PACK_NAME, "chat1.jsonl"), paths[2]]
+
+    for workers in (0, 2):
+        records, errors = _export(files, "current", workers)
+        assert [record['chat'] for record in records] == ["chat0.jsonl", "chat1.jsonl"]
+        assert [path for path, _ in errors] == [paths[2]]
+        assert errors[0][1].startswith("ValueError")
+
+
+def test_unreadable_archives_are_skipped(tmp_path, chat, capsys):
+    tree, nodes = chat
+    path = _save(tmp_path, tree, nodes["first"], "chat.jsonl")
+    with open(tmp_path / chatArchive.PACK_NAME, 'wb') as f:
+        f.write(b"not a pack, but long enough for a header")
+
+    assert chatExport.chat_files(str(tmp_path)) == [path]
+    assert "Skipped" in capsys.readouterr().err
@@ -0,0 +1,190 @@
+import json
+import os
+
+import pytest
+
+import chatJournal
+from conftest import TIME, branch, shape
+from conversationTree import Msg_Node, TreeIndex
+
+
+def _save(tmp_path, tree, cur, name="chat.jsonl"):
+    path = str(tmp_path / name)
+    chatJournal.create(path).append(tree.root, cur)
+    return path
+
+
+def test_append_and_load_round_trip(tmp_path, chat):
+    tree, nodes = chat
+    nodes["second"].stats = {'model': "m", 'duration': 1.5}
+    path = _save(tmp_path, tree, nodes["followup"])
+    expected = shape(tree.root)
+    chatJournal.forget(path)
+
+    root, cur = chatJournal.load(path, track=False)
+    assert shape(root) == expected
+    assert cur.id == nodes["followup"].id
+    assert root.next[0].next[1].stats == {'model': "m", 'duration': 1.5}
+    assert [node.index for node in root.next[0].next] == [1, 2]
+
+
+def test_append_only_writes_new_nodes(tmp_path, chat):
+    tree, nodes = chat
+    path = _save(tmp_path, tree, nodes["followup"])
+    journal = chatJournal.get_journal(path)
+    answer = Msg_Node(nodes["followup"], "assistant", "A rooted one.", TIME, 4)
+    tree.add(answer)
+
+    assert journal.append(tree.root, answer) == [answer]
+    assert journal.append(tree.root, answer) == []
+    with open(path, 'rb') as f:
+        ops = [json.loads(line)['op'] for line in f]
+    assert ops.count('node') == 6
+    assert ops[-1] == 'cur'
+
+
+def test_current_message_changes_are_appended(tmp_path, chat):
+    tree, nodes = chat
+    path = _save(tmp_path, tree, nodes["followup"])
+    chatJournal.get_journal(path).append(tree.root, nodes["first"])
+    chatJournal.forget(path)
+
+    assert chatJournal.load(path, track=False)[1].id == nodes["first"].id
+
+
+def test_lazy_load_reads_other_branches_on_demand(tmp_path, chat):
+    tree, nodes = chat
+    path = _save(tmp_path, tree, nodes["followup"])
+    expected = shape(tree.root)
+    chatJournal.forget(path)
+
+    index = TreeIndex()
+    root, cur = chatJournal.load_lazy(path, index=index)
+    assert branch(cur) == branch(nodes["followup"])
+    placeholder = root.next[0].next[0]
+    assert placeholder.source is not None and placeholder.content is None
+    assert index.get(nodes["first"].id).content == "A plant."
+    assert placeholder.source is None
+    assert shape(root) == expected
+
+
+def test_lazy_load_needs_a_matching_index(tmp_path, chat):
+    tree, nodes = chat
+    path = _save(tmp_path, tree, nodes["followup"])
+    chatJournal.forget(path)
+    with open(path, 'ab') as f:
+        f.write(b'{"op":"cur","id":"x"}\n')
+
+    assert chatJournal.load_lazy(path) is None
+
+
+def test_index_is_rebuilt_when_missing(tmp_path, chat):
+    tree, nodes = chat
+    path = _save(tmp_path, tree, nodes["followup"])
+    chatJournal.forget(path)
+    os.remove(path + chatJournal.INDEX_EXT)
+
+    journal = chatJournal.get_journal(path)
+    assert set(journal.written) == {node.id for node in nodes.values()}
+    assert os.path.exists(path + chatJournal.INDEX_EXT)
+    chatJournal.forget(path)
+    assert chatJournal.load_lazy(path) is not None
+
+
+def test_compaction_keeps_the_tree(tmp_path, chat):
+    tree, nodes = chat
+    path = _save(tmp_path, tree, nodes["followup"])
+    journal = chatJournal.get_journal(path)
+    for node in ("first", "second", "followup") * 5:
+        journal.append(tree.root, nodes[node])
+    size = os.path.getsize(path)
+    expected = shape(tree.root)
+
+    journal.compact()
+    assert os.path.getsize(path) < size
+    assert journal.records == len(nodes) + 1
+    chatJournal.forget(path)
+    root, cur = chatJournal.load(path, track=False)
+    assert shape(root) == expected
+    assert cur.id == nodes["followup"].id
+    chatJournal.forget(path)
+    assert shape(chatJournal.load_lazy(path)[0]) == expected
+
+
+def test_pins_survive_saving_and_compaction(tmp_path, chat):
+    tree, nodes = chat
+    nodes["question"].pinned = True
+    path = _save(tmp_path, tree, nodes["followup"])
+    journal = chatJournal.get_journal(path)
+    nodes["question"].pinned = False
+    nodes["first"].pinned = True
+    assert journal.append(tree.root, nodes["followup"]) == []
+    expected = shape(tree.root)
+
+    for load in (lambda: chatJournal.load(path, track=False)[0], lambda: chatJournal.load_lazy(path)[0]):
+        chatJournal.forget(path)
+        assert shape(load()) == expected
+    journal.compact()
+    chatJournal.forget(path)
+    assert shape(chatJournal.load_lazy(path)[0]) == expected
+
+
+def test_torn_last_record_is_skipped(tmp_path, chat):
+    tree, nodes = chat
+    path = _save(tmp_path, tree, nodes["followup"])
+    journal = chatJournal.get_journal(path)
+    answer = Msg_Node(nodes["followup"], "assistant", "A rooted one.", TIME, 4)
+    tree.add(answer)
+    journal.append(tree.root, answer)
+    chatJournal.forget(path)
+    with open(path, 'rb+') as f:
+        lines = f.readlines()
+        f.truncate(sum(map(len, lines[:-2])) + len(lines[-2]) // 2)
+
+    root, cur = chatJournal.load(path)
+    assert cur.id == nodes["followup"].id
+    assert answer.id not in chatJournal.get_journal(path).written
+    assert not cur.next
+
+
+def test_appending_after_a_torn_record(tmp_path, chat):
+    tree, nodes = chat
+    path = _save(tmp_path, tree, nodes["second"])
+    chatJournal.forget(path)
+    with open(path, 'ab') as f:
+        f.write(b'{"op":"node","id":"torn","pr')
+
+    root, cur = chatJournal.load(path)
+    answer = Msg_Node(cur.next[0], "assistant", "A rooted one.", TIME, 4)
+    chatJournal.get_journal(path).append(root, answer)
+    chatJournal.forget(path)
+    root, cur = chatJournal.load(path, track=False)
+    assert cur.id == answer.id
+    assert branch(cur) == branch(nodes["followup"]) + ["A rooted one."]
+
+
+def test_journal_without_messages_raises(tmp_path):
+    path = str(tmp_path / "empty.jsonl")
+    open(path, 'w').close()
+    with pytest.raises(ValueError):
+        chatJournal.load(path, track=False)
+    with open(path, 'w') as f:
+        f.write('{"op":"node","id":"1","prev":null')
+    with pytest.raises(ValueError):
+        chatJournal.read_tree(path, track=False)
+
+
+def test_legacy_chats_load(tmp_path, chat):
+    tree, nodes = chat
+    nodes["first"].pinned = True
+    path = str(tmp_path / "chat.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(tree.root.serialize(nodes["first"]), f)
+
+    root, cur = chatJournal.read_tree(path)
+    assert shape(root) == shape(tree.root)
+    assert cur.id == nodes["first"].id
+    with open(path, 'rb') as f:
+        assert shape(chatJournal.parse_legacy(f.read())[0]) == shape(tree.root)
+    with pytest.raises(ValueError):
+        chatJournal.parse_legacy(b'{"cur_id": null, "messages": null}')
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import chatJournal
+import contentStore
+from conftest import TIME, branch, shape
+from conversationTree import Msg_Node
+
+PARAGRAPH = " ".join(f"Sentence number {i} of a long answer about trees." for i in range(20))
+
+
+def _edit(tree, node, text):
+    edited = Msg_Node(node.prev, node.role, contentStore.delta(node, text), TIME, node.depth)
+    tree.add(edited)
+    return edited
+
+
+def test_small_edits_are_kept_as_deltas():
+    base = Msg_Node(None, "assistant", PARAGRAPH, TIME, 0)
+    text = PARAGRAPH.replace("number 7", "number seven")
+    edit = contentStore.delta(base, text)
+    assert isinstance(edit, contentStore.Delta)
+    assert edit.text() == text
+
+    assert contentStore.delta(base, "A short rewrite.") == "A short rewrite."
+    rewrite = " ".join(reversed(PARAGRAPH.split()))
+    assert contentStore.delta(base, rewrite) == rewrite
+
+
+def test_deltas_load_from_journals(tmp_path, chat):
+    tree, nodes = chat
+    nodes["first"].content = PARAGRAPH
+    edit = _edit(tree, nodes["first"], PARAGRAPH.replace("number 3", "number three"))
+    edit_of_edit = _edit(tree, edit, edit.content + " The end.")
+    assert isinstance(edit_of_edit._content, contentStore.Delta)
+    path = str(tmp_path / "chat.jsonl")
+    chatJournal.create(path).append(tree.root, edit_of_edit)
+    expected = shape(tree.root)
+    with open(path, 'rb') as f:
+        assert sum('delta' in json.loads(line) for line in f) == 2
+
+    for load in (lambda: chatJournal.load(path, track=False), lambda: chatJournal.load_lazy(path)):
+        chatJournal.forget(path)
+        root, cur = load()
+        assert branch(cur)[-1] == edit_of_edit.content
+        assert shape(root) == expected
+    chatJournal.get_journal(path).compact()
+    chatJournal.forget(path)
+    assert shape(chatJournal.load(path, track=False)[0]) == expected
+
+
+def test_long_system_prompts_are_shared(tmp_path, chat):
+    tree, nodes = chat
+    nodes["system"].content = PARAGRAPH
+    paths = [str(tmp_path / f"chat{i}.jsonl") for i in range(2)]
+    for path in paths:
+        chatJournal.create(path).append(tree.root, nodes["followup"])
+        with open(path, 'rb') as f:
+            assert json.loads(f.readline())['ref'] == contentStore.digest(PARAGRAPH)
+    with open(tmp_path / contentStore.STORE_NAME, 'rb') as f:
+        assert len(f.readlines()) == 1
+
+    contentStore._stores.clear()
+    for path in paths:
+        chatJournal.forget(path)
+        assert branch(chatJournal.load(path, track=False)[1])[0] == PARAGRAPH
+
+
+def test_missing_texts_raise(tmp_path, chat):
+    tree, nodes = chat
+    nodes["system"].content = PARAGRAPH
+    path = str(tmp_path / "chat.jsonl")
+    chatJournal.create(path).append(tree.root, nodes["followup"])
+    chatJournal.forget(path)
+    (tmp_path / contentStore.STORE_NAME).unlink()
+    contentStore._stores.clear()
+
+    with pytest.raises(ValueError):
+        chatJournal.load(path, track=False)
+    with pytest.raises(ValueError):
+        contentStore.get_store(str(tmp_path)).get("0" * 32)
@@ -0,0 +1,88 @@
+import io
+import json
+
+import pytest
+
+import chatJournal
+from conftest import TIME, branch, shape
+from conversationTree import Msg_Node, TreeIndex, _iter_events, stream_deserialize
+
+DEPTH = 5000
+
+
+def _chain(depth):
+    """Returns a single branch of depth messages, with a second answer next to the first one."""
+    tree = TreeIndex()
+    node = Msg_Node(None, "system", "You are a helpful assistant.", TIME, 0)
+    tree.add(node)
+    root = node
+    for i in range(1, depth):
+        node = Msg_Node(node, "user" if i % 2 else "assistant", f"Message {i}", TIME, i)
+        tree.add(node)
+    tree.add(Msg_Node(root, "user", "Another start.", TIME, 1))
+    return root, node
+
+
+def _build(events):
+    """Assembles the value the events of _iter_events describe."""
+    stack, keys = [[]], []
+    for event, value in events:
+        if event == 'key':
+            keys.append(value)
+            continue
+        if event in ('start_map', 'start_array'):
+            stack.append({} if event == 'start_map' else [])
+            continue
+        if event in ('end_map', 'end_array'):
+            value = stack.pop()
+        parent = stack[-1]
+        if isinstance(parent, dict):
+            parent[keys.pop()] = value
+        else:
+            parent.append(value)
+    return stack[0][0]
+
+
+def test_deep_chats_round_trip():
+    root, cur = _chain(DEPTH)
+    text = "".join(root.iter_serialize(cur))
+
+    loaded, loaded_cur = stream_deserialize(io.StringIO(text))
+    assert loaded_cur.id == cur.id and loaded_cur.depth == DEPTH - 1
+    assert branch(loaded_cur) == branch(cur)
+    assert [child.content for child in loaded.next] == ["Message 1", "Another start."]
+
+    loaded, loaded_cur = chatJournal.parse_legacy(text.encode('utf-8'), root.id)
+    assert loaded_cur is loaded
+    assert branch(loaded.next[0].next[0]) == branch(cur)[:3]
+
+
+def test_streamed_json_matches_serialize(chat):
+    tree, nodes = chat
+    nodes["second"].pinned = True
+    nodes["second"].stats = {'model': "m", 'duration': 1.5}
+    text = "".join(tree.root.iter_serialize(nodes["followup"]))
+    assert json.loads(text) == tree.root.serialize(nodes["followup"])
+
+    root, cur = stream_deserialize(io.StringIO(text))
+    assert shape(root) == shape(tree.root)
+    assert cur.id == nodes["followup"].id
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64])
+def test_tokenizer_matches_json(chunk_size):
+    value = {
+        "text": "quotes \" and \\ backslashes, \n newlines, é and 🌳 " + "long " * 100,
+        "numbers": [0, -1, 2.5, 1e-3, -0.25E+2, 12345678901234567890],
+        "literals": [True, False, None],
+        "nested": {"empty": {}, "list": [[], [{}], [[1, 2], "x"]]},
+        "": "",
+    }
+    for text in (json.dumps(value), json.dumps(value, ensure_ascii=False, indent=2)):
+        assert _build(_iter_events(io.StringIO(text), chunk_size)) == value
+
+
+@pytest.mark.parametrize("text", ["", "   ", "[]", '{"cur_id": null, "messages": null}'])
+def test_files_without_chats_raise(text):
+    with pytest.raises(ValueError):
+        stream_deserialize(io.StringIO(text))
@@ -0,0 +1,63 @@
+import io
+
+from rich.console import Console
+from rich.text import Text
+
+from terminalRenderer import CLEAR, FrameRenderer
+
+
+def _console(height=10):
+    return Console(file=io.StringIO(), width=40, height=height, color_system=None)
+
+
+def _written(console):
+    text = console.file.getvalue()
+    console.file.seek(0)
+    console.file.truncate()
+    return text
+
+
+def _frame(*lines):
+    return [Text(line) for line in lines]
+
+
+def test_only_changed_lines_are_redrawn():
+    console, renderer = _console(), FrameRenderer()
+    renderer.draw(console, _frame("one", "two", "three"))
+    assert _written(console) == CLEAR + "one\033[0m\ntwo\033[0m\nthree\033[0m\n"
+
+    renderer.draw(console, _frame("one", "TWO", "three"))
+    assert _written(console) == "\033[2;1HTWO\033[0m\033[K\033[4;1H\033[J"
+
+    renderer.draw(console, _frame("one"))
+    assert _written(console) == "\033[2;1H\033[J"
+
+
+def test_frames_start_over_when_invalidated_or_resized():
+    console, renderer = _console(), FrameRenderer()
+    renderer.draw(console, _frame("one"))
+    renderer.invalidate()
+    _written(console)
+    renderer.draw(console, _frame("one"))
+    assert _written(console).startswith(CLEAR)
+
+    resized = _console(height=5)
+    renderer.draw(resized, _frame("one"))
+    assert _written(resized).startswith(CLEAR)
+
+
+def test_frames_keep_their_bottom_part():
+    console, renderer = _console(height=3), FrameRenderer()
+    renderer.draw(console, _frame("1", "2", "3", "4"))
+    assert _written(console) == CLEAR + "3\033[0m\n4\033[0m\n"
+
+
+def test_held_frames_are_drawn_once():
+    console, renderer = _console(), FrameRenderer()
+    renderer.draw(console, _frame("one"))
+    _written(console)
+    with renderer.hold():
+        for i in range(5):
+            renderer.draw(console, _frame("one", str(i)))
+        assert _written(console) == ""
+    assert _written(console) == "\033[2;1H4\033[0m\033[K\033[3;1H\033[J"